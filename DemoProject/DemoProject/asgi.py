@@ -14,3 +14,9 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'DemoProject.settings')
 
 application = get_asgi_application()
+
+if os.environ.get('DJANGO_WARMUP') == '1':
+    # Load templates and process caches before the first request; connections
+    # opened here would be shared by forked workers, so they are closed again
+    from mainApp.warmup import warm_up
+    warm_up(close_connections=True)
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'mainApp.routers.ReplicaPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -48,6 +50,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'mainApp.throttling.ThrottleMiddleware',
+    'mainApp.profiling.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'DemoProject.urls'
@@ -87,6 +91,92 @@ DATABASES = {
     }
 }
 
+# Read-only queries are spread over these aliases; writes always go to 'default'.
+# Add replica connections to DATABASES and list their aliases here.
+DATABASE_REPLICAS = []
+
+# Local development without MySQL: DJANGO_LOCAL_SQLITE=1 uses SQLite, with a second,
+# read-only connection to the same file standing in for a zero-lag read replica,
+# so a write routed to the replica fails as it would on a real one.
+# Transactions take the write lock up front and wait for it, as MySQL's row
+# locks would, and tests use a file so that threads can share it.
+if os.environ.get('DJANGO_LOCAL_SQLITE'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'OPTIONS': {'transaction_mode': 'IMMEDIATE', 'timeout': 20},
+            'TEST': {'NAME': BASE_DIR / 'test-db.sqlite3'},
+        },
+        'replica': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'OPTIONS': {'init_command': 'PRAGMA query_only = ON'},
+            'TEST': {'MIRROR': 'default'},
+        },
+    }
+    DATABASE_REPLICAS = ['replica']
+
+DATABASE_ROUTERS = ['mainApp.routers.PrimaryReplicaRouter']
+
+# After a request that wrote, the same client reads from the primary for this many seconds
+REPLICA_PIN_SECONDS = 5
+REPLICA_PIN_COOKIE = 'pin_primary'
+
+
+# Caches
+# Both file-based caches are shared by every worker on the host without an
+# outside service. 'default' holds what can be rebuilt (pages, PNR status,
+# idempotent responses) and culls a random third once MAX_ENTRIES is reached.
+# 'coordination' holds what must not vanish at random: locks, the tatkal
+# queue, live event numbers and version numbers; it never culls and stays
+# small because its entries are per schedule or short-lived. 'local' is
+# private to each process and fronts 'default' for the hottest entries (see
+# mainApp.cache_tier). Locks and counters need atomic add() and incr(): keep
+# both shared caches on mainApp.cache_backends.LockingFileBasedCache, Redis or
+# Memcached (with eviction off for 'coordination'). Entries are pickles, so the
+# directory must only be writable by the site's own user; DJANGO_CACHE_DIR moves it.
+
+CACHE_DIR = os.environ.get('DJANGO_CACHE_DIR', str(BASE_DIR / 'cache'))
+
+CACHES = {
+    'default': {
+        'BACKEND': 'mainApp.cache_backends.LockingFileBasedCache',
+        'LOCATION': CACHE_DIR,
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
+    'coordination': {
+        'BACKEND': 'mainApp.cache_backends.LockingFileBasedCache',
+        'LOCATION': os.path.join(CACHE_DIR, 'coordination'),
+        'OPTIONS': {'MAX_ENTRIES': 0},  # Never cull
+    },
+    # Throttle counters: one entry per client or account name tried, so a bot
+    # cycling names only culls its own counters here
+    'throttle': {
+        'BACKEND': 'mainApp.cache_backends.LockingFileBasedCache',
+        'LOCATION': os.path.join(CACHE_DIR, 'throttle'),
+        'OPTIONS': {'MAX_ENTRIES': 50000},
+    },
+    'local': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'demoproject-local',
+        'OPTIONS': {'MAX_ENTRIES': 2000},
+    },
+}
+
+# Availability and schedule search go through mainApp.cache_tier: one request
+# rebuilds an expiring entry while the others get the stale value (kept
+# CACHE_TIER_STALE_SECONDS) or wait; CACHE_TIER_BETA scales early expiry.
+CACHE_TIER_SHARED = 'default'
+CACHE_TIER_LOCAL = 'local'
+CACHE_TIER_LOCAL_SECONDS = 2
+CACHE_TIER_STALE_SECONDS = 60
+CACHE_TIER_LOCK_SECONDS = 30
+CACHE_TIER_WAIT_SECONDS = 5
+CACHE_TIER_POLL_SECONDS = 0.05
+CACHE_TIER_BETA = 1.0
+SCHEDULE_SEARCH_CACHE_SECONDS = 60
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -133,3 +223,146 @@ MEDIA_ROOT = '/home/lolit/Documents/Code/Python/LearnDjango/DemoProject/media/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Tatkal booking window
+# Tatkal opens at TATKAL_OPEN_TIME (local time) on the day before the journey.
+# Users wait in a virtual queue and are admitted to book_ticket in arrival order
+# at TATKAL_ADMIT_RATE bookings per second.
+TATKAL_OPEN_TIME = '10:00'
+TATKAL_ADMIT_RATE = 20
+TATKAL_ADMIT_BURST = 50
+TATKAL_ADMISSION_TTL = 600  # seconds an admitted user has to finish booking
+TATKAL_QUEUE_TTL = 60 * 60 * 24
+
+# Schedule cards in schedule_list.html are cached per schedule and inventory
+# version; bookings and cancellations bump the version of their schedule.
+SCHEDULE_CARD_CACHE_SECONDS = 60 * 60
+
+# The flexible-dates availability calendar is cached per train for this long
+AVAILABILITY_CALENDAR_CACHE_SECONDS = 30
+AVAILABILITY_CALENDAR_MAX_DAYS = 60
+
+# Seat counters of upcoming schedules are mirrored in a memory-mapped file
+# shared by the workers on a host (POSIX only); sync_shared_inventory
+# rebuilds it for schedules up to SHARED_INVENTORY_DAYS ahead. Keep the file
+# where only the site's own user can write to it.
+SHARED_INVENTORY_ENABLED = True
+SHARED_INVENTORY_PATH = os.environ.get('DJANGO_SHARED_INVENTORY_PATH', str(BASE_DIR / 'run' / 'seat-inventory.bin'))
+SHARED_INVENTORY_SLOTS = 1 << 16  # (schedule, class) entries; 2 MiB of file
+SHARED_INVENTORY_DAYS = 120
+
+# Station/train autocomplete indexes live in each process and check the shared
+# cache for changes at most this often
+AUTOCOMPLETE_VERSION_CHECK_SECONDS = 5
+AUTOCOMPLETE_MAX_RESULTS = 10
+
+# Payments are charged in background threads through PAYMENT_GATEWAY. The fake
+# gateway sleeps PAYMENT_GATEWAY_LATENCY seconds and fails this share of charges.
+PAYMENT_GATEWAY = 'mainApp.payments.FakeGateway'
+PAYMENT_GATEWAY_LATENCY = 1.5
+PAYMENT_GATEWAY_FAILURE_RATE = 0.1
+PAYMENT_WORKERS = 4
+# Shared with the gateway only. Callbacks are refused while it is unset.
+PAYMENT_CALLBACK_SECRET = os.environ.get('DJANGO_PAYMENT_CALLBACK_SECRET', '')
+# Seconds before reconcile_payments settles a pending payment and cancels
+# tickets left unpaid (or whose last payment failed), releasing their seats
+PAYMENT_PENDING_TIMEOUT = 15 * 60
+
+# Cancelling a whole train run (cancel_train_run, admin action) updates tickets,
+# passengers and payments this many tickets per transaction
+RUN_CANCELLATION_BATCH_SIZE = 500
+
+# Responses to booking/cancellation POSTs are kept per idempotency key and
+# replayed to retries; a concurrent retry waits up to IDEMPOTENCY_WAIT_SECONDS.
+IDEMPOTENCY_KEY_TTL = 5 * 60
+IDEMPOTENCY_LOCK_SECONDS = 30
+IDEMPOTENCY_WAIT_SECONDS = 10
+
+# consume_outbox keeps looking for an event id it skipped (its transaction
+# was still committing) this long before taking it as rolled back
+OUTBOX_GAP_SECONDS = 5 * 60
+
+# Flexi fares: (occupancy up to, fare multiplier) for each band of a class.
+# Quoted fares are held in the session for PRICE_LOCK_SECONDS per journey and class.
+PRICING_BANDS = [
+    (0.5, '1.00'),
+    (0.7, '1.10'),
+    (0.85, '1.25'),
+    (1.0, '1.40'),
+]
+PRICE_LOCK_SECONDS = 10 * 60
+
+# PNR status entries are rewritten on every ticket change; the timeout only
+# bounds how long tickets nobody looks at stay in the cache
+PNR_STATUS_CACHE_SECONDS = 60 * 60 * 24
+# Unknown PNRs are remembered this long, so repeated guesses cost no queries
+PNR_NOT_FOUND_CACHE_SECONDS = 60
+
+# Sliding-window limits per URL name; scope is 'ip', 'user' or a POST field
+# naming the account. Rules are checked in order and the first one exceeded
+# answers 429 before the view runs, so list 'ip' before account scopes.
+THROTTLE_CACHE = 'throttle'
+THROTTLE_RULES = {
+    'login_user': [
+        {'scope': 'ip', 'limit': 20, 'window': 60},
+        {'scope': 'username', 'limit': 5, 'window': 300},
+    ],
+    'register_user': [
+        {'scope': 'ip', 'limit': 5, 'window': 300},
+    ],
+    'check_pnr_status': [
+        {'scope': 'ip', 'limit': 30, 'window': 60},
+        {'scope': 'user', 'limit': 30, 'window': 60},
+    ],
+}
+
+# Opt-in request profiling: sample this share of requests, or staff requests
+# sending PROFILING_HEADER, and write collapsed stacks per URL name
+PROFILING_ENABLED = False
+PROFILING_SAMPLE_RATE = 0.01
+PROFILING_HEADER = 'X-Profile'
+PROFILING_INTERVAL = 0.005  # seconds between stack samples
+PROFILING_DIR = BASE_DIR / 'profiles'
+
+# Rail network data (stations, trains, coaches, routes, fares) is cached in
+# each process and checked for changes at most this often
+TOPOLOGY_VERSION_CHECK_SECONDS = 5
+
+# Running status feed (ingest_running_status): updates are coalesced per run
+# and written every RUNNING_STATUS_FLUSH_SECONDS or RUNNING_STATUS_BATCH_SIZE runs
+RUNNING_STATUS_FLUSH_SECONDS = 1
+RUNNING_STATUS_BATCH_SIZE = 500
+
+# Server-Sent Events: events are kept in the shared cache for LIVE_EVENT_TTL
+# seconds and each process polls for new ones every LIVE_POLL_SECONDS. Under
+# WSGI a stream holds a worker, so it closes after LIVE_WSGI_STREAM_SECONDS.
+LIVE_EVENT_TTL = 5 * 60
+LIVE_POLL_SECONDS = 0.5
+LIVE_MAX_BACKLOG = 1000  # events read per poll at most
+LIVE_GAP_SECONDS = 1  # how long to wait for an event that is numbered but not written yet
+LIVE_QUEUE_SIZE = 100
+LIVE_KEEPALIVE_SECONDS = 15
+LIVE_RETRY_MILLISECONDS = 3000
+LIVE_WSGI_STREAM_SECONDS = 60
+LIVE_MAX_SCHEDULES = 50
+
+# Booking pages get per-coach availability changes at most once per tick,
+# published by a thread in each process; without it (tests) changes are
+# published at once, in the request that made them
+SEAT_UPDATES_TICK_SECONDS = 1
+SEAT_UPDATES_BACKGROUND = True
+
+# import_timetable reads files row by row and upserts this many rows per transaction
+TIMETABLE_IMPORT_CHUNK_SIZE = 5000
+
+# Templates compiled and rendered once by the warmup command / DJANGO_WARMUP=1
+WARMUP_TEMPLATES = [
+    'mainApp/home.html',
+    'mainApp/login_page.html',
+    'mainApp/select_destinations.html',
+    'mainApp/schedule_list.html',
+    'mainApp/book_ticket.html',
+    'mainApp/ticket_detail.html',
+    'mainApp/check_pnr.html',
+    'mainApp/pay_ticket.html',
+]
@@ -1,3 +1,77 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.db.models import Sum
+
+from .cancellation import cancel_run
+from .models import OutboxEvent, RevenueRollup, TrainSchedule
 
 # Register your models here.
+
+
+class ReadOnlyAdmin(admin.ModelAdmin):
+    """Rows are written by the outbox consumer only"""
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(RevenueRollup)
+class RevenueRollupAdmin(ReadOnlyAdmin):
+    list_display = [
+        'journey_date', 'train', 'seat_class', 'seats', 'passengers', 'cancelled_passengers',
+        'occupancy_display', 'net_revenue',
+    ]
+    list_filter = ['seat_class', 'journey_date']
+    date_hierarchy = 'journey_date'
+    search_fields = ['train__train_number', 'train__name']
+    list_select_related = ['train']
+
+    @admin.display(description='Occupancy')
+    def occupancy_display(self, obj):
+        return f'{obj.occupancy:.0%}' if obj.occupancy is not None else '-'
+
+    def changelist_view(self, request, extra_context=None):
+        response = super().changelist_view(request, extra_context)
+        changelist = getattr(response, 'context_data', {}).get('cl')
+        if changelist is not None:
+            # Totals over every filtered row, not just the current page
+            response.context_data['totals'] = changelist.queryset.aggregate(
+                seats=Sum('seats'),
+                passengers=Sum('passengers'),
+                cancelled=Sum('cancelled_passengers'),
+                revenue=Sum('revenue'),
+                refunded=Sum('cancelled_revenue'),
+            )
+        return response
+
+
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(ReadOnlyAdmin):
+    list_display = ['id', 'event_type', 'pnr', 'schedule_id', 'created_at']
+    list_filter = ['event_type']
+    search_fields = ['pnr']
+
+
+@admin.register(TrainSchedule)
+class TrainScheduleAdmin(admin.ModelAdmin):
+    list_display = ['journey_date', 'train', 'status', 'delay_minutes', 'base_fare']
+    list_filter = ['status', 'journey_date']
+    date_hierarchy = 'journey_date'
+    search_fields = ['train__train_number', 'train__name']
+    list_select_related = ['train']
+    actions = ['cancel_runs']
+
+    @admin.action(description='Cancel selected runs with all their tickets', permissions=['change'])
+    def cancel_runs(self, request, queryset):
+        for schedule in queryset.select_related('train'):
+            totals = cancel_run(schedule, reason=f'run cancelled by {request.user.username}')
+            self.message_user(
+                request,
+                f"{schedule}: cancelled {totals['tickets']} tickets and {totals['passengers']} passengers, "
+                f"{totals['refunds']} refunds queued",
+                messages.SUCCESS,
+            )
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class MainappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'mainApp'
+
+    def ready(self):
+        from . import autocomplete, inventory, pricing, topology
+        autocomplete.connect_signals()
+        inventory.connect_signals()
+        pricing.connect_signals()
+        topology.connect_signals()
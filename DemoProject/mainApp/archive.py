@@ -0,0 +1,69 @@
+"""Moving finished journeys out of the hot booking tables"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import pnr_status
+from .models import (
+    Ticket, Passenger, Payment, WaitingList,
+    ArchivedTicket, ArchivedPassenger, ArchivedPayment
+)
+
+TICKET_FIELDS = [
+    'id', 'pnr', 'schedule_id', 'passenger_name', 'email', 'seat_class', 'source_station_id',
+    'destination_station_id', 'booking_status', 'booking_date', 'total_fare',
+]
+PASSENGER_FIELDS = [
+    'id', 'ticket_id', 'name', 'age', 'gender', 'seat_class', 'fare', 'coach_id',
+    'seat_number', 'berth_type', 'current_status',
+]
+PAYMENT_FIELDS = [
+    'id', 'ticket_id', 'transaction_id', 'amount', 'payment_method', 'payment_date',
+    'status', 'gateway_response',
+]
+
+
+def archivable_tickets(older_than_days=0):
+    """Tickets whose journey is completed or lies in the past, and whose payment is settled"""
+    cutoff = timezone.now().date() - timedelta(days=older_than_days)
+    return Ticket.objects.filter(
+        Q(schedule__status='COMPLETED') | Q(schedule__journey_date__lt=cutoff)
+    ).exclude(payment__status__in=['PENDING', 'REFUND_PENDING'])
+
+
+def archive_batch(ticket_ids):
+    """Copy one batch of tickets with their passengers and payments to the archive, then delete them"""
+    with transaction.atomic():
+        ArchivedTicket.objects.bulk_create([
+            ArchivedTicket(**row) for row in Ticket.objects.filter(id__in=ticket_ids).values(*TICKET_FIELDS)
+        ])
+        ArchivedPassenger.objects.bulk_create([
+            ArchivedPassenger(**row)
+            for row in Passenger.objects.filter(ticket_id__in=ticket_ids).values(*PASSENGER_FIELDS)
+        ])
+        ArchivedPayment.objects.bulk_create([
+            ArchivedPayment(**row) for row in Payment.objects.filter(ticket_id__in=ticket_ids).values(*PAYMENT_FIELDS)
+        ])
+
+        # Delete children first so the ORM does not have to collect cascades row by row
+        WaitingList.objects.filter(passenger__ticket_id__in=ticket_ids).delete()
+        Payment.objects.filter(ticket_id__in=ticket_ids).delete()
+        Passenger.objects.filter(ticket_id__in=ticket_ids).delete()
+        pnrs = list(Ticket.objects.filter(id__in=ticket_ids).values_list('pnr', flat=True))
+        Ticket.objects.filter(id__in=ticket_ids).delete()
+        # Cached statuses still say the tickets are live
+        transaction.on_commit(lambda: pnr_status.forget(*pnrs))
+
+
+def archive_journeys(batch_size=500, older_than_days=0):
+    """Archive every archivable ticket in batches; yields the number archived per batch"""
+    queryset = archivable_tickets(older_than_days).order_by('id')
+    while True:
+        ticket_ids = list(queryset.values_list('id', flat=True)[:batch_size])
+        if not ticket_ids:
+            return
+        archive_batch(ticket_ids)
+        yield len(ticket_ids)
+
@@ -0,0 +1,131 @@
+"""In-memory prefix indexes for station and train autocomplete"""
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+
+from .cache_backends import coordination
+from .fragments import _fresh_version
+from .models import Station, Train
+
+
+class PrefixIndex:
+    """Sorted array of (term, id) pairs searched with bisect.
+
+    Every entity is indexed under its full code/number, its full name and
+    city, and each word of its name, so "cen" finds "Mumbai Central".
+    """
+
+    def __init__(self, entries):
+        # entries: iterable of (id, label, [searchable strings])
+        self.labels = {}
+        terms = set()
+        for entity_id, label, fields in entries:
+            self.labels[entity_id] = label
+            for field in fields:
+                field = (field or '').lower().strip()
+                if not field:
+                    continue
+                terms.add((field, entity_id))
+                for word in field.split()[1:]:
+                    terms.add((word, entity_id))
+        self.terms = sorted(terms)
+
+    def search(self, prefix, limit=10):
+        """Return up to `limit` (id, label) pairs with a term starting with prefix"""
+        prefix = prefix.lower().strip()
+        if not prefix:
+            return []
+        results = []
+        seen = set()
+        position = bisect_left(self.terms, (prefix,))
+        while position < len(self.terms) and len(results) < limit:
+            term, entity_id = self.terms[position]
+            if not term.startswith(prefix):
+                break
+            if entity_id not in seen:
+                seen.add(entity_id)
+                results.append((entity_id, self.labels[entity_id]))
+            position += 1
+        return results
+
+    def label(self, entity_id):
+        return self.labels.get(entity_id)
+
+
+def build_station_index():
+    return PrefixIndex(
+        (station_id, f'{code} - {name}', [code, name, city])
+        for station_id, code, name, city in Station.objects.values_list('id', 'code', 'name', 'city')
+    )
+
+
+def build_train_index():
+    return PrefixIndex(
+        (train_id, f'{number} - {name}', [number, name])
+        for train_id, number, name in Train.objects.values_list('id', 'train_number', 'name')
+    )
+
+
+BUILDERS = {
+    'stations': build_station_index,
+    'trains': build_train_index,
+}
+
+# Per-process state: kind -> (index, version it was built from)
+_indexes = {}
+_last_version_check = {}
+
+
+def _version_key(kind):
+    return f'autocomplete_version:{kind}'
+
+
+def get_index(kind):
+    """Return the index for 'stations' or 'trains', rebuilding it if the data changed.
+
+    Changes are announced through a version number in the shared cache; each
+    process looks at it at most every AUTOCOMPLETE_VERSION_CHECK_SECONDS, so
+    lookups stay pure in-memory work.
+    """
+    now = time.monotonic()
+    built = _indexes.get(kind)
+    if built is not None and now - _last_version_check.get(kind, 0) < settings.AUTOCOMPLETE_VERSION_CHECK_SECONDS:
+        return built[0]
+
+    _last_version_check[kind] = now
+    version = coordination.get(_version_key(kind), 0)
+    if built is None or built[1] != version:
+        built = (BUILDERS[kind](), version)
+        _indexes[kind] = built
+    return built[0]
+
+
+def invalidate(kind):
+    """Mark an index stale in this process and every other one"""
+    try:
+        coordination.incr(_version_key(kind))
+    except ValueError:
+        # Not 1: an index built before the key was lost may carry that version
+        coordination.set(_version_key(kind), _fresh_version(), timeout=None)
+    _indexes.pop(kind, None)
+
+
+def _station_changed(sender, **kwargs):
+    invalidate('stations')
+
+
+def _train_changed(sender, **kwargs):
+    invalidate('trains')
+
+
+def connect_signals():
+    """Rebuild the indexes whenever a station or train is saved or deleted.
+
+    Bulk operations do not send signals; call invalidate() after them.
+    """
+    post_save.connect(_station_changed, sender=Station, dispatch_uid='autocomplete_station_saved')
+    post_delete.connect(_station_changed, sender=Station, dispatch_uid='autocomplete_station_deleted')
+    post_save.connect(_train_changed, sender=Train, dispatch_uid='autocomplete_train_saved')
+    post_delete.connect(_train_changed, sender=Train, dispatch_uid='autocomplete_train_deleted')
@@ -0,0 +1,91 @@
+"""File-based cache whose add() and incr() are atomic across workers.
+
+Django's FileBasedCache implements add() and incr() as a read followed by a
+write, so two processes can both win the same add() or read the same counter
+value. Locks, idempotency keys, admissions and event sequence numbers all
+rely on those two calls, so here they run under an exclusive flock() on a
+lock file picked by the key's hash. flock() locks belong to the open file
+rather than the process, which keeps threads of one worker apart as well.
+
+MAX_ENTRIES = 0 turns culling off, for the 'coordination' cache whose
+entries must never be dropped at random.
+
+POSIX only. Deployments with Redis or Memcached can use Django's backends for
+them instead; both have atomic add() and incr().
+"""
+import fcntl
+import os
+import pickle
+import tempfile
+import time
+import zlib
+from contextlib import contextmanager
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.files.move import file_move_safe
+from django.utils.connection import ConnectionProxy
+
+# Locks, counters, queue state and version numbers (see CACHES in settings)
+coordination = ConnectionProxy(caches, 'coordination')
+
+
+class LockingFileBasedCache(FileBasedCache):
+
+    @contextmanager
+    def _locked(self, fname):
+        """Exclusive lock shared by all keys whose file name starts with the same two hex digits"""
+        self._createdir()
+        fd = os.open(os.path.join(self._dir, f'lock-{os.path.basename(fname)[:2]}'), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)  # Releases the lock
+
+    def _cull(self):
+        # Without a limit there is nothing to count, so skip listing the directory
+        if self._max_entries:
+            super()._cull()
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        with self._locked(self._key_to_file(key, version)):
+            return super().add(key, value, timeout, version)
+
+    def incr(self, key, delta=1, version=None):
+        fname = self._key_to_file(key, version)
+        with self._locked(fname):
+            try:
+                with open(fname, 'rb') as f:
+                    expiry = pickle.load(f)
+                    value = pickle.loads(zlib.decompress(f.read()))
+            except (FileNotFoundError, EOFError):
+                expiry = value = None
+            if value is None or (expiry is not None and expiry < time.time()):
+                raise ValueError(f"Key '{key}' not found")
+            value += delta
+            # Keep the entry's expiry; BaseCache.incr() would reset it to the default timeout
+            fd, tmp_path = tempfile.mkstemp(dir=self._dir)
+            with open(fd, 'wb') as f:
+                f.write(pickle.dumps(expiry, self.pickle_protocol))
+                f.write(zlib.compress(pickle.dumps(value, self.pickle_protocol)))
+            file_move_safe(tmp_path, fname, allow_overwrite=True)
+        return value
+
+    def _is_expired(self, f):
+        try:
+            expiry = pickle.load(f)
+        except EOFError:
+            expiry = 0
+        if expiry is None or expiry >= time.time():
+            return False
+        # Remove only the file that was read: a locked add() may have replaced it since
+        try:
+            same_file = os.stat(f.name).st_ino == os.fstat(f.fileno()).st_ino
+        except FileNotFoundError:
+            same_file = False
+        f.close()
+        if same_file:
+            self._delete(f.name)
+        return True
@@ -0,0 +1,92 @@
+"""Two-level cache for expensive booking-domain reads, with stampede protection.
+
+Entries live in the shared cache (CACHE_TIER_SHARED, file-based so every
+worker on the host sees them) and for a few seconds in the process's own
+local-memory cache (CACHE_TIER_LOCAL). Each entry records when it goes stale
+and how long it took to compute, which allows two things:
+
+- Probabilistic early expiry (XFetch): a reader recomputes before expiry
+  with a probability that grows as expiry nears and with the compute time,
+  so a hot key is usually refreshed by one request before it expires.
+- Single flight: only the request holding the key's rebuild lock
+  recomputes. Everyone else gets the stale value, which is kept
+  CACHE_TIER_STALE_SECONDS past expiry, or waits up to
+  CACHE_TIER_WAIT_SECONDS for the new one.
+"""
+import math
+import random
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+def _shared():
+    return caches[settings.CACHE_TIER_SHARED]
+
+
+def _local():
+    return caches[settings.CACHE_TIER_LOCAL]
+
+
+def _lock_key(key):
+    return f'{key}:rebuild'
+
+
+def _fresh(entry, beta, now):
+    """False once the entry expired, or (randomly) when it is about to"""
+    _, expires_at, compute_seconds = entry
+    # log() of a uniform (0, 1] draw is <= 0, so this looks ahead of now
+    return now - compute_seconds * beta * math.log(1 - random.random()) < expires_at
+
+
+def _store(key, value, timeout, compute_seconds):
+    entry = (value, time.time() + timeout, compute_seconds)
+    _shared().set(key, entry, timeout=timeout + settings.CACHE_TIER_STALE_SECONDS)
+    _local().set(key, entry, timeout=min(timeout, settings.CACHE_TIER_LOCAL_SECONDS))
+    return entry
+
+
+def _compute(key, compute, timeout):
+    started = time.monotonic()
+    value = compute()
+    _store(key, value, timeout, time.monotonic() - started)
+    return value
+
+
+def get_or_compute(key, compute, timeout, beta=None):
+    """Cached value of key, calling compute() to (re)build it at most once at a time"""
+    beta = settings.CACHE_TIER_BETA if beta is None else beta
+    now = time.time()
+    entry = _local().get(key)
+    if entry is None or not _fresh(entry, beta, now):
+        entry = _shared().get(key)
+        if entry is not None:
+            _local().set(key, entry, timeout=settings.CACHE_TIER_LOCAL_SECONDS)
+    if entry is not None and _fresh(entry, beta, now):
+        return entry[0]
+
+    lock_key = _lock_key(key)
+    if _shared().add(lock_key, 1, timeout=settings.CACHE_TIER_LOCK_SECONDS):
+        try:
+            return _compute(key, compute, timeout)
+        finally:
+            _shared().delete(lock_key)
+
+    # Someone else is rebuilding: serve what we have, or wait for theirs
+    if entry is not None:
+        return entry[0]
+    deadline = time.monotonic() + settings.CACHE_TIER_WAIT_SECONDS
+    while time.monotonic() < deadline:
+        time.sleep(settings.CACHE_TIER_POLL_SECONDS)
+        entry = _shared().get(key)
+        if entry is not None:
+            return entry[0]
+    # The rebuild is slow or its process died; do not fail the request
+    return _compute(key, compute, timeout)
+
+
+def delete(key):
+    """Drop an entry; other processes may serve their local copy for CACHE_TIER_LOCAL_SECONDS"""
+    _shared().delete(key)
+    _local().delete(key)
@@ -0,0 +1,148 @@
+"""Cancelling tickets: one at a time, unpaid ones whose hold expired, and whole train runs with set-based updates"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import cache_tier, fragments, inventory, outbox, payments, pnr_status
+from .models import OutboxEvent, Passenger, Payment, Ticket, TrainSchedule
+
+
+def cancel_ticket(ticket, unpaid_only=False):
+    """Cancel a ticket, give its seats back and refund a successful payment.
+
+    Returns False when the ticket was cancelled already, or with unpaid_only
+    when it has a payment that is pending or succeeded in the meantime.
+    """
+    with transaction.atomic():
+        # Lock the ticket so a concurrent cancellation cannot release the seats twice
+        ticket = Ticket.objects.select_for_update().get(pk=ticket.pk)
+        if ticket.booking_status == 'CANCELLED':
+            return False
+        payment = Payment.objects.select_for_update().filter(ticket=ticket).first()
+        if unpaid_only and (ticket.booking_status != 'PENDING' or (
+                payment is not None and payment.status != 'FAILED')):
+            return False
+        ticket.booking_status = 'CANCELLED'
+        ticket.save(update_fields=['booking_status'])
+
+        inventory.release_passengers(ticket.schedule, ticket.passengers.all())
+        outbox.record_cancellation(
+            ticket, ticket.passengers.filter(current_status__in=inventory.BOOKED_STATUSES)
+        )
+        ticket.passengers.all().update(current_status='CANCELLED')
+        if payment is not None and payment.status == 'SUCCESS':
+            payment.status = 'REFUND_PENDING'
+            payment.save(update_fields=['status'])
+            payments.queue_refunds([(payment.transaction_id, payment.amount)])
+        pnr_status.refresh_on_commit(ticket.pnr)
+    return True
+
+
+def expire_unpaid(batch_size=100):
+    """Cancel PENDING tickets not paid within PAYMENT_PENDING_TIMEOUT, releasing their seats.
+
+    That is tickets without a payment booked before the cutoff, and tickets
+    whose last payment attempt, started before the cutoff, failed. Returns
+    how many were cancelled.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.PAYMENT_PENDING_TIMEOUT)
+    unpaid = Ticket.objects.filter(booking_status='PENDING').filter(
+        Q(payment__isnull=True, booking_date__lt=cutoff)
+        | Q(payment__status='FAILED', payment__payment_date__lt=cutoff)
+    ).order_by('id')
+    cancelled = 0
+    last_id = 0
+    while True:
+        batch = list(unpaid.filter(id__gt=last_id)[:batch_size])
+        if not batch:
+            return cancelled
+        # Each ticket is checked again under its lock: it may have been paid meanwhile
+        cancelled += sum(cancel_ticket(ticket, unpaid_only=True) for ticket in batch)
+        last_id = batch[-1].id
+
+
+def cancel_batch(schedule, ticket_ids, reason='', release=False):
+    """Cancel one batch of a run's tickets; returns (tickets, passengers, refunds) cancelled.
+
+    Seats are only given back with release=True: in its first sweep
+    cancel_run() cancels without them and recounts the run's inventory once.
+    """
+    with transaction.atomic():
+        # Lock the batch so cancel_ticket cannot cancel (and release) the same tickets meanwhile
+        tickets = dict(
+            Ticket.objects.select_for_update().filter(id__in=ticket_ids)
+            .exclude(booking_status='CANCELLED').values_list('id', 'pnr')
+        )
+        if not tickets:
+            return 0, 0, 0
+
+        booked = defaultdict(list)
+        for ticket_id, seat_class, fare in Passenger.objects.filter(
+            ticket_id__in=tickets, current_status__in=inventory.BOOKED_STATUSES
+        ).values_list('ticket_id', 'seat_class', 'fare'):
+            booked[ticket_id].append({'seat_class': seat_class, 'fare': str(fare)})
+        refunds = list(Payment.objects.filter(ticket_id__in=tickets, status='SUCCESS').values_list(
+            'id', 'transaction_id', 'amount'
+        ))
+
+        if release:
+            inventory.release_passengers(schedule, Passenger.objects.filter(ticket_id__in=tickets))
+        passengers = Passenger.objects.filter(ticket_id__in=tickets).exclude(
+            current_status='CANCELLED'
+        ).update(current_status='CANCELLED')
+        Ticket.objects.filter(id__in=tickets).update(booking_status='CANCELLED')
+        Payment.objects.filter(id__in=[payment_id for payment_id, _, _ in refunds]).update(status='REFUND_PENDING')
+        # The gateway pays them back after commit; PAYMENT_REFUNDED is recorded once it has
+        payments.queue_refunds([(transaction_id, amount) for _, transaction_id, amount in refunds])
+
+        # Same events cancel_ticket writes
+        OutboxEvent.objects.bulk_create([
+            OutboxEvent(
+                event_type='TICKET_CANCELLED', pnr=pnr, schedule_id=schedule.id,
+                payload={'passengers': booked.get(ticket_id, []), 'reason': reason},
+            )
+            for ticket_id, pnr in tickets.items()
+        ])
+
+        pnrs = list(tickets.values())
+        transaction.on_commit(lambda: pnr_status.forget(*pnrs))
+    return len(tickets), passengers, len(refunds)
+
+
+def cancel_run(schedule, batch_size=None, reason=''):
+    """Cancel a run with every ticket and passenger on it.
+
+    Safe to run again: only tickets that are not cancelled yet are touched.
+    Returns {'tickets', 'passengers', 'refunds'}.
+    """
+    batch_size = batch_size or settings.RUN_CANCELLATION_BATCH_SIZE
+    with transaction.atomic():
+        TrainSchedule.objects.select_for_update().filter(pk=schedule.pk).update(status='CANCELLED')
+    schedule.status = 'CANCELLED'
+
+    totals = {'tickets': 0, 'passengers': 0, 'refunds': 0}
+    queryset = Ticket.objects.filter(schedule=schedule).exclude(booking_status='CANCELLED').order_by('id')
+
+    def sweep(release):
+        while True:
+            ticket_ids = list(queryset.values_list('id', flat=True)[:batch_size])
+            if not ticket_ids:
+                return
+            counts = cancel_batch(schedule, ticket_ids, reason, release)
+            for name, count in zip(['tickets', 'passengers', 'refunds'], counts):
+                totals[name] += count
+
+    sweep(release=False)
+    # Usually 0 everywhere now. Bookings that were already past their status
+    # check when the run was cancelled may have committed since the first
+    # sweep: the recount keeps their seats, and the second sweep releases them.
+    inventory.recount(schedule)
+    sweep(release=True)
+
+    for key in fragments.schedule_search_keys(schedule):
+        cache_tier.delete(key)
+    return totals
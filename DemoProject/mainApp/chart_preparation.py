@@ -0,0 +1,305 @@
+"""Batch seat optimization run when a schedule's chart is prepared.
+
+Seats are handed out greedily one passenger at a time while booking is
+open, so berth preferences are lost once a berth type fills up and members
+of one PNR end up in different coaches. Chart preparation re-seats every
+confirmed and RAC passenger of a schedule's paid (CONFIRMED) tickets in
+one pass:
+
+1. Each PNR is placed whole into one coach of its class (largest PNRs
+   first), choosing the coach where most of its members' preferences can
+   still be met and, on ties, the tightest fit.
+2. Within each coach, passengers are matched to berth types with a
+   min-cost flow: an unmet explicit preference costs 2, a senior citizen
+   without a preference off a lower berth costs 1.
+3. Seat numbers are handed out per berth type in PNR order, so members of
+   a PNR get consecutive numbers.
+4. Passengers for whom no coach of the class has a berth left become RAC,
+   as many as the class has side lower berths to share, and the rest go
+   to the waiting list; either way they lose their seat. Placed RAC
+   passengers are confirmed.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+
+from . import pnr_status, seat_updates
+from .fragments import bump_inventory_version
+from .models import Coach, Passenger, Ticket
+
+BERTH_TYPES = ['LOWER', 'MIDDLE', 'UPPER', 'SIDE_LOWER', 'SIDE_UPPER']
+BERTH_CODES = {
+    'LOWER': 'L',
+    'MIDDLE': 'M',
+    'UPPER': 'U',
+    'SIDE_LOWER': 'SL',
+    'SIDE_UPPER': 'SU',
+}
+CHARTED_STATUSES = ['CONFIRMED', 'RAC']
+SENIOR_AGE = 60
+
+UNMET_PREFERENCE_COST = 2
+SENIOR_NOT_LOWER_COST = 1
+
+
+def coach_capacity(coach):
+    """Berths of each type in a coach"""
+    return {
+        'LOWER': coach.total_lower,
+        'MIDDLE': coach.total_middle,
+        'UPPER': coach.total_upper,
+        'SIDE_LOWER': coach.total_side_lower,
+        'SIDE_UPPER': coach.total_side_upper,
+    }
+
+
+def wanted_berth(passenger):
+    """Berth type a passenger would like: their preference, or lower for senior citizens"""
+    if passenger.berth_preference:
+        return passenger.berth_preference
+    if passenger.age >= SENIOR_AGE:
+        return 'LOWER'
+    return None
+
+
+def berth_cost(category, berth_type):
+    """Cost of seating a passenger of a preference category on a berth type"""
+    kind, wanted = category
+    if wanted is None or wanted == berth_type:
+        return 0
+    return UNMET_PREFERENCE_COST if kind == 'preference' else SENIOR_NOT_LOWER_COST
+
+
+def passenger_category(passenger):
+    if passenger.berth_preference:
+        return ('preference', passenger.berth_preference)
+    if passenger.age >= SENIOR_AGE:
+        return ('senior', 'LOWER')
+    return ('any', None)
+
+
+def min_cost_flow(node_count, edges, source, sink):
+    """Successive shortest paths (Bellman-Ford) min-cost max-flow.
+
+    edges is a list of (from, to, capacity, cost); returns the flow on each
+    edge in the same order. Graphs here have a dozen nodes, so the simple
+    algorithm is plenty.
+    """
+    graph = [[] for _ in range(node_count)]
+    # Each entry: [to, remaining capacity, cost, index of reverse entry]
+    handles = []
+    for u, v, capacity, cost in edges:
+        graph[u].append([v, capacity, cost, len(graph[v])])
+        graph[v].append([u, 0, -cost, len(graph[u]) - 1])
+        handles.append((u, len(graph[u]) - 1, capacity))
+
+    while True:
+        distance = [None] * node_count
+        previous = [None] * node_count
+        distance[source] = 0
+        changed = True
+        while changed:
+            changed = False
+            for u in range(node_count):
+                if distance[u] is None:
+                    continue
+                for index, (v, capacity, cost, _) in enumerate(graph[u]):
+                    if capacity > 0 and (distance[v] is None or distance[u] + cost < distance[v]):
+                        distance[v] = distance[u] + cost
+                        previous[v] = (u, index)
+                        changed = True
+        if distance[sink] is None:
+            break
+
+        # Push as much as the shortest path allows
+        push = None
+        node = sink
+        while node != source:
+            u, index = previous[node]
+            push = graph[u][index][1] if push is None else min(push, graph[u][index][1])
+            node = u
+        node = sink
+        while node != source:
+            u, index = previous[node]
+            edge = graph[u][index]
+            edge[1] -= push
+            graph[edge[0]][edge[3]][1] += push
+            node = u
+
+    return [capacity - graph[u][index][1] for u, index, capacity in handles]
+
+
+def assign_berths(passengers, capacity):
+    """Match one coach's passengers to berth types; returns {passenger: berth_type}"""
+    by_category = defaultdict(list)
+    for passenger in passengers:
+        by_category[passenger_category(passenger)].append(passenger)
+    categories = list(by_category)
+    berth_types = [berth for berth in BERTH_TYPES if capacity[berth] > 0]
+
+    # Nodes: source, categories, berth types, sink
+    source = 0
+    sink = len(categories) + len(berth_types) + 1
+    edges = []
+    for i, category in enumerate(categories):
+        edges.append((source, 1 + i, len(by_category[category]), 0))
+    for j, berth in enumerate(berth_types):
+        edges.append((1 + len(categories) + j, sink, capacity[berth], 0))
+    pairs = []
+    for i, category in enumerate(categories):
+        for j, berth in enumerate(berth_types):
+            edges.append((1 + i, 1 + len(categories) + j, len(by_category[category]), berth_cost(category, berth)))
+            pairs.append((category, berth))
+
+    flows = min_cost_flow(sink + 1, edges, source, sink)[len(categories) + len(berth_types):]
+
+    assignment = {}
+    for (category, berth), flow in zip(pairs, flows):
+        for passenger in by_category[category][:flow]:
+            assignment[passenger] = berth
+        by_category[category] = by_category[category][flow:]
+    return assignment
+
+
+def place_groups(groups, coaches):
+    """Place each PNR group into a coach; returns ({coach: [passengers]}, [passengers that did not fit])"""
+    free = {coach: coach_capacity(coach) for coach in coaches}
+    seats_left = {coach: sum(free[coach].values()) or coach.total_seats for coach in coaches}
+    placed = defaultdict(list)
+    unplaced = []
+
+    def take(coach, passengers):
+        for passenger in passengers:
+            wanted = wanted_berth(passenger)
+            if wanted and free[coach].get(wanted, 0) > 0:
+                free[coach][wanted] -= 1
+            elif any(free[coach].values()):
+                berth = max(free[coach], key=free[coach].get)
+                free[coach][berth] -= 1
+            seats_left[coach] -= 1
+            placed[coach].append(passenger)
+
+    def satisfiable(coach, passengers):
+        remaining = dict(free[coach])
+        met = 0
+        for passenger in passengers:
+            wanted = wanted_berth(passenger)
+            if wanted and remaining.get(wanted, 0) > 0:
+                remaining[wanted] -= 1
+                met += 1
+        return met
+
+    for group in sorted(groups, key=len, reverse=True):
+        fitting = [coach for coach in coaches if seats_left[coach] >= len(group)]
+        if fitting:
+            best = max(fitting, key=lambda coach: (satisfiable(coach, group), -seats_left[coach]))
+            take(best, group)
+            continue
+        # Too big for any single coach: split over the emptiest coaches
+        remaining = list(group)
+        for coach in sorted(coaches, key=lambda coach: seats_left[coach], reverse=True):
+            if not remaining:
+                break
+            count = min(seats_left[coach], len(remaining))
+            take(coach, remaining[:count])
+            remaining = remaining[count:]
+        unplaced.extend(remaining)
+    return placed, unplaced
+
+
+def optimize_class(passengers, coaches):
+    """Re-seat the passengers of one class; returns the passengers whose seat or status changed"""
+    groups = defaultdict(list)
+    for passenger in sorted(passengers, key=lambda p: (p.ticket_id, p.id)):
+        groups[passenger.ticket_id].append(passenger)
+
+    changed = []
+    placed, unplaced = place_groups(list(groups.values()), coaches)
+    for coach, members in placed.items():
+        capacity = coach_capacity(coach)
+        if any(capacity.values()):
+            berths = assign_berths(members, capacity)
+        else:
+            # Seating-only coach without berths
+            berths = {passenger: None for passenger in members}
+
+        counters = defaultdict(int)
+        for passenger in sorted(members, key=lambda p: (p.ticket_id, p.id)):
+            berth = berths.get(passenger)
+            counters[berth] += 1
+            seat_number = f"{counters[berth]}{BERTH_CODES.get(berth, '')}"
+            seat = ('CONFIRMED', coach.id, berth, seat_number)
+            if (passenger.current_status, passenger.coach_id, passenger.berth_type, passenger.seat_number) != seat:
+                passenger.current_status = 'CONFIRMED'
+                passenger.coach = coach
+                passenger.berth_type = berth
+                passenger.seat_number = seat_number
+                changed.append(passenger)
+
+    rac_places = sum(coach.total_side_lower for coach in coaches)
+    for index, passenger in enumerate(sorted(unplaced, key=lambda p: (p.ticket_id, p.id))):
+        status = 'RAC' if index < rac_places else 'WAITING'
+        if (passenger.current_status, passenger.coach_id, passenger.seat_number) != (status, None, None):
+            passenger.current_status = status
+            passenger.coach = None
+            passenger.berth_type = None
+            passenger.seat_number = None
+            changed.append(passenger)
+    return changed
+
+
+def chart_stats(passengers):
+    """Satisfied preferences and PNRs spread over several coaches"""
+    coaches_per_pnr = defaultdict(set)
+    preferences = satisfied = 0
+    for passenger in passengers:
+        coaches_per_pnr[passenger.ticket_id].add(passenger.coach_id)
+        if passenger.berth_preference:
+            preferences += 1
+            satisfied += passenger.berth_type == passenger.berth_preference
+    split = sum(1 for coaches in coaches_per_pnr.values() if len(coaches) > 1)
+    return {'preferences': preferences, 'satisfied': satisfied, 'split_pnrs': split}
+
+
+def prepare_chart(schedule):
+    """Re-optimize the seats of every confirmed and RAC passenger of a schedule's paid tickets.
+
+    Returns (stats_before, stats_after, number of passengers moved).
+    """
+    with transaction.atomic():
+        passengers = list(
+            Passenger.objects.select_for_update().filter(
+                ticket__schedule=schedule,
+                ticket__booking_status='CONFIRMED',
+                current_status__in=CHARTED_STATUSES
+            )
+        )
+        before = chart_stats(passengers)
+
+        by_class = defaultdict(list)
+        for passenger in passengers:
+            by_class[passenger.seat_class].append(passenger)
+        coaches_by_class = defaultdict(list)
+        for coach in Coach.objects.filter(train_id=schedule.train_id).order_by('coach_number'):
+            coaches_by_class[coach.coach_type].append(coach)
+
+        changed = []
+        for seat_class, members in by_class.items():
+            if coaches_by_class[seat_class]:
+                changed.extend(optimize_class(members, coaches_by_class[seat_class]))
+        Passenger.objects.bulk_update(
+            changed, ['current_status', 'coach', 'berth_type', 'seat_number'], batch_size=500
+        )
+        pnr_status.refresh_on_commit(*Ticket.objects.filter(
+            id__in={passenger.ticket_id for passenger in changed}
+        ).values_list('pnr', flat=True))
+
+        def coaches_changed():
+            # Per-coach counts are cached by inventory version and pushed to open booking pages
+            bump_inventory_version(schedule.id)
+            seat_updates.changed(schedule.id)
+
+        if changed:
+            transaction.on_commit(coaches_changed)
+
+    return before, chart_stats(passengers), len(changed)
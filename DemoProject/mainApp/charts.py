@@ -0,0 +1,60 @@
+"""Streaming passenger charts (CSV and JSON Lines)"""
+import csv
+import json
+
+from .models import Passenger, TrainSchedule
+
+CHART_COLUMNS = [
+    'journey_date', 'train_number', 'pnr', 'coach', 'seat_number', 'berth_type',
+    'name', 'age', 'gender', 'status',
+]
+
+CHART_FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+
+class Echo:
+    """File-like object whose write() hands the line back instead of storing it"""
+    def write(self, value):
+        return value
+
+
+def chart_rows(schedules, chunk_size=2000):
+    """Yield one tuple per passenger for a queryset of schedules.
+
+    Rows are read as plain tuples with values_list().iterator(), one schedule
+    at a time, so memory is bounded by the largest train rather than by the
+    number of rows exported.
+    """
+    schedule_rows = schedules.order_by('journey_date', 'train__train_number').values_list(
+        'id', 'journey_date', 'train__train_number'
+    )
+    for schedule_id, journey_date, train_number in schedule_rows.iterator(chunk_size=chunk_size):
+        passengers = Passenger.objects.filter(ticket__schedule_id=schedule_id).order_by(
+            'coach__coach_number', 'berth_type', 'id'
+        ).values_list(
+            'ticket__pnr', 'coach__coach_number', 'seat_number', 'berth_type',
+            'name', 'age', 'gender', 'current_status'
+        )
+        for row in passengers.iterator(chunk_size=chunk_size):
+            yield (journey_date.isoformat(), train_number) + row
+
+
+def stream_chart(schedules, chart_format='csv'):
+    """Yield the encoded chart line by line"""
+    rows = chart_rows(schedules)
+    if chart_format == 'jsonl':
+        for row in rows:
+            yield json.dumps(dict(zip(CHART_COLUMNS, row))) + '\n'
+    else:
+        writer = csv.writer(Echo())
+        yield writer.writerow(CHART_COLUMNS)
+        for row in rows:
+            yield writer.writerow(row)
+
+
+def schedules_for_date(journey_date):
+    """Every schedule running on a date"""
+    return TrainSchedule.objects.filter(journey_date=journey_date)
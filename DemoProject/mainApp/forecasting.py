@@ -0,0 +1,155 @@
+"""Booking-curve demand forecasts computed with NumPy over all schedules at once.
+
+Bookings are pulled as one grouped query (schedule, class, booking day,
+count) and handled as flat arrays. For every train and class, departed
+schedules give the average pickup: how many more bookings arrived after a
+given number of days before departure. A future schedule's forecast is its
+bookings so far plus that pickup at its current distance from departure;
+classes with no history of their own on a train fall back to the class
+average over all trains.
+
+No (schedule x day) matrix is ever built: booking rows are binned straight
+into (train, class) x day totals, so memory grows with the number of rows
+and schedules, not their product.
+"""
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+from .inventory import BOOKED_STATUSES
+from .models import DemandForecast, Passenger, ScheduleInventory
+
+try:
+    import numpy as np
+except ImportError:  # Optional dependency, only needed here
+    np = None
+
+HORIZON_DAYS = 120
+
+
+def load_series(start, end):
+    """One entry per (schedule, class) with a journey date between start and end"""
+    rows = list(
+        ScheduleInventory.objects.filter(schedule__journey_date__range=(start, end))
+        .order_by().values_list('schedule_id', 'seat_class', 'total_seats', 'schedule__train_id', 'schedule__journey_date')
+    )
+    schedule_ids, seat_classes, seats, train_ids, journey_dates = zip(*rows) if rows else ([],) * 5
+    return {
+        'schedule_id': np.array(schedule_ids, dtype=np.int64),
+        'seat_class': np.array(seat_classes, dtype=str),
+        'seats': np.array(seats, dtype=np.int64),
+        'train_id': np.array(train_ids, dtype=np.int64),
+        'journey_date': np.array(journey_dates, dtype='datetime64[D]'),
+    }
+
+
+def load_bookings(start, end):
+    """Seats still held, counted per (schedule, class, day the ticket was booked)"""
+    rows = list(
+        Passenger.objects.filter(
+            ticket__schedule__journey_date__range=(start, end),
+            current_status__in=BOOKED_STATUSES,
+        ).annotate(day=TruncDate('ticket__booking_date'))
+        .values_list('ticket__schedule_id', 'seat_class', 'day')
+        .annotate(n=Count('id')).order_by()
+    )
+    schedule_ids, seat_classes, days, counts = zip(*rows) if rows else ([],) * 4
+    return {
+        'schedule_id': np.array(schedule_ids, dtype=np.int64),
+        'seat_class': np.array(seat_classes, dtype=str),
+        'day': np.array(days, dtype='datetime64[D]'),
+        'n': np.array(counts, dtype=np.float64),
+    }
+
+
+def forecast(series, bookings, today, horizon=HORIZON_DAYS):
+    """Predict final bookings for every series departing on or after today.
+
+    Returns (indexes into series, bookings so far, days to departure,
+    predicted final bookings) as arrays.
+    """
+    today = np.datetime64(today, 'D')
+    width = horizon + 1
+
+    # Shared integer codes for classes, then one int64 key per (schedule, class)
+    classes = np.unique(np.concatenate([series['seat_class'], bookings['seat_class']]))
+    class_count = max(len(classes), 1)
+    series_class = np.searchsorted(classes, series['seat_class'])
+    series_key = series['schedule_id'] * class_count + series_class
+    order = np.argsort(series_key)
+    sorted_keys = series_key[order]
+
+    # Match each booking row to its series
+    booking_key = bookings['schedule_id'] * class_count + np.searchsorted(classes, bookings['seat_class'])
+    position = np.minimum(np.searchsorted(sorted_keys, booking_key), max(len(sorted_keys) - 1, 0))
+    matched = (sorted_keys[position] == booking_key) if len(sorted_keys) else np.zeros(len(booking_key), bool)
+    row_series = order[position[matched]]
+    row_count = bookings['n'][matched]
+    row_days_before = np.clip(
+        (series['journey_date'][row_series] - bookings['day'][matched]).astype(np.int64), 0, horizon
+    )
+
+    # Curves are shared by schedules of the same train and class
+    group_key = series['train_id'] * class_count + series_class
+    group_ids, series_group = np.unique(group_key, return_inverse=True)
+    group_class = group_ids % class_count
+    group_count = len(group_ids)
+    departed = series['journey_date'] < today
+    row_departed = departed[row_series]
+
+    # bookings_by_day[g, k]: departed bookings of group g made k days before departure
+    bookings_by_day = np.bincount(
+        series_group[row_series[row_departed]] * width + row_days_before[row_departed],
+        weights=row_count[row_departed],
+        minlength=group_count * width,
+    ).reshape(group_count, width)
+    departed_schedules = np.bincount(series_group[departed], minlength=group_count)
+
+    # Pickup after d days out = bookings made fewer than d days before departure
+    pickup_total = np.concatenate(
+        [np.zeros((group_count, 1)), np.cumsum(bookings_by_day, axis=1)[:, :-1]], axis=1
+    )
+    class_pickup = np.zeros((class_count, width))
+    np.add.at(class_pickup, group_class, pickup_total)
+    class_schedules = np.bincount(group_class, weights=departed_schedules, minlength=class_count)
+    class_mean = np.divide(
+        class_pickup, class_schedules[:, None],
+        out=np.zeros_like(class_pickup), where=class_schedules[:, None] > 0
+    )
+    group_mean = np.where(
+        departed_schedules[:, None] > 0,
+        pickup_total / np.maximum(departed_schedules, 1)[:, None],
+        class_mean[group_class],
+    )
+
+    # Everything booked so far counts for schedules still to depart
+    booked_now = np.bincount(row_series, weights=row_count, minlength=len(series_key))
+    upcoming = np.flatnonzero(~departed)
+    days_out = np.clip((series['journey_date'][upcoming] - today).astype(np.int64), 0, horizon)
+    predicted = booked_now[upcoming] + group_mean[series_group[upcoming], days_out]
+    return upcoming, booked_now[upcoming], days_out, predicted
+
+
+def save_forecasts(series, upcoming, booked_now, days_out, predicted, batch_size=1000):
+    """Replace the stored forecasts of the forecast schedules in one transaction"""
+    seats = series['seats'][upcoming]
+    rows = [
+        DemandForecast(
+            schedule_id=int(schedule_id),
+            seat_class=str(seat_class),
+            seats=int(total),
+            booked=int(booked),
+            days_to_departure=int(days),
+            predicted_booked=float(prediction),
+            predicted_occupancy=float(prediction / total) if total else None,
+        )
+        for schedule_id, seat_class, total, booked, days, prediction in zip(
+            series['schedule_id'][upcoming], series['seat_class'][upcoming], seats, booked_now, days_out, predicted
+        )
+    ]
+    schedule_ids = np.unique(series['schedule_id'][upcoming]).tolist()
+    with transaction.atomic():
+        for start in range(0, len(schedule_ids), batch_size):
+            DemandForecast.objects.filter(schedule_id__in=schedule_ids[start:start + batch_size]).delete()
+        DemandForecast.objects.bulk_create(rows, batch_size=batch_size)
+    return len(rows)
@@ -1,27 +1,59 @@
 from django import forms
+from django.urls import reverse
 from django.utils import timezone
 from django.forms import formset_factory
 from datetime import timedelta
 from .models import Train, Station, Passenger, Coach
+from . import autocomplete
+
+
+class AutocompleteWidget(forms.Widget):
+    """Text box backed by the autocomplete endpoint that submits the selected ID.
+
+    Unlike a Select, it never renders the queryset, so the page costs the
+    same with 8 stations or 8,000.
+    """
+    template_name = 'mainApp/widgets/autocomplete.html'
+    
+    def __init__(self, kind, placeholder='', attrs=None):
+        self.kind = kind
+        self.placeholder = placeholder
+        super().__init__(attrs)
+    
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        label = None
+        if value not in (None, ''):
+            try:
+                label = autocomplete.get_index(self.kind).label(int(value))
+            except (TypeError, ValueError):
+                pass
+        context['widget'].update({
+            'url': reverse('autocomplete', args=[self.kind]),
+            'label': label,
+            'placeholder': self.placeholder,
+        })
+        return context
+
 
 class SearchForm(forms.Form):
     train = forms.ModelChoiceField(
         queryset=Train.objects.all(),
         empty_label="Select Train",
         label="Train",
-        widget=forms.Select(attrs={'class': 'form-control'})
+        widget=AutocompleteWidget('trains', placeholder='Select Train', attrs={'class': 'form-control'})
     )
     from_station = forms.ModelChoiceField(
         queryset=Station.objects.all(),
         empty_label="Select Departure Station",
         label="From",
-        widget=forms.Select(attrs={'class': 'form-control'})
+        widget=AutocompleteWidget('stations', placeholder='Select Departure Station', attrs={'class': 'form-control'})
     )
     to_station = forms.ModelChoiceField(
         queryset=Station.objects.all(),
         empty_label="Select Arrival Station",
         label="To",
-        widget=forms.Select(attrs={'class': 'form-control'})
+        widget=AutocompleteWidget('stations', placeholder='Select Arrival Station', attrs={'class': 'form-control'})
     )
     journey_date = forms.DateField(
         widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}),
@@ -115,7 +147,7 @@ from .models import Station, Train, Coach, Passenger
 class DestinationSelectionForm(forms.Form):
     train = forms.ModelChoiceField(
         queryset=Train.objects.all(),
-        widget=forms.Select(attrs={
+        widget=AutocompleteWidget('trains', placeholder='Train number or name', attrs={
             'class': 'w-full px-4 py-3 border-2 border-gray-300 rounded-lg focus:border-indigo-500 focus:ring-2 focus:ring-indigo-200 transition duration-200'
         })
     )
@@ -127,13 +159,13 @@ class DestinationSelectionForm(forms.Form):
     )
     from_station = forms.ModelChoiceField(
         queryset=Station.objects.all(),
-        widget=forms.Select(attrs={
+        widget=AutocompleteWidget('stations', placeholder='Station code, name or city', attrs={
             'class': 'w-full px-4 py-3 border-2 border-gray-300 rounded-lg focus:border-indigo-500 focus:ring-2 focus:ring-indigo-200 transition duration-200'
         })
     )
     to_station = forms.ModelChoiceField(
         queryset=Station.objects.all(),
-        widget=forms.Select(attrs={
+        widget=AutocompleteWidget('stations', placeholder='Station code, name or city', attrs={
             'class': 'w-full px-4 py-3 border-2 border-gray-300 rounded-lg focus:border-indigo-500 focus:ring-2 focus:ring-indigo-200 transition duration-200'
         })
     )
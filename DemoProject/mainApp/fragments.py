@@ -0,0 +1,66 @@
+"""Inventory versions used to key cached schedule cards, and schedule search keys"""
+import time
+from datetime import date
+
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+
+from .cache_backends import coordination
+
+
+def _version_key(schedule_id):
+    return f'inventory_version:{schedule_id}'
+
+
+def _fresh_version():
+    # Start from the clock rather than 0, so a version evicted from the cache
+    # never comes back as a value an old fragment was stored under
+    return int(time.time() * 1000)
+
+
+def bump_inventory_version(schedule_id):
+    """Invalidate the cached cards of one schedule"""
+    try:
+        coordination.incr(_version_key(schedule_id))
+    except ValueError:
+        coordination.set(_version_key(schedule_id), _fresh_version(), timeout=None)
+
+
+def get_inventory_versions(schedule_ids):
+    """Current inventory version of each schedule, in one cache round trip"""
+    keys = {_version_key(schedule_id): schedule_id for schedule_id in schedule_ids}
+    found = coordination.get_many(keys)
+    versions = {keys[key]: version for key, version in found.items()}
+    for key, schedule_id in keys.items():
+        if key not in found:
+            coordination.add(key, _fresh_version(), timeout=None)
+            versions[schedule_id] = coordination.get(key)
+    return versions
+
+
+def schedule_card_key(schedule, from_station, to_station):
+    """Cache key of a schedule card as built by {% cache %} in schedule_list.html"""
+    return make_template_fragment_key(
+        'schedule_card', [schedule.id, schedule.inventory_version, from_station.id, to_station.id]
+    )
+
+
+def uncached_cards(schedules, from_station, to_station):
+    """Schedules whose card is not in the cache and has to be rendered"""
+    keys = {schedule_card_key(schedule, from_station, to_station): schedule for schedule in schedules}
+    cached = cache.get_many(keys)
+    return [schedule for key, schedule in keys.items() if key not in cached]
+
+
+
+def schedule_search_key(train_id, journey_date):
+    """Cache-tier key of schedule_list's search; no journey_date means the next 7 days"""
+    return f'schedule_search:{train_id}:{journey_date or "week:" + date.today().isoformat()}'
+
+
+def schedule_search_keys(schedule):
+    """Every search key that may list a schedule"""
+    return [
+        schedule_search_key(schedule.train_id, schedule.journey_date.isoformat()),
+        schedule_search_key(schedule.train_id, None),
+    ]
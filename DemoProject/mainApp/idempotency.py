@@ -0,0 +1,104 @@
+"""Idempotency keys for state-changing POSTs.
+
+Forms carry a hidden idempotency_key (clients may send an Idempotency-Key
+header instead). The first request with a key runs the view and its
+response is kept for IDEMPOTENCY_KEY_TTL seconds; repeats get that response
+back without touching the database. A repeat that arrives while the first
+request is still running waits for it rather than running in parallel.
+
+That wait relies on the cache's add() being atomic across workers (see
+CACHES in settings); a per-process cache would let a repeat sent to another
+worker run the view again. The lock is kept in the coordination cache so a
+cull cannot drop it while the first request runs.
+"""
+import time
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+from .cache_backends import coordination
+
+
+def new_key():
+    """Key for a freshly rendered form"""
+    return uuid.uuid4().hex
+
+
+def request_key(request):
+    key = request.POST.get('idempotency_key') or request.headers.get('Idempotency-Key')
+    if not key:
+        return None
+    # Scope keys per user and endpoint so clients cannot read each other's responses
+    return f'idempotency:{request.user.pk}:{request.path}:{key[:64]}'
+
+
+def retryable(response):
+    """Mark a response to an unexpected failure so a repeat runs the view again instead of replaying it"""
+    response.idempotency_retryable = True
+    return response
+
+
+def _store(cache_key, response):
+    cache.set(cache_key, {
+        'status': response.status_code,
+        'headers': list(response.items()),
+        'content': response.content,
+    }, timeout=settings.IDEMPOTENCY_KEY_TTL)
+
+
+def _replay(stored):
+    response = HttpResponse(stored['content'], status=stored['status'])
+    for header, value in stored['headers']:
+        response[header] = value
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _wait_for(cache_key):
+    """Poll until the first request stores its response or gives up its lock"""
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+    while time.monotonic() < deadline:
+        stored = cache.get(cache_key)
+        if stored is not None:
+            return stored
+        if coordination.get(cache_key + ':lock') is None:
+            return cache.get(cache_key)
+        time.sleep(0.05)
+    return None
+
+
+def idempotent(view_func):
+    """Run a POST view at most once per idempotency key"""
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if request.method != 'POST':
+            return view_func(request, *args, **kwargs)
+        cache_key = request_key(request)
+        if cache_key is None:
+            return view_func(request, *args, **kwargs)
+
+        stored = cache.get(cache_key)
+        if stored is not None:
+            return _replay(stored)
+
+        lock_key = cache_key + ':lock'
+        if not coordination.add(lock_key, 1, timeout=settings.IDEMPOTENCY_LOCK_SECONDS):
+            stored = _wait_for(cache_key)
+            if stored is not None:
+                return _replay(stored)
+            return HttpResponse('This request is already being processed', status=409)
+
+        try:
+            response = view_func(request, *args, **kwargs)
+            # Server errors and failures marked retryable are not remembered so the client can retry them
+            if response.status_code < 500 and not response.streaming and not getattr(
+                response, 'idempotency_retryable', False
+            ):
+                _store(cache_key, response)
+            return response
+        finally:
+            coordination.delete(lock_key)
+    return wrapper
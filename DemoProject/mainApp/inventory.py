@@ -0,0 +1,213 @@
+"""Transactional per-class seat counters (ScheduleInventory)"""
+from collections import Counter
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+
+from . import cache_tier, seat_updates, shared_inventory
+from .fragments import bump_inventory_version
+from .models import Coach, Passenger, ScheduleInventory, TrainSchedule
+
+# Passenger statuses that hold a seat (or a place in the queue for one)
+BOOKED_STATUSES = ['CONFIRMED', 'RAC', 'WAITING']
+
+
+def counters_changed(schedule_id):
+    """Re-render the schedule's cards, copy its counters to shared memory and push coach counts"""
+    bump_inventory_version(schedule_id)
+    shared_inventory.sync_schedule(schedule_id)
+    seat_updates.changed(schedule_id)
+
+
+def reserve_seats(schedule, seat_class, count=1):
+    """Atomically take seats from a class's counter.
+
+    Must run inside the booking transaction. Returns False when the class
+    does not have enough seats left, in which case nothing is changed.
+    """
+    updated = ScheduleInventory.objects.filter(
+        schedule=schedule,
+        seat_class=seat_class,
+        booked_seats__lte=F('total_seats') - count
+    ).update(booked_seats=F('booked_seats') + count, version=F('version') + 1)
+    if updated:
+        transaction.on_commit(lambda: counters_changed(schedule.id))
+    return updated == 1
+
+
+def release_seats(schedule, counts_by_class):
+    """Give seats back to the counters, e.g. {'SLEEPER': 2}"""
+    for seat_class, count in counts_by_class.items():
+        if count:
+            ScheduleInventory.objects.filter(schedule=schedule, seat_class=seat_class).update(
+                booked_seats=F('booked_seats') - count, version=F('version') + 1
+            )
+    if any(counts_by_class.values()):
+        transaction.on_commit(lambda: counters_changed(schedule.id))
+
+
+def release_passengers(schedule, passengers):
+    """Give back the seats held by a queryset of passengers that is about to be cancelled"""
+    counts = passengers.filter(current_status__in=BOOKED_STATUSES).values('seat_class').annotate(n=Count('id'))
+    release_seats(schedule, {row['seat_class']: row['n'] for row in counts})
+
+
+@transaction.atomic  # Which also keeps the reads on the primary, where the coach was just written
+def sync_totals(train_id):
+    """Match the seat totals of a train's upcoming schedules to its coaches.
+
+    Classes the train no longer carries keep their row with a total of 0, so
+    bookings already made in them are still counted.
+    """
+    capacity = dict(
+        Coach.objects.filter(train_id=train_id).values_list('coach_type').annotate(total=Sum('total_seats'))
+    )
+    schedule_ids = list(TrainSchedule.objects.filter(
+        train_id=train_id, journey_date__gte=timezone.now().date()
+    ).values_list('id', flat=True))
+    if not schedule_ids:
+        return
+    rows = ScheduleInventory.objects.filter(schedule_id__in=schedule_ids)
+    existing = set(rows.values_list('schedule_id', 'seat_class'))
+    ScheduleInventory.objects.bulk_create([
+        ScheduleInventory(schedule_id=schedule_id, seat_class=seat_class, total_seats=total)
+        for schedule_id in schedule_ids
+        for seat_class, total in capacity.items()
+        if (schedule_id, seat_class) not in existing
+    ], ignore_conflicts=True)
+    for seat_class, total in capacity.items():
+        rows.filter(seat_class=seat_class).exclude(total_seats=total).update(
+            total_seats=total, version=F('version') + 1
+        )
+    rows.exclude(seat_class__in=capacity).exclude(total_seats=0).update(total_seats=0, version=F('version') + 1)
+    transaction.on_commit(lambda: [counters_changed(schedule_id) for schedule_id in schedule_ids])
+
+
+def _coach_changed(sender, instance, **kwargs):
+    sync_totals(instance.train_id)
+
+
+def connect_signals():
+    """Resize the counters of upcoming schedules whenever a coach is saved or deleted.
+
+    Bulk operations do not send signals; call sync_totals() after them.
+    """
+    post_save.connect(_coach_changed, sender=Coach, dispatch_uid='inventory_coach_saved')
+    post_delete.connect(_coach_changed, sender=Coach, dispatch_uid='inventory_coach_deleted')
+
+
+def reconcile(schedules, fix=True):
+    """Check counters against Passenger and coach capacity for a queryset of schedules.
+
+    Returns a list of (inventory_row, expected_total, expected_booked) for every
+    counter that had drifted; those rows are corrected when fix is True.
+    """
+    schedule_ids = list(schedules.values_list('id', flat=True))
+
+    # Counters for schedules created before the inventory existed
+    for schedule in TrainSchedule.objects.filter(id__in=schedule_ids).exclude(inventory__isnull=False):
+        ScheduleInventory.create_for_schedule(schedule)
+
+    booked = Counter({
+        (row['ticket__schedule_id'], row['seat_class']): row['n']
+        for row in Passenger.objects.filter(
+            ticket__schedule_id__in=schedule_ids,
+            current_status__in=BOOKED_STATUSES
+        ).values('ticket__schedule_id', 'seat_class').annotate(n=Count('id'))
+    })
+    capacity = {
+        (row['train_id'], row['coach_type']): row['total']
+        for row in Coach.objects.filter(
+            train_id__in=TrainSchedule.objects.filter(id__in=schedule_ids).values('train_id')
+        ).values('train_id', 'coach_type').annotate(total=Sum('total_seats'))
+    }
+
+    drifted = []
+    rows = ScheduleInventory.objects.filter(schedule_id__in=schedule_ids).select_related('schedule')
+    for row in rows:
+        expected_total = capacity.get((row.schedule.train_id, row.seat_class), 0)
+        expected_booked = booked.get((row.schedule_id, row.seat_class), 0)
+        if row.total_seats != expected_total or row.booked_seats != expected_booked:
+            drifted.append((row, expected_total, expected_booked))
+
+    if fix:
+        for row, expected_total, _ in drifted:
+            _fix_row(row, expected_total)
+    return drifted
+
+
+def _fix_row(row, expected_total):
+    """Set one counter from a fresh count taken while holding its row lock.
+
+    Bookings and cancellations update this row in their own transaction, so
+    with the lock held none of them is half done: the count includes every
+    committed one and no uncommitted one can change the row until we are done.
+    """
+    with transaction.atomic():
+        ScheduleInventory.objects.select_for_update().filter(id=row.id).first()
+        booked = Passenger.objects.filter(
+            ticket__schedule_id=row.schedule_id, seat_class=row.seat_class, current_status__in=BOOKED_STATUSES
+        ).count()
+        ScheduleInventory.objects.filter(id=row.id).update(
+            total_seats=expected_total, booked_seats=booked, version=F('version') + 1
+        )
+        transaction.on_commit(lambda: counters_changed(row.schedule_id))
+
+
+def recount(schedule):
+    """Set every counter of a schedule to the seats its passengers hold, under the rows' locks"""
+    with transaction.atomic():
+        rows = list(ScheduleInventory.objects.select_for_update().filter(schedule=schedule))
+        booked = dict(
+            Passenger.objects.filter(ticket__schedule=schedule, current_status__in=BOOKED_STATUSES)
+            .values_list('seat_class').annotate(n=Count('id'))
+        )
+        for row in rows:
+            ScheduleInventory.objects.filter(id=row.id).update(
+                booked_seats=booked.get(row.seat_class, 0), version=F('version') + 1
+            )
+        transaction.on_commit(lambda: counters_changed(schedule.id))
+
+
+def availability_calendar(train_id, days):
+    """Date x seat-class availability of a train for the next `days` days.
+
+    Built from a single grouped query over the seat counters and cached per
+    train for AVAILABILITY_CALENDAR_CACHE_SECONDS in the cache tier. Returns
+    {'classes': [...], 'rows': [{'date', 'schedule_id', 'available': [...]}]}
+    with one entry in 'available' per class (None if the class is not sold).
+    """
+    today = timezone.now().date()
+    return cache_tier.get_or_compute(
+        f'availability_calendar:{train_id}:{today.isoformat()}:{days}',
+        lambda: _build_calendar(train_id, today, days),
+        timeout=settings.AVAILABILITY_CALENDAR_CACHE_SECONDS,
+    )
+
+
+def _build_calendar(train_id, today, days):
+    cells = ScheduleInventory.objects.filter(
+        schedule__train_id=train_id,
+        schedule__status='SCHEDULED',
+        schedule__journey_date__gte=today,
+        schedule__journey_date__lt=today + timedelta(days=days),
+    ).values('schedule_id', 'schedule__journey_date', 'seat_class').annotate(
+        available=Sum(F('total_seats') - F('booked_seats'))
+    ).order_by('schedule__journey_date')
+
+    classes = sorted({cell['seat_class'] for cell in cells})
+    rows = {}
+    for cell in cells:
+        row = rows.setdefault(cell['schedule_id'], {
+            'date': cell['schedule__journey_date'],
+            'schedule_id': cell['schedule_id'],
+            'available': [None] * len(classes),
+        })
+        row['available'][classes.index(cell['seat_class'])] = max(cell['available'], 0)
+
+    return {'classes': classes, 'rows': list(rows.values())}
@@ -0,0 +1,202 @@
+"""Server-Sent Events fed through the shared cache.
+
+publish() appends an event to a log in the shared cache: a sequence number
+plus one entry per event, each kept LIVE_EVENT_TTL seconds, and remembers
+the last event of its channel so a new viewer starts from current state.
+The sequence number lives in the coordination cache, which never culls it;
+a culled event is skipped like an expired one.
+
+Under ASGI each process runs one Hub per event loop, which polls the log
+every LIVE_POLL_SECONDS and fans new events out to that process's open
+streams, so the cost of an update does not grow with the number of viewers
+and no stream touches the database. Under WSGI every stream polls the log
+itself and closes after LIVE_WSGI_STREAM_SECONDS; browsers reconnect with
+Last-Event-ID and continue where they left off.
+"""
+import asyncio
+import json
+import time
+import weakref
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+
+from .cache_backends import coordination
+
+SEQUENCE_KEY = 'live:sequence'
+
+
+def _event_key(sequence):
+    return f'live:event:{sequence}'
+
+
+def _last_key(channel):
+    return f'live:last:{channel}'
+
+
+def enabled(request):
+    """Whether pages should open event streams: only under ASGI, where an open stream costs no worker thread"""
+    return isinstance(request, ASGIRequest)
+
+
+def publish(channel, data):
+    """Send data (anything JSON-serialisable) to every stream watching channel"""
+    try:
+        sequence = coordination.incr(SEQUENCE_KEY)
+    except ValueError:
+        coordination.add(SEQUENCE_KEY, 0, timeout=None)
+        sequence = coordination.incr(SEQUENCE_KEY)
+    cache.set(_event_key(sequence), (channel, data), timeout=settings.LIVE_EVENT_TTL)
+    cache.set(_last_key(channel), (sequence, data), timeout=settings.LIVE_EVENT_TTL)
+    return sequence
+
+
+def current_sequence():
+    return coordination.get(SEQUENCE_KEY, 0)
+
+
+def last_events(channels):
+    """[(sequence, channel, data)] of the latest event still kept for each channel"""
+    found = cache.get_many([_last_key(channel) for channel in channels])
+    return sorted(
+        (sequence, channel, data)
+        for channel in channels
+        if _last_key(channel) in found
+        for sequence, data in [found[_last_key(channel)]]
+    )
+
+
+class Cursor:
+    """Position in the event log"""
+
+    def __init__(self, sequence=None):
+        self.sequence = current_sequence() if sequence is None else sequence
+        self.gap_since = None
+
+    def poll(self):
+        """[(sequence, channel, data)] published since the last poll"""
+        latest = current_sequence()
+        if latest < self.sequence:
+            self.sequence = latest  # The log was reset (cache cleared)
+        if latest == self.sequence:
+            return []
+
+        first = max(self.sequence + 1, latest - settings.LIVE_MAX_BACKLOG + 1)
+        found = cache.get_many([_event_key(sequence) for sequence in range(first, latest + 1)])
+        events = []
+        for sequence in range(first, latest + 1):
+            entry = found.get(_event_key(sequence))
+            if entry is None:
+                # Numbered but not written yet, or already expired: wait a
+                # moment for it before skipping it
+                now = time.monotonic()
+                self.gap_since = self.gap_since or now
+                if now - self.gap_since < settings.LIVE_GAP_SECONDS:
+                    self.sequence = sequence - 1
+                    return events
+                continue
+            events.append((sequence, *entry))
+        self.sequence = latest
+        self.gap_since = None
+        return events
+
+
+def format_event(sequence, channel, data):
+    return f'id: {sequence}\nevent: {channel.split(":")[0]}\ndata: {json.dumps(data, default=str)}\n\n'
+
+
+class Hub:
+    """Fans events out to the streams of one event loop"""
+
+    def __init__(self):
+        self.queues = defaultdict(set)
+        self.task = None
+
+    def subscribe(self, channels):
+        queue = asyncio.Queue(maxsize=settings.LIVE_QUEUE_SIZE)
+        for channel in channels:
+            self.queues[channel].add(queue)
+        if self.task is None:
+            self.task = asyncio.get_running_loop().create_task(self.run())
+        return queue
+
+    def unsubscribe(self, queue, channels):
+        for channel in channels:
+            self.queues[channel].discard(queue)
+            if not self.queues[channel]:
+                del self.queues[channel]
+
+    async def run(self):
+        poll = sync_to_async(Cursor.poll, thread_sensitive=False)
+        cursor = await sync_to_async(Cursor, thread_sensitive=False)()
+        try:
+            while self.queues:
+                for sequence, channel, data in await poll(cursor):
+                    for queue in self.queues.get(channel, ()):
+                        try:
+                            queue.put_nowait((sequence, channel, data))
+                        except asyncio.QueueFull:
+                            pass  # A stalled client misses events rather than holding memory
+                await asyncio.sleep(settings.LIVE_POLL_SECONDS)
+        finally:
+            self.task = None
+
+
+_hubs = weakref.WeakKeyDictionary()
+
+
+def get_hub():
+    loop = asyncio.get_running_loop()
+    if loop not in _hubs:
+        _hubs[loop] = Hub()
+    return _hubs[loop]
+
+
+async def stream(channels, last_event_id=None):
+    """Async SSE body for ASGI servers"""
+    hub = get_hub()
+    queue = hub.subscribe(channels)
+    try:
+        yield f'retry: {settings.LIVE_RETRY_MILLISECONDS}\n\n'
+        if last_event_id is None:
+            missed = await sync_to_async(last_events, thread_sensitive=False)(channels)
+        else:
+            missed = await sync_to_async(Cursor(last_event_id).poll, thread_sensitive=False)()
+        sent = last_event_id or 0
+        for sequence, channel, data in missed:
+            if channel in channels:
+                yield format_event(sequence, channel, data)
+                sent = max(sent, sequence)
+        while True:
+            try:
+                sequence, channel, data = await asyncio.wait_for(queue.get(), settings.LIVE_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ': keep-alive\n\n'
+                continue
+            if sequence > sent:  # Not already replayed above
+                yield format_event(sequence, channel, data)
+    finally:
+        hub.unsubscribe(queue, channels)
+
+
+def stream_sync(channels, last_event_id=None):
+    """SSE body for WSGI servers; polls the log itself and ends after LIVE_WSGI_STREAM_SECONDS"""
+    yield f'retry: {settings.LIVE_RETRY_MILLISECONDS}\n\n'
+    if last_event_id is None:
+        for event in last_events(channels):
+            yield format_event(*event)
+    cursor = Cursor(last_event_id)
+    deadline = time.monotonic() + settings.LIVE_WSGI_STREAM_SECONDS
+    quiet_since = time.monotonic()
+    while time.monotonic() < deadline:
+        for sequence, channel, data in cursor.poll():
+            if channel in channels:
+                yield format_event(sequence, channel, data)
+                quiet_since = time.monotonic()
+        if time.monotonic() - quiet_since >= settings.LIVE_KEEPALIVE_SECONDS:
+            yield ': keep-alive\n\n'
+            quiet_since = time.monotonic()
+        time.sleep(settings.LIVE_POLL_SECONDS)
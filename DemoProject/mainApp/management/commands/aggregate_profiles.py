@@ -0,0 +1,59 @@
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from mainApp.profiling import read_collapsed, write_collapsed
+
+
+class Command(BaseCommand):
+    help = 'Merges sampled request profiles into one collapsed-stack file per view and prints the hottest functions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--view', action='append', help='URL name to aggregate (default: all); may be repeated')
+        parser.add_argument('--top', type=int, default=15, help='Functions to list per view')
+        parser.add_argument('--clear', action='store_true', help='Delete the per-request files once merged')
+
+    def handle(self, *args, **options):
+        profile_dir = Path(settings.PROFILING_DIR)
+        if not profile_dir.is_dir():
+            raise CommandError(f'No profiles in {profile_dir}; set PROFILING_ENABLED = True and send some requests')
+
+        views = options['view'] or sorted(path.name for path in profile_dir.iterdir() if path.is_dir())
+        for url_name in views:
+            files = sorted((profile_dir / url_name).glob('*.collapsed'))
+            if not files:
+                self.stdout.write(self.style.WARNING(f'{url_name}: no profiles'))
+                continue
+
+            counts = Counter()
+            for path in files:
+                counts.update(read_collapsed(path))
+            output = profile_dir / f'{url_name}.collapsed'
+            # Fold in what earlier runs merged before clearing their files
+            if options['clear'] and output.exists():
+                counts.update(read_collapsed(output))
+            write_collapsed(output, counts)
+            if options['clear']:
+                for path in files:
+                    path.unlink()
+
+            total = sum(counts.values())
+            self.stdout.write(self.style.SUCCESS(
+                f'{url_name}: {len(files)} requests, {total} samples -> {output}'
+            ))
+            self.report(counts, total, options['top'])
+
+    def report(self, counts, total, top):
+        """Functions by share of samples they appear in (inclusive) and are on top of the stack (self)"""
+        inclusive = Counter()
+        own = Counter()
+        for stack, count in counts.items():
+            frames = stack.split(';')
+            own[frames[-1]] += count
+            for frame in set(frames):
+                inclusive[frame] += count
+        self.stdout.write(f'  {"self":>6} {"total":>6}  function')
+        for frame, count in own.most_common(top):
+            self.stdout.write(f'  {count / total:>6.1%} {inclusive[frame] / total:>6.1%}  {frame}')
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from mainApp.archive import archivable_tickets, archive_journeys
+
+
+class Command(BaseCommand):
+    help = 'Moves tickets, passengers and payments of completed or past journeys into the archive tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Tickets moved per transaction')
+        parser.add_argument('--older-than-days', type=int, default=0,
+                            help='Only archive journeys that ended at least this many days ago')
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many tickets would be archived')
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            count = archivable_tickets(options['older_than_days']).count()
+            self.stdout.write(f'{count} tickets would be archived')
+            return
+
+        total = 0
+        for archived in archive_journeys(options['batch_size'], options['older_than_days']):
+            total += archived
+            self.stdout.write(f'Archived {total} tickets...')
+
+        self.stdout.write(self.style.SUCCESS(f'Archiving complete! Moved {total} tickets to the archive'))
@@ -0,0 +1,121 @@
+import random
+from bisect import bisect_left, insort
+
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+from mainApp.tatkal import TatkalQueue
+
+
+class SimulatedClock:
+    """Clock the simulation can move forward by hand"""
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def count_inversions(values):
+    """Count pairs that are served out of arrival order"""
+    seen = []
+    inversions = 0
+    for value in reversed(values):
+        # Number of later arrivals that were served before this one
+        inversions += bisect_left(seen, value)
+        insort(seen, value)
+    return inversions
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class Command(BaseCommand):
+    help = 'Simulates a tatkal rush with and without the admission queue and reports throughput and fairness'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rate', type=float, default=20, help='Bookings per second the allocator can sustain')
+        parser.add_argument('--overload', type=float, default=10, help='Arrival rate as a multiple of --rate')
+        parser.add_argument('--duration', type=float, default=60, help='Length of the rush in seconds')
+        parser.add_argument('--burst', type=int, default=50)
+        parser.add_argument('--timeout', type=float, default=30, help='Request timeout without admission control')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        rate = options['rate']
+        arrival_rate = rate * options['overload']
+
+        # Poisson arrivals over the rush window
+        arrivals = []
+        t = 0.0
+        while True:
+            t += rng.expovariate(arrival_rate)
+            if t > options['duration']:
+                break
+            arrivals.append(t)
+
+        self.stdout.write(
+            f'{len(arrivals)} users over {options["duration"]:.0f}s '
+            f'({arrival_rate:.0f}/s arriving, allocator sustains {rate:.0f}/s)'
+        )
+        self.report('With admission queue', *self.simulate_queue(arrivals, rate, options['burst']))
+        self.report('Without admission queue', *self.simulate_free_for_all(arrivals, rate, options['timeout'], rng))
+
+    def simulate_queue(self, arrivals, rate, burst):
+        """Users join the FIFO queue and book as soon as they are admitted"""
+        clock = SimulatedClock()
+        queue = TatkalQueue('bench', rate=rate, burst=burst, store=LocMemCache('bench-tatkal', {}), clock=clock)
+        served = []
+        for arrival in arrivals:
+            clock.now = arrival
+            token, admit_at = queue.join()
+            served.append((arrival, admit_at))
+        return served, 0
+
+    def simulate_free_for_all(self, arrivals, rate, timeout, rng):
+        """Everyone hits book_ticket at once and fights for the allocator's locks"""
+        service_time = 1.0 / rate
+        served = []
+        timed_out = 0
+        waiting = []
+        next_arrival = 0
+        now = 0.0
+        while next_arrival < len(arrivals) or waiting:
+            while next_arrival < len(arrivals) and arrivals[next_arrival] <= now:
+                waiting.append(arrivals[next_arrival])
+                next_arrival += 1
+            if not waiting:
+                now = arrivals[next_arrival]
+                continue
+            # Lock acquisition has no ordering guarantee, so any waiter may win
+            index = rng.randrange(len(waiting))
+            waiting[index], waiting[-1] = waiting[-1], waiting[index]
+            arrival = waiting.pop()
+            if now - arrival > timeout:
+                timed_out += 1
+                continue
+            served.append((arrival, now))
+            now += service_time
+        return served, timed_out
+
+    def report(self, label, served, timed_out):
+        served.sort()
+        waits = [start - arrival for arrival, start in served]
+        span = max(start for _, start in served) - min(start for _, start in served) if served else 0
+        throughput = len(served) / span if span else float(len(served))
+        inversions = count_inversions([start for _, start in served])
+        total = len(served) + timed_out
+
+        self.stdout.write(self.style.SUCCESS(label))
+        self.stdout.write(f'  served:          {len(served)}/{total}')
+        self.stdout.write(f'  timed out:       {timed_out} ({100.0 * timed_out / total if total else 0:.1f}%)')
+        self.stdout.write(f'  throughput:      {throughput:.1f} bookings/s')
+        self.stdout.write(
+            f'  wait p50/p95/max: {percentile(waits, 50):.1f}s / {percentile(waits, 95):.1f}s / {max(waits, default=0):.1f}s'
+        )
+        self.stdout.write(f'  out-of-order:    {inversions} pairs served out of arrival order')
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from mainApp.cancellation import cancel_run
+from mainApp.models import TrainSchedule
+
+
+class Command(BaseCommand):
+    help = 'Cancels a train run (schedule) with every ticket and passenger on it and queues refunds'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--schedule', type=int, help='Schedule id')
+        parser.add_argument('--train', help='Train number, together with --date')
+        parser.add_argument('--date', help='Journey date (YYYY-MM-DD), together with --train')
+        parser.add_argument('--batch-size', type=int, help='Tickets cancelled per transaction')
+        parser.add_argument('--reason', default='run cancelled', help='Stored on the cancellation events')
+
+    def handle(self, *args, **options):
+        schedules = TrainSchedule.objects.select_related('train')
+        try:
+            if options['schedule']:
+                schedule = schedules.get(id=options['schedule'])
+            elif options['train'] and options['date']:
+                schedule = schedules.get(train__train_number=options['train'], journey_date=options['date'])
+            else:
+                raise CommandError('Give --schedule, or --train and --date')
+        except TrainSchedule.DoesNotExist:
+            raise CommandError('No such schedule')
+
+        totals = cancel_run(schedule, options['batch_size'], options['reason'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Run cancelled! {schedule}: {totals['tickets']} tickets, {totals['passengers']} passengers, "
+            f"{totals['refunds']} refunds queued"
+        ))
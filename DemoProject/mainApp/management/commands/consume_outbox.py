@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mainApp.outbox import PROJECTIONS, consume, rebuild
+
+
+class Command(BaseCommand):
+    help = 'Applies new booking events from the outbox to the projections'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--projection', action='append', choices=sorted(PROJECTIONS),
+                            help='Projection to update (default: all); may be repeated')
+        parser.add_argument('--batch-size', type=int, default=500, help='Events per transaction')
+        parser.add_argument('--rebuild', action='store_true', help='Empty the projections and replay the whole outbox')
+        parser.add_argument('--follow', action='store_true', help='Keep polling for new events')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds between polls with --follow')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        projections = [PROJECTIONS[name] for name in options['projection'] or sorted(PROJECTIONS)]
+
+        if options['rebuild']:
+            for projection in projections:
+                rebuild(projection)
+                self.stdout.write(f'Rebuilding {projection.name} from the start of the outbox')
+
+        while True:
+            for projection in projections:
+                total = 0
+                while True:
+                    applied = consume(projection, options['batch_size'])
+                    total += applied
+                    if applied < options['batch_size']:
+                        break
+                if total or not options['follow']:
+                    self.stdout.write(self.style.SUCCESS(f'{projection.name}: applied {total} events'))
+            if not options['follow']:
+                break
+            time.sleep(options['interval'])
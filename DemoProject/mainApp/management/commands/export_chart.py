@@ -0,0 +1,38 @@
+import sys
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mainApp.charts import CHART_FORMATS, schedules_for_date, stream_chart
+from mainApp.models import TrainSchedule
+
+
+class Command(BaseCommand):
+    help = 'Streams the passenger chart of a schedule, or of every schedule on a date, as CSV or JSON Lines'
+
+    def add_arguments(self, parser):
+        target = parser.add_mutually_exclusive_group(required=True)
+        target.add_argument('--schedule', type=int, help='Schedule id')
+        target.add_argument('--date', help='Journey date (YYYY-MM-DD); exports all schedules of that day')
+        parser.add_argument('--format', choices=sorted(CHART_FORMATS), default='csv')
+        parser.add_argument('--output', help='File to write to (default: stdout)')
+
+    def handle(self, *args, **options):
+        if options['schedule']:
+            schedules = TrainSchedule.objects.filter(id=options['schedule'])
+            if not schedules.exists():
+                raise CommandError(f'Schedule {options["schedule"]} does not exist')
+        else:
+            try:
+                journey_date = datetime.strptime(options['date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('Pass the journey date as YYYY-MM-DD')
+            schedules = schedules_for_date(journey_date)
+
+        output = open(options['output'], 'w', newline='') if options['output'] else sys.stdout
+        try:
+            for line in stream_chart(schedules, options['format']):
+                output.write(line)
+        finally:
+            if options['output']:
+                output.close()
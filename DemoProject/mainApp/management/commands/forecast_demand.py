@@ -0,0 +1,89 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from mainApp import forecasting
+
+
+class Command(BaseCommand):
+    help = 'Forecasts final bookings per upcoming schedule and class from booking curves (needs NumPy)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--history-days', type=int, default=365, help='Departed schedules to learn from')
+        parser.add_argument('--horizon', type=int, default=forecasting.HORIZON_DAYS,
+                            help='Forecast schedules up to this many days ahead')
+        parser.add_argument('--dry-run', action='store_true', help='Compute forecasts without saving them')
+        parser.add_argument('--benchmark', action='store_true',
+                            help='Time the model on synthetic data instead of the database')
+        parser.add_argument('--trains', type=int, default=2000, help='Trains in the --benchmark data')
+
+    def handle(self, *args, **options):
+        if forecasting.np is None:
+            raise CommandError('forecast_demand needs NumPy: pip install numpy')
+        if options['benchmark']:
+            return self.benchmark(options['trains'], options['horizon'])
+
+        today = timezone.now().date()
+        started = time.perf_counter()
+        start = today - timedelta(days=options['history_days'])
+        end = today + timedelta(days=options['horizon'])
+        series = forecasting.load_series(start, end)
+        bookings = forecasting.load_bookings(start, end)
+        loaded = time.perf_counter()
+
+        upcoming, booked_now, days_out, predicted = forecasting.forecast(series, bookings, today, options['horizon'])
+        modelled = time.perf_counter()
+
+        saved = 0
+        if not options['dry_run']:
+            saved = forecasting.save_forecasts(series, upcoming, booked_now, days_out, predicted)
+
+        self.stdout.write(
+            f'{len(series["schedule_id"])} schedule classes, {len(bookings["n"])} booking rows; '
+            f'load {(loaded - started) * 1000:.0f} ms, model {(modelled - loaded) * 1000:.0f} ms, '
+            f'save {(time.perf_counter() - modelled) * 1000:.0f} ms'
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Forecast {len(upcoming)} upcoming schedule classes' + ('' if options['dry_run'] else f', saved {saved}')
+        ))
+
+    def benchmark(self, trains, horizon):
+        np = forecasting.np
+        rng = np.random.default_rng(1)
+        today = np.datetime64('2025-01-01')
+        days = np.arange(-365, horizon)
+        classes = np.array(['AC_3_TIER', 'SLEEPER'])
+
+        # A year of history plus the horizon, two classes per train, one schedule a day
+        train_ids = np.repeat(np.arange(trains), len(days) * len(classes))
+        day_offsets = np.tile(np.repeat(days, len(classes)), trains)
+        series = {
+            'schedule_id': train_ids * len(days) + (day_offsets + 365),
+            'seat_class': np.tile(classes, trains * len(days)),
+            'seats': np.full(len(train_ids), 576),
+            'train_id': train_ids,
+            'journey_date': today + day_offsets,
+        }
+
+        # About a dozen booking days per schedule class, skewed towards departure
+        rows_per_series = 12
+        series_index = np.repeat(np.arange(len(train_ids)), rows_per_series)
+        days_before = np.minimum(rng.exponential(20, len(series_index)).astype(np.int64), horizon)
+        booking_day = series['journey_date'][series_index] - days_before
+        known = booking_day < today
+        bookings = {
+            'schedule_id': series['schedule_id'][series_index][known],
+            'seat_class': series['seat_class'][series_index][known],
+            'day': booking_day[known],
+            'n': rng.poisson(30, len(series_index))[known].astype(np.float64),
+        }
+
+        started = time.perf_counter()
+        upcoming, _, _, predicted = forecasting.forecast(series, bookings, today, horizon)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'{trains} trains, {len(train_ids)} schedule classes, {len(bookings["n"])} booking rows: '
+            f'forecast {len(upcoming)} upcoming in {elapsed:.2f} s (mean {predicted.mean():.0f} seats)'
+        ))
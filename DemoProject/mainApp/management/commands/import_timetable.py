@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from mainApp.timetable_import import IMPORTERS, finish_import, find_files, import_file
+
+MAX_REPORTED_ERRORS = 20
+
+
+class Command(BaseCommand):
+    help = 'Imports stations, trains, coaches, routes and fares from CSV (or GTFS-style) files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='A file, or a directory holding stations.csv/stops.txt, trains.csv/trips.txt, '
+                                         'coaches.csv, routes.csv/stop_times.txt and fares.csv')
+        parser.add_argument('--kind', choices=list(IMPORTERS), help='What a single file holds')
+        parser.add_argument('--chunk-size', type=int, help='Rows upserted per transaction')
+
+    def handle(self, *args, **options):
+        if options['kind']:
+            files = [(options['kind'], options['path'])]
+        else:
+            files = find_files(options['path'])
+            if not files:
+                raise CommandError('Give --kind for a single file, or a directory with timetable files')
+
+        for kind, path in files:
+            read = created = updated = skipped = 0
+            try:
+                for rows, new, changed, errors in import_file(kind, path, options['chunk_size']):
+                    for line, error in errors[:max(MAX_REPORTED_ERRORS - skipped, 0)]:
+                        self.stdout.write(self.style.WARNING(f'{path} line {line}: {error}'))
+                    read, created, updated = read + rows, created + new, updated + changed
+                    skipped += len(errors)
+                    self.stdout.write(f'{kind}: {read} rows read')
+            except OSError as error:
+                raise CommandError(f'Cannot read {path}: {error}')
+            self.stdout.write(self.style.SUCCESS(
+                f'{kind} imported! {created} created, {updated} updated, {skipped} skipped'
+            ))
+
+        # Seat counters of upcoming runs were already resized with the coaches
+        finish_import({kind for kind, _ in files})
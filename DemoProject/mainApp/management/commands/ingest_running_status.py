@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from mainApp.running_status import Coalescer, fake_source, file_source, ingest, socket_source
+
+
+class Command(BaseCommand):
+    help = 'Reads running status updates (JSON lines) and writes them to train runs in batches'
+
+    def add_arguments(self, parser):
+        source = parser.add_mutually_exclusive_group(required=True)
+        source.add_argument('--file', help='Read updates from this file')
+        source.add_argument('--listen', metavar='HOST:PORT', help='Accept updates from TCP clients')
+        source.add_argument('--fake', action='store_true', help='Generate random updates for runs departing soon')
+        parser.add_argument('--follow', action='store_true', help='With --file, keep reading appended lines')
+        parser.add_argument('--rate', type=float, default=50, help='Updates per second with --fake')
+        parser.add_argument('--batch-size', type=int, help='Runs written per batch')
+        parser.add_argument('--flush-seconds', type=float, help='Write pending updates at least this often')
+
+    def handle(self, *args, **options):
+        if options['file']:
+            lines = file_source(options['file'], follow=options['follow'])
+        elif options['listen']:
+            host, _, port = options['listen'].rpartition(':')
+            if not port.isdigit():
+                raise CommandError('--listen expects HOST:PORT')
+            lines = socket_source(host or '127.0.0.1', int(port))
+        else:
+            lines = fake_source(rate=options['rate'])
+
+        coalescer = Coalescer(options['batch_size'], options['flush_seconds'])
+        written_total = 0
+        try:
+            for received, written in ingest(lines, coalescer):
+                written_total += written
+                self.stdout.write(f'{received} updates received, {written_total} run updates written')
+        except KeyboardInterrupt:
+            written_total += coalescer.flush()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Ingestion finished! {coalescer.received} updates received, {written_total} run updates written'
+        ))
@@ -0,0 +1,83 @@
+import random
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mainApp.chart_preparation import BERTH_TYPES, chart_stats, optimize_class, prepare_chart
+from mainApp.models import Coach, Passenger, TrainSchedule
+
+
+class Command(BaseCommand):
+    help = 'Re-optimizes seats of confirmed and RAC passengers before departure (chart preparation)'
+
+    def add_arguments(self, parser):
+        target = parser.add_mutually_exclusive_group(required=True)
+        target.add_argument('--schedule', type=int, help='Schedule id')
+        target.add_argument('--date', help='Prepare charts of every schedule on this date (YYYY-MM-DD)')
+        target.add_argument('--benchmark', action='store_true',
+                            help='Time the optimizer on a synthetic full 20-coach train (no database writes)')
+
+    def handle(self, *args, **options):
+        if options['benchmark']:
+            return self.benchmark()
+
+        if options['schedule']:
+            schedules = TrainSchedule.objects.filter(id=options['schedule'])
+            if not schedules.exists():
+                raise CommandError(f'Schedule {options["schedule"]} does not exist')
+        else:
+            try:
+                journey_date = datetime.strptime(options['date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('Pass the journey date as YYYY-MM-DD')
+            schedules = TrainSchedule.objects.filter(journey_date=journey_date)
+
+        for schedule in schedules.select_related('train'):
+            started = time.perf_counter()
+            before, after, moved = prepare_chart(schedule)
+            elapsed = (time.perf_counter() - started) * 1000
+            self.stdout.write(self.style.SUCCESS(f'{schedule}: chart prepared in {elapsed:.0f} ms'))
+            self.report(before, after, moved)
+
+    def report(self, before, after, moved):
+        self.stdout.write(
+            f'  preferences met: {before["satisfied"]}/{before["preferences"]} -> '
+            f'{after["satisfied"]}/{after["preferences"]}'
+        )
+        self.stdout.write(f'  PNRs split over coaches: {before["split_pnrs"]} -> {after["split_pnrs"]}')
+        self.stdout.write(f'  passengers moved: {moved}')
+
+    def benchmark(self):
+        rng = random.Random(1)
+        coaches = [
+            Coach(id=i, coach_number=f'S{i}', coach_type='SLEEPER', total_seats=72, total_lower=18,
+                  total_middle=18, total_upper=18, total_side_lower=9, total_side_upper=9)
+            for i in range(1, 21)
+        ]
+
+        # Fill the train with PNRs of 1-6 passengers seated the way greedy booking leaves them
+        passengers = []
+        ticket_id = 0
+        while len(passengers) < 20 * 72 - 6:
+            ticket_id += 1
+            for _ in range(rng.choice([1, 1, 2, 2, 3, 4, 6])):
+                passengers.append(Passenger(
+                    id=len(passengers) + 1,
+                    ticket_id=ticket_id,
+                    age=rng.randint(5, 80),
+                    seat_class='SLEEPER',
+                    coach=rng.choice(coaches),
+                    berth_type=rng.choice(BERTH_TYPES),
+                    berth_preference=rng.choice(BERTH_TYPES + [None, None]),
+                ))
+
+        before = chart_stats(passengers)
+        started = time.perf_counter()
+        moved = len(optimize_class(passengers, coaches))
+        elapsed = (time.perf_counter() - started) * 1000
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Optimized {len(passengers)} passengers in {ticket_id} PNRs over 20 coaches in {elapsed:.0f} ms'
+        ))
+        self.report(before, chart_stats(passengers), moved)
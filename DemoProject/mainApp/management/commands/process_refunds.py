@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from mainApp.payments import refund_pending
+
+
+class Command(BaseCommand):
+    help = 'Asks the gateway again for every refund still REFUND_PENDING'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Payments per batch')
+
+    def handle(self, *args, **options):
+        refunded = pending = 0
+        for batch_refunded, batch_pending in refund_pending(batch_size=options['batch_size']):
+            refunded += batch_refunded
+            pending += batch_pending
+            self.stdout.write(f'  batch: {batch_refunded} refunded, {batch_pending} still pending')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Refunds processed! {refunded} payments refunded, {pending} still pending'
+        ))
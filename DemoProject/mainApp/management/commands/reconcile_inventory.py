@@ -0,0 +1,32 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from mainApp.inventory import reconcile
+from mainApp.models import TrainSchedule
+
+
+class Command(BaseCommand):
+    help = 'Checks the per-class seat counters of upcoming schedules against booked passengers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=120, help='How many days ahead to check')
+        parser.add_argument('--check-only', action='store_true', help='Report drift without correcting it')
+
+    def handle(self, *args, **options):
+        today = timezone.now().date()
+        schedules = TrainSchedule.objects.filter(
+            journey_date__gte=today,
+            journey_date__lte=today + timedelta(days=options['days'])
+        )
+
+        drifted = reconcile(schedules, fix=not options['check_only'])
+        for row, expected_total, expected_booked in drifted:
+            self.stdout.write(self.style.WARNING(
+                f'{row.schedule} {row.seat_class}: counters {row.booked_seats}/{row.total_seats}, '
+                f'expected {expected_booked}/{expected_total}'
+            ))
+
+        action = 'found' if options['check_only'] else 'corrected'
+        self.stdout.write(self.style.SUCCESS(f'Reconciliation complete! {len(drifted)} drifted counters {action}'))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from mainApp.cancellation import expire_unpaid
+from mainApp.payments import reconcile_pending
+
+
+class Command(BaseCommand):
+    help = ('Settles payments left PENDING longer than PAYMENT_PENDING_TIMEOUT by asking the gateway, '
+            'then cancels tickets left unpaid that long')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Payments per batch')
+
+    def handle(self, *args, **options):
+        settled = failed = 0
+        for batch_settled, batch_failed in reconcile_pending(batch_size=options['batch_size']):
+            settled += batch_settled
+            failed += batch_failed
+            self.stdout.write(f'  batch: {batch_settled} settled, {batch_failed} failed without a gateway result')
+
+        released = expire_unpaid(batch_size=options['batch_size'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Reconciliation complete! {settled} payments settled, {failed} expired, '
+            f'{released} unpaid tickets cancelled'
+        ))
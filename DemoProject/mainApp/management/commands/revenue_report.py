@@ -0,0 +1,48 @@
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mainApp.reports import REPORT_GROUPINGS, revenue_report
+
+
+class Command(BaseCommand):
+    help = 'Prints occupancy and revenue from the rollup tables (run consume_outbox first to bring them up to date)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--by', choices=sorted(REPORT_GROUPINGS), default='train', help='How to group the rows')
+        parser.add_argument('--from', dest='start', help='First journey date (YYYY-MM-DD)')
+        parser.add_argument('--to', dest='end', help='Last journey date (YYYY-MM-DD)')
+        parser.add_argument('--train', help='Only this train number')
+
+    def parse_date(self, value):
+        if not value:
+            return None
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError('Pass dates as YYYY-MM-DD')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        report = revenue_report(
+            group_by=options['by'],
+            start=self.parse_date(options['start']),
+            end=self.parse_date(options['end']),
+            train_number=options['train'],
+        )
+        elapsed = (time.perf_counter() - started) * 1000
+
+        fields = REPORT_GROUPINGS[options['by']]
+        self.stdout.write(
+            f'{"group":<40} {"seats":>7} {"booked":>7} {"cancel":>7} {"occup.":>7} {"net revenue":>14}'
+        )
+        for row in report:
+            group = ' '.join(str(row[field]) for field in fields)
+            occupancy = f'{row["occupancy"]:.1%}' if row['occupancy'] is not None else '-'
+            self.stdout.write(
+                f'{group[:40]:<40} {row["total_seats"]:>7} {row["total_passengers"]:>7} '
+                f'{row["total_cancelled"]:>7} {occupancy:>7} {row["net_revenue"]:>14.2f}'
+            )
+
+        self.stdout.write(self.style.SUCCESS(f'{len(report)} rows in {elapsed:.1f} ms'))
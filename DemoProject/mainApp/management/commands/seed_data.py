@@ -28,11 +28,11 @@ class Command(BaseCommand):
         ahmedabad = Station.objects.create(code='ADI', name='Ahmedabad Junction', city='Ahmedabad', state='Gujarat')
 
         # Create trains with correct total_seats
-        train1 = Train.objects.create(train_number='IC101', name='InterCity Express', train_type='EXPRESS', total_seats=832, available_seats=832)
-        train2 = Train.objects.create(train_number='SH200', name='Shatabdi Express', train_type='SHATABDI', total_seats=576, available_seats=576)
-        train3 = Train.objects.create(train_number='RAJ301', name='Rajdhani Express', train_type='RAJDHANI', total_seats=384, available_seats=384)
-        train4 = Train.objects.create(train_number='DUR401', name='Duronto Express', train_type='DURONTO', total_seats=832, available_seats=832)
-        train5 = Train.objects.create(train_number='GARIB501', name='Garib Rath', train_type='EXPRESS', total_seats=640, available_seats=640)
+        train1 = Train.objects.create(train_number='IC101', name='InterCity Express', train_type='EXPRESS', total_seats=832)
+        train2 = Train.objects.create(train_number='SH200', name='Shatabdi Express', train_type='SHATABDI', total_seats=576)
+        train3 = Train.objects.create(train_number='RAJ301', name='Rajdhani Express', train_type='RAJDHANI', total_seats=384)
+        train4 = Train.objects.create(train_number='DUR401', name='Duronto Express', train_type='DURONTO', total_seats=832)
+        train5 = Train.objects.create(train_number='GARIB501', name='Garib Rath', train_type='EXPRESS', total_seats=640)
 
         # Create coaches with berth distribution
         # Sleeper coach: 72 seats = 18 lower + 18 middle + 18 upper + 9 side lower + 9 side upper
@@ -0,0 +1,30 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from mainApp import shared_inventory
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the shared-memory seat counters from ScheduleInventory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.SHARED_INVENTORY_DAYS,
+                            help='How many days ahead to load')
+        parser.add_argument('--watch', action='store_true', help='Keep rebuilding every --interval seconds')
+        parser.add_argument('--interval', type=float, default=60, help='Seconds between rebuilds with --watch')
+
+    def handle(self, *args, **options):
+        if shared_inventory.get_table() is None:
+            raise CommandError('Shared inventory is disabled or not supported on this platform')
+
+        while True:
+            started = time.perf_counter()
+            stored = shared_inventory.sync_upcoming(options['days'])
+            self.stdout.write(self.style.SUCCESS(
+                f'Shared inventory rebuilt! {stored} schedules loaded in {time.perf_counter() - started:.3f}s'
+            ))
+            if not options['watch']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,71 @@
+import json
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from mainApp.warmup import warm_up
+
+# Runs in a fresh interpreter so the first request really is the first one
+BENCHMARK_SCRIPT = '''
+import json, sys, time
+import django
+django.setup()
+from django.conf import settings
+from django.test import Client
+settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, 'testserver']
+urls, username, warm = json.loads(sys.argv[1])
+if warm:
+    from mainApp.warmup import warm_up
+    warm_up()
+client = Client()
+if username:
+    from django.contrib.auth.models import User
+    client.force_login(User.objects.get(username=username))
+timings = []
+for url in urls:
+    started = time.perf_counter()
+    status = client.get(url).status_code
+    timings.append((url, status, time.perf_counter() - started))
+print(json.dumps(timings))
+'''
+
+
+class Command(BaseCommand):
+    help = 'Preloads connections, templates and process caches, or benchmarks cold against warm first requests'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--benchmark', action='store_true',
+                            help='Time the first requests of a fresh process with and without warm-up')
+        parser.add_argument('--url', action='append', help='URL to request in the benchmark (default: /); may be repeated')
+        parser.add_argument('--user', help='Log the benchmark client in as this user (for login-only pages)')
+        parser.add_argument('--runs', type=int, default=3, help='Fresh processes per variant')
+
+    def handle(self, *args, **options):
+        if options['benchmark']:
+            return self.benchmark(options['url'] or ['/'], options['user'], options['runs'])
+
+        for name, seconds in warm_up():
+            self.stdout.write(f'  {name}: {seconds * 1000:.0f} ms')
+        self.stdout.write(self.style.SUCCESS('Warm-up complete!'))
+
+    def first_requests(self, urls, username, warm):
+        result = subprocess.run(
+            [sys.executable, '-c', BENCHMARK_SCRIPT, json.dumps([urls, username, warm])],
+            cwd=settings.BASE_DIR, capture_output=True, text=True
+        )
+        if result.returncode:
+            raise CommandError(f'Benchmark process failed:\n{result.stderr}')
+        return json.loads(result.stdout.strip().splitlines()[-1])
+
+    def benchmark(self, urls, username, runs):
+        for warm in (False, True):
+            label = 'warm' if warm else 'cold'
+            best = {}
+            for _ in range(runs):
+                for url, status, seconds in self.first_requests(urls, username, warm):
+                    best[url] = min(best.get(url, (status, seconds)), (status, seconds), key=lambda item: item[1])
+            for url, (status, seconds) in best.items():
+                self.stdout.write(f'  {label} {url} -> {status}: {seconds * 1000:.1f} ms (best of {runs})')
+        self.stdout.write(self.style.SUCCESS('Benchmark complete!'))
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainApp', '0013_passenger_fare_alter_passenger_seat_class'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedTicket',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('pnr', models.CharField(max_length=10, unique=True)),
+                ('passenger_name', models.CharField(max_length=100)),
+                ('email', models.EmailField(blank=True, max_length=254, null=True)),
+                ('seat_class', models.CharField(max_length=20)),
+                ('booking_status', models.CharField(choices=[('CONFIRMED', 'Confirmed'), ('PENDING', 'Pending'), ('CANCELLED', 'Cancelled'), ('WAITING', 'Waiting List')], max_length=20)),
+                ('booking_date', models.DateTimeField()),
+                ('total_fare', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('destination_station', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='mainApp.station')),
+                ('schedule', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='mainApp.trainschedule')),
+                ('source_station', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='mainApp.station')),
+            ],
+            options={
+                'ordering': ['-booking_date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedPayment',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('transaction_id', models.CharField(max_length=50, unique=True)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('payment_method', models.CharField(max_length=20)),
+                ('payment_date', models.DateTimeField()),
+                ('status', models.CharField(max_length=20)),
+                ('gateway_response', models.TextField(blank=True)),
+                ('ticket', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='payment', to='mainApp.archivedticket')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedPassenger',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=100)),
+                ('age', models.IntegerField()),
+                ('gender', models.CharField(choices=[('M', 'Male'), ('F', 'Female'), ('O', 'Other')], max_length=1)),
+                ('seat_class', models.CharField(max_length=20)),
+                ('fare', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('seat_number', models.CharField(blank=True, max_length=10, null=True)),
+                ('berth_type', models.CharField(blank=True, choices=[('LOWER', 'Lower'), ('MIDDLE', 'Middle'), ('UPPER', 'Upper'), ('SIDE_LOWER', 'Side Lower'), ('SIDE_UPPER', 'Side Upper')], max_length=20, null=True)),
+                ('current_status', models.CharField(choices=[('CONFIRMED', 'Confirmed'), ('RAC', 'RAC'), ('WAITING', 'Waiting List'), ('CANCELLED', 'Cancelled')], max_length=20)),
+                ('coach', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='mainApp.coach')),
+                ('ticket', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='passengers', to='mainApp.archivedticket')),
+            ],
+        ),
+    ]
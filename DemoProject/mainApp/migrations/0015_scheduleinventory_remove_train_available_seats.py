@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:29
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainApp', '0014_archivedticket_archivedpassenger_archivedpayment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduleInventory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seat_class', models.CharField(max_length=20)),
+                ('total_seats', models.IntegerField(default=0, validators=[django.core.validators.MinValueValidator(0)])),
+                ('booked_seats', models.IntegerField(default=0, validators=[django.core.validators.MinValueValidator(0)])),
+            ],
+            options={
+                'ordering': ['schedule', 'seat_class'],
+            },
+        ),
+        migrations.RemoveConstraint(
+            model_name='train',
+            name='available_seats_not_exceed_total',
+        ),
+        migrations.RemoveField(
+            model_name='train',
+            name='available_seats',
+        ),
+        migrations.AddField(
+            model_name='scheduleinventory',
+            name='schedule',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inventory', to='mainApp.trainschedule'),
+        ),
+        migrations.AddConstraint(
+            model_name='scheduleinventory',
+            constraint=models.CheckConstraint(condition=models.Q(('booked_seats__gte', 0)), name='inventory_booked_non_negative'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='scheduleinventory',
+            unique_together={('schedule', 'seat_class')},
+        ),
+    ]
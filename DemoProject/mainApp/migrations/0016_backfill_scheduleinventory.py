@@ -0,0 +1,43 @@
+from django.db import migrations
+from django.db.models import Count, Sum
+
+
+def backfill_inventory(apps, schema_editor):
+    """Create seat counters for existing schedules from coaches and booked passengers"""
+    TrainSchedule = apps.get_model('mainApp', 'TrainSchedule')
+    Coach = apps.get_model('mainApp', 'Coach')
+    Passenger = apps.get_model('mainApp', 'Passenger')
+    ScheduleInventory = apps.get_model('mainApp', 'ScheduleInventory')
+
+    capacity = {}
+    for row in Coach.objects.values('train_id', 'coach_type').annotate(total=Sum('total_seats')):
+        capacity.setdefault(row['train_id'], {})[row['coach_type']] = row['total']
+
+    booked = {
+        (row['ticket__schedule_id'], row['seat_class']): row['n']
+        for row in Passenger.objects.filter(
+            current_status__in=['CONFIRMED', 'RAC', 'WAITING']
+        ).values('ticket__schedule_id', 'seat_class').annotate(n=Count('id'))
+    }
+
+    rows = []
+    for schedule_id, train_id in TrainSchedule.objects.values_list('id', 'train_id').iterator():
+        for seat_class, total in capacity.get(train_id, {}).items():
+            rows.append(ScheduleInventory(
+                schedule_id=schedule_id,
+                seat_class=seat_class,
+                total_seats=total,
+                booked_seats=booked.get((schedule_id, seat_class), 0),
+            ))
+    ScheduleInventory.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainApp', '0015_scheduleinventory_remove_train_available_seats'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_inventory, migrations.RunPython.noop),
+    ]
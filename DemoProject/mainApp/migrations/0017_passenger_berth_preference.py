@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainApp', '0016_backfill_scheduleinventory'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='passenger',
+            name='berth_preference',
+            field=models.CharField(blank=True, choices=[('LOWER', 'Lower'), ('MIDDLE', 'Middle'), ('UPPER', 'Upper'), ('SIDE_LOWER', 'Side Lower'), ('SIDE_UPPER', 'Side Upper')], max_length=20, null=True),
+        ),
+    ]
@@ -0,0 +1,63 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def copy_schedule_fields(apps, schema_editor):
+    """Fill train, journey_date and seats of existing rollup rows from their schedule"""
+    RevenueRollup = apps.get_model('mainApp', 'RevenueRollup')
+    ScheduleInventory = apps.get_model('mainApp', 'ScheduleInventory')
+
+    seats = {
+        (row.schedule_id, row.seat_class): row.total_seats
+        for row in ScheduleInventory.objects.all()
+    }
+    rows = list(RevenueRollup.objects.select_related('schedule'))
+    for row in rows:
+        row.train_id = row.schedule.train_id
+        row.journey_date = row.schedule.journey_date
+        row.seats = seats.get((row.schedule_id, row.seat_class), 0)
+    RevenueRollup.objects.bulk_update(rows, ['train', 'journey_date', 'seats'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainApp', '0018_outboxevent_projectioncheckpoint_revenuerollup'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='revenuerollup',
+            options={'ordering': ['journey_date', 'train', 'seat_class']},
+        ),
+        migrations.AddField(
+            model_name='revenuerollup',
+            name='train',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='revenue_rollups', to='mainApp.train'),
+        ),
+        migrations.AddField(
+            model_name='revenuerollup',
+            name='journey_date',
+            field=models.DateField(null=True),
+        ),
+        migrations.AddField(
+            model_name='revenuerollup',
+            name='seats',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(copy_schedule_fields, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='revenuerollup',
+            name='train',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revenue_rollups', to='mainApp.train'),
+        ),
+        migrations.AlterField(
+            model_name='revenuerollup',
+            name='journey_date',
+            field=models.DateField(),
+        ),
+        migrations.AddIndex(
+            model_name='revenuerollup',
+            index=models.Index(fields=['journey_date', 'train'], name='mainApp_rev_journey_b66a18_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainApp', '0019_revenuerollup_train_journey_date'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DemandForecast',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seat_class', models.CharField(max_length=20)),
+                ('seats', models.IntegerField(default=0)),
+                ('booked', models.IntegerField(default=0)),
+                ('days_to_departure', models.IntegerField()),
+                ('predicted_booked', models.FloatField()),
+                ('predicted_occupancy', models.FloatField(blank=True, null=True)),
+                ('generated_at', models.DateTimeField(auto_now=True)),
+                ('schedule', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='forecasts', to='mainApp.trainschedule')),
+            ],
+            options={
+                'ordering': ['schedule', 'seat_class'],
+                'unique_together': {('schedule', 'seat_class')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainApp', '0020_demandforecast'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='outboxevent',
+            name='event_type',
+            field=models.CharField(choices=[('TICKET_BOOKED', 'Ticket Booked'), ('PASSENGER_ADDED', 'Passenger Added'), ('TICKET_CANCELLED', 'Ticket Cancelled'), ('PAYMENT_SUCCEEDED', 'Payment Succeeded'), ('PAYMENT_FAILED', 'Payment Failed'), ('PAYMENT_REFUNDED', 'Payment Refunded')], max_length=30),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainApp', '0021_outboxevent_payment_refunded'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trainschedule',
+            name='last_station',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='mainApp.station'),
+        ),
+        migrations.AddField(
+            model_name='trainschedule',
+            name='status_updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainApp', '0022_trainschedule_running_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scheduleinventory',
+            name='version',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
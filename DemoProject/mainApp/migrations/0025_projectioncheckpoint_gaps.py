@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainApp', '0024_payment_refund_pending'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='projectioncheckpoint',
+            name='gaps',
+            field=models.JSONField(default=list),
+        ),
+    ]
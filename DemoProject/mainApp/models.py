@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
@@ -6,6 +6,9 @@ import secrets
 import string
 from decimal import Decimal
 
+from . import shared_inventory
+from .fragments import bump_inventory_version
+
 # Create your models here.
 
 class Station(models.Model):
@@ -35,16 +38,9 @@ class Train(models.Model):
         ('DURONTO', 'Duronto'),
     ], default='EXPRESS')
     total_seats = models.IntegerField(validators=[MinValueValidator(1)])
-    available_seats = models.IntegerField(validators=[MinValueValidator(0)])
     
     class Meta:
         ordering = ['train_number']
-        constraints = [
-            models.CheckConstraint(
-                check=models.Q(available_seats__lte=models.F('total_seats')),
-                name='available_seats_not_exceed_total'
-            )
-        ]
     
     @property
     def total_seats_calculated(self):
@@ -92,6 +88,9 @@ class TrainSchedule(models.Model):
     ], default='SCHEDULED')
     delay_minutes = models.IntegerField(default=0, validators=[MinValueValidator(0)])
     base_fare = models.DecimalField(max_digits=8, decimal_places=2, default=0)  # ADD THIS
+    # Written by the running status feed (see mainApp.running_status)
+    last_station = models.ForeignKey(Station, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    status_updated_at = models.DateTimeField(null=True, blank=True)
     
     class Meta:
         unique_together = ['train', 'journey_date']
@@ -100,28 +99,80 @@ class TrainSchedule(models.Model):
     def __str__(self):
         return f"{self.train.train_number} - {self.journey_date} ({self.status})"
     
+    def save(self, *args, **kwargs):
+        """Create the per-class seat counters along with a new schedule"""
+        is_new = self._state.adding
+        super().save(*args, **kwargs)
+        if is_new:
+            ScheduleInventory.create_for_schedule(self)
+        else:
+            # Fare or status may have changed; re-render this schedule's cards
+            transaction.on_commit(lambda: bump_inventory_version(self.id))
+    
+    # The seat counts below read the ScheduleInventory counters, from shared
+    # memory when the schedule is there (see mainApp.shared_inventory). Use
+    # prefetch_related('inventory') when listing schedules that may not be,
+    # so a whole page of schedules costs one query.
+    def seat_counters(self):
+        """[(seat_class, total, booked)] of every class of this schedule"""
+        counters = shared_inventory.read_schedule(self.id)
+        if counters is not None:
+            return [(seat_class, total, booked) for seat_class, (total, booked) in counters.items()]
+        return [(row.seat_class, row.total_seats, row.booked_seats) for row in self.inventory.all()]
+    
     def get_total_seats(self):
         """Get total seats from the train's coaches"""
-        return self.train.coaches.aggregate(
-            total=models.Sum('total_seats')
-        )['total'] or 0
+        return sum(total for _, total, _ in self.seat_counters())
     
     def get_available_seats(self):
-        """Get available seats by calculating booked seats for this specific schedule"""
-        # Get all passengers for this schedule across all tickets
-        booked_count = Passenger.objects.filter(
-            ticket__schedule=self,
-            current_status__in=['CONFIRMED', 'RAC', 'WAITING']
-        ).count()
-        
-        return self.get_total_seats() - booked_count
+        """Get available seats for this specific schedule"""
+        return sum(max(total - booked, 0) for _, total, booked in self.seat_counters())
     
     def get_booked_seats(self):
         """Get total booked seats for this schedule"""
-        return Passenger.objects.filter(
-            ticket__schedule=self,
-            current_status__in=['CONFIRMED', 'RAC', 'WAITING']
-        ).count()
+        return sum(booked for _, _, booked in self.seat_counters())
+
+class ScheduleInventory(models.Model):
+    """Booked and available seat counters per class for one schedule.
+
+    Counters are changed with F() expressions in the same transaction as the
+    booking or cancellation (see mainApp.inventory) and checked against
+    Passenger by the reconcile_inventory command.
+    """
+    schedule = models.ForeignKey(TrainSchedule, on_delete=models.CASCADE, related_name='inventory')
+    seat_class = models.CharField(max_length=20)
+    total_seats = models.IntegerField(default=0, validators=[MinValueValidator(0)])
+    booked_seats = models.IntegerField(default=0, validators=[MinValueValidator(0)])
+    # Bumped by every counter change, so copies in shared memory can tell which is newer
+    version = models.BigIntegerField(default=0)
+    
+    class Meta:
+        unique_together = ['schedule', 'seat_class']
+        ordering = ['schedule', 'seat_class']
+        constraints = [
+            models.CheckConstraint(
+                check=models.Q(booked_seats__gte=0),
+                name='inventory_booked_non_negative'
+            )
+        ]
+    
+    def __str__(self):
+        return f"{self.schedule} - {self.seat_class}: {self.booked_seats}/{self.total_seats}"
+    
+    @property
+    def available_seats(self):
+        return max(self.total_seats - self.booked_seats, 0)
+    
+    @classmethod
+    def create_for_schedule(cls, schedule):
+        """Create counters for every class the schedule's train carries"""
+        totals = schedule.train.coaches.values('coach_type').annotate(total=models.Sum('total_seats'))
+        cls.objects.bulk_create(
+            [cls(schedule=schedule, seat_class=row['coach_type'], total_seats=row['total']) for row in totals],
+            ignore_conflicts=True
+        )
+        transaction.on_commit(lambda: shared_inventory.sync_schedule(schedule.id))
+
 
 class Ticket(models.Model):
     """Model for train tickets"""
@@ -150,8 +201,9 @@ class Ticket(models.Model):
             import string
             # Generate a 10-character alphanumeric PNR
             self.pnr = ''.join(random.choices(string.ascii_uppercase + string.digits, k=10))
-            # Ensure uniqueness
-            while Ticket.objects.filter(pnr=self.pnr).exists():
+            # Ensure uniqueness, also against archived tickets: PNR lookups search both
+            while (Ticket.objects.filter(pnr=self.pnr).exists()
+                   or ArchivedTicket.objects.filter(pnr=self.pnr).exists()):
                 self.pnr = ''.join(random.choices(string.ascii_uppercase + string.digits, k=10))
         super().save(*args, **kwargs)
     
@@ -285,6 +337,8 @@ class Passenger(models.Model):
     )
     seat_number = models.CharField(max_length=10, blank=True, null=True)
     berth_type = models.CharField(max_length=20, choices=BERTH_CHOICES, blank=True, null=True)
+    # Kept so chart preparation can honour it when it re-optimizes seats
+    berth_preference = models.CharField(max_length=20, choices=BERTH_CHOICES, blank=True, null=True)
     current_status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='CONFIRMED')
     
     def __str__(self):
@@ -292,7 +346,9 @@ class Passenger(models.Model):
     
     def save(self, *args, **kwargs):
         """Auto-assign seat and berth when passenger is created"""
-        berth_preference = kwargs.pop('berth_preference', None)
+        berth_preference = kwargs.pop('berth_preference', None) or self.berth_preference
+        if berth_preference:
+            self.berth_preference = berth_preference
         
         if not self.seat_number and self.coach:
             # Get berth preference or auto-assign
@@ -359,17 +415,9 @@ class Passenger(models.Model):
         except Fare.DoesNotExist:
             base_fare = self.ticket.schedule.base_fare
         
-        # Class-based fare multipliers (using Decimal)
-        class_multipliers = {
-            'GENERAL': Decimal('1.0'),
-            'SLEEPER': Decimal('1.5'),
-            'AC_3_TIER': Decimal('2.0'),
-            'AC_2_TIER': Decimal('3.0'),
-            'AC_1_TIER': Decimal('5.0'),
-            'FIRST_CLASS': Decimal('6.0'),
-        }
-        
-        return base_fare * class_multipliers.get(self.seat_class, Decimal('1.0'))
+        # Fixed class fare; the occupancy surcharge is only known at booking time
+        from .pricing import class_fare
+        return class_fare(base_fare, self.seat_class)
 
 class Payment(models.Model):
     """Model for payment transactions"""
@@ -388,6 +436,7 @@ class Payment(models.Model):
         ('SUCCESS', 'Success'),
         ('FAILED', 'Failed'),
         ('PENDING', 'Pending'),
+        ('REFUND_PENDING', 'Refund Pending'),
         ('REFUNDED', 'Refunded'),
     ], default='PENDING')
     gateway_response = models.TextField(blank=True)  # Store payment gateway response
@@ -433,3 +482,159 @@ class WaitingList(models.Model):
     
     def __str__(self):
         return f"WL {self.waiting_list_number} - {self.passenger.name}"
+
+
+class ArchivedTicket(models.Model):
+    """Ticket of a finished journey, moved out of the hot booking tables by archive_journeys"""
+    id = models.BigIntegerField(primary_key=True)  # Same id the ticket had in Ticket
+    pnr = models.CharField(max_length=10, unique=True)
+    schedule = models.ForeignKey(TrainSchedule, on_delete=models.CASCADE, related_name='+')
+    passenger_name = models.CharField(max_length=100)
+    email = models.EmailField(blank=True, null=True)
+    seat_class = models.CharField(max_length=20)
+    source_station = models.ForeignKey(Station, on_delete=models.CASCADE, related_name='+', null=True, blank=True)
+    destination_station = models.ForeignKey(Station, on_delete=models.CASCADE, related_name='+', null=True, blank=True)
+    booking_status = models.CharField(max_length=20, choices=Ticket.STATUS_CHOICES)
+    booking_date = models.DateTimeField()
+    total_fare = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-booking_date']
+    
+    def __str__(self):
+        return f"PNR: {self.pnr} - {self.passenger_name} (archived)"
+    
+    def get_total_fare(self):
+        """Fares were fixed at booking time, so just add them up"""
+        return sum(passenger.fare for passenger in self.passengers.all())
+    
+    get_seat_classes = Ticket.get_seat_classes
+
+
+class ArchivedPassenger(models.Model):
+    """Passenger of an archived ticket"""
+    id = models.BigIntegerField(primary_key=True)  # Same id the passenger had in Passenger
+    ticket = models.ForeignKey(ArchivedTicket, on_delete=models.CASCADE, related_name='passengers')
+    name = models.CharField(max_length=100)
+    age = models.IntegerField()
+    gender = models.CharField(max_length=1, choices=Passenger.GENDER_CHOICES)
+    seat_class = models.CharField(max_length=20)
+    fare = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    coach = models.ForeignKey(Coach, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    seat_number = models.CharField(max_length=10, blank=True, null=True)
+    berth_type = models.CharField(max_length=20, choices=Passenger.BERTH_CHOICES, blank=True, null=True)
+    current_status = models.CharField(max_length=20, choices=Passenger.STATUS_CHOICES)
+    
+    def __str__(self):
+        return f"{self.name} - {self.ticket.pnr} (archived)"
+
+
+class ArchivedPayment(models.Model):
+    """Payment of an archived ticket"""
+    id = models.BigIntegerField(primary_key=True)  # Same id the payment had in Payment
+    ticket = models.OneToOneField(ArchivedTicket, on_delete=models.CASCADE, related_name='payment')
+    transaction_id = models.CharField(max_length=50, unique=True)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    payment_method = models.CharField(max_length=20)
+    payment_date = models.DateTimeField()
+    status = models.CharField(max_length=20)
+    gateway_response = models.TextField(blank=True)
+    
+    def __str__(self):
+        return f"Payment {self.transaction_id} - {self.status} (archived)"
+
+
+class OutboxEvent(models.Model):
+    """Booking event written in the same transaction as the change it describes"""
+    EVENT_TYPES = [
+        ('TICKET_BOOKED', 'Ticket Booked'),
+        ('PASSENGER_ADDED', 'Passenger Added'),
+        ('TICKET_CANCELLED', 'Ticket Cancelled'),
+        ('PAYMENT_SUCCEEDED', 'Payment Succeeded'),
+        ('PAYMENT_FAILED', 'Payment Failed'),
+        ('PAYMENT_REFUNDED', 'Payment Refunded'),
+    ]
+    
+    id = models.BigAutoField(primary_key=True)
+    event_type = models.CharField(max_length=30, choices=EVENT_TYPES)
+    pnr = models.CharField(max_length=10, db_index=True)  # Not a foreign key: tickets get archived
+    schedule_id = models.BigIntegerField()
+    payload = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    class Meta:
+        ordering = ['id']
+    
+    def __str__(self):
+        return f"#{self.id} {self.event_type} {self.pnr}"
+
+
+class ProjectionCheckpoint(models.Model):
+    """Last outbox event a projection has applied, and the lower ids it has not seen yet"""
+    name = models.CharField(max_length=50, unique=True)
+    last_event_id = models.BigIntegerField(default=0)
+    gaps = models.JSONField(default=list)  # [[event id, unix time first missed], ...]
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.name} @ {self.last_event_id}"
+
+
+class RevenueRollup(models.Model):
+    """Paid passengers, fares and refunds per train, journey date and class.
+
+    Built incrementally from the outbox; train and journey_date are copied
+    from the schedule so reports never need to join other tables.
+    """
+    schedule = models.ForeignKey(TrainSchedule, on_delete=models.CASCADE, related_name='revenue_rollups')
+    train = models.ForeignKey(Train, on_delete=models.CASCADE, related_name='revenue_rollups')
+    journey_date = models.DateField()
+    seat_class = models.CharField(max_length=20)
+    seats = models.IntegerField(default=0)  # Capacity of the class when the row was created
+    passengers = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    cancelled_passengers = models.IntegerField(default=0)
+    cancelled_revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    
+    class Meta:
+        unique_together = ['schedule', 'seat_class']
+        ordering = ['journey_date', 'train', 'seat_class']
+        indexes = [models.Index(fields=['journey_date', 'train'])]
+    
+    @property
+    def net_passengers(self):
+        return self.passengers - self.cancelled_passengers
+    
+    @property
+    def net_revenue(self):
+        return self.revenue - self.cancelled_revenue
+    
+    @property
+    def occupancy(self):
+        """Share of the class's seats held by passengers who did not cancel"""
+        if not self.seats:
+            return None
+        return self.net_passengers / self.seats
+    
+    def __str__(self):
+        return f"{self.schedule} - {self.seat_class}: ₹{self.net_revenue}"
+
+
+class DemandForecast(models.Model):
+    """Predicted final bookings per schedule and class, written by forecast_demand"""
+    schedule = models.ForeignKey(TrainSchedule, on_delete=models.CASCADE, related_name='forecasts')
+    seat_class = models.CharField(max_length=20)
+    seats = models.IntegerField(default=0)
+    booked = models.IntegerField(default=0)  # Bookings when the forecast was made
+    days_to_departure = models.IntegerField()
+    predicted_booked = models.FloatField()
+    predicted_occupancy = models.FloatField(null=True, blank=True)
+    generated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ['schedule', 'seat_class']
+        ordering = ['schedule', 'seat_class']
+    
+    def __str__(self):
+        return f"{self.schedule} - {self.seat_class}: {self.predicted_booked:.0f}/{self.seats}"
@@ -0,0 +1,162 @@
+"""Transactional outbox of booking events and the projections built from it.
+
+Views call record() inside the transaction that makes the change, so an
+event exists exactly when its change was committed. consume() reads the
+outbox in id order and hands batches to each projection, which keeps its
+position in a ProjectionCheckpoint updated in the same transaction as its
+own tables; a projection can be rebuilt by resetting it and replaying.
+
+Ids are handed out before commit, so an event can appear after others
+with higher ids were consumed. The checkpoint therefore also keeps the
+ids it skipped over, and reads them again until they show up or
+OUTBOX_GAP_SECONDS have passed (their transaction rolled back).
+"""
+import time
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+
+from .models import OutboxEvent, ProjectionCheckpoint, RevenueRollup, ScheduleInventory, TrainSchedule
+
+# A jump in ids larger than this is not a transaction still committing
+# (e.g. events were deleted, or the sequence was reset); it is not tracked
+MAX_GAP = 1000
+
+
+def record(event_type, ticket, **payload):
+    """Append an event for a ticket; must be called inside the changing transaction"""
+    return OutboxEvent.objects.create(
+        event_type=event_type,
+        pnr=ticket.pnr,
+        schedule_id=ticket.schedule_id,
+        payload=payload,
+    )
+
+
+def record_passenger_added(ticket, passenger):
+    fare = Decimal(passenger.fare).quantize(Decimal('0.01'))
+    return record('PASSENGER_ADDED', ticket, seat_class=passenger.seat_class, fare=str(fare))
+
+
+def passenger_fares(passengers):
+    """[{'seat_class', 'fare'}] of a passenger queryset, as stored in event payloads"""
+    return [
+        {'seat_class': seat_class, 'fare': str(fare)}
+        for seat_class, fare in passengers.values_list('seat_class', 'fare')
+    ]
+
+
+def record_cancellation(ticket, passengers):
+    """Event for a cancelled ticket listing the passengers that were still booked"""
+    return record('TICKET_CANCELLED', ticket, passengers=passenger_fares(passengers))
+
+
+class RevenueProjection:
+    """Paid passengers, fares and refunds per train, date and class (RevenueRollup).
+
+    Only money that changed hands counts: a booking is added when its
+    payment succeeds and taken off when the refund is paid out, so unpaid,
+    failed and expired bookings never show up.
+    """
+    name = 'revenue_rollup'
+
+    def reset(self):
+        RevenueRollup.objects.all().delete()
+
+    def apply(self, events):
+        deltas = defaultdict(lambda: {
+            'passengers': 0, 'revenue': Decimal('0'),
+            'cancelled_passengers': 0, 'cancelled_revenue': Decimal('0'),
+        })
+        fields = {
+            'PAYMENT_SUCCEEDED': ('passengers', 'revenue'),
+            'PAYMENT_REFUNDED': ('cancelled_passengers', 'cancelled_revenue'),
+        }
+        for event in events:
+            if event.event_type not in fields:
+                continue
+            count_field, amount_field = fields[event.event_type]
+            for passenger in event.payload['passengers']:
+                delta = deltas[(event.schedule_id, passenger['seat_class'])]
+                delta[count_field] += 1
+                delta[amount_field] += Decimal(passenger['fare'])
+
+        # Train, date and capacity for rows this batch may have to create
+        schedule_ids = {schedule_id for schedule_id, _ in deltas}
+        schedules = {
+            schedule_id: (train_id, journey_date)
+            for schedule_id, train_id, journey_date in TrainSchedule.objects.filter(
+                id__in=schedule_ids
+            ).values_list('id', 'train_id', 'journey_date')
+        }
+        seats = {
+            (schedule_id, seat_class): total
+            for schedule_id, seat_class, total in ScheduleInventory.objects.filter(
+                schedule_id__in=schedule_ids
+            ).values_list('schedule_id', 'seat_class', 'total_seats')
+        }
+
+        # One update per (schedule, class) touched by the batch, not per event
+        for (schedule_id, seat_class), delta in deltas.items():
+            if schedule_id not in schedules:
+                continue  # Schedule deleted since the event was written
+            train_id, journey_date = schedules[schedule_id]
+            RevenueRollup.objects.get_or_create(
+                schedule_id=schedule_id, seat_class=seat_class,
+                defaults={
+                    'train_id': train_id,
+                    'journey_date': journey_date,
+                    'seats': seats.get((schedule_id, seat_class), 0),
+                }
+            )
+            RevenueRollup.objects.filter(schedule_id=schedule_id, seat_class=seat_class).update(
+                **{field: F(field) + value for field, value in delta.items()}
+            )
+
+
+PROJECTIONS = {projection.name: projection for projection in [RevenueProjection()]}
+
+
+def consume(projection, batch_size=500):
+    """Apply the next batch of events to a projection; returns how many were applied"""
+    now = time.time()
+    with transaction.atomic():
+        checkpoint, _ = ProjectionCheckpoint.objects.get_or_create(name=projection.name)
+        checkpoint = ProjectionCheckpoint.objects.select_for_update().get(pk=checkpoint.pk)
+        gaps = dict(checkpoint.gaps)
+        events = list(
+            OutboxEvent.objects.filter(Q(id__gt=checkpoint.last_event_id) | Q(id__in=gaps))
+            .order_by('id')[:batch_size]
+        )
+        expired = [event_id for event_id, missed in gaps.items() if missed < now - settings.OUTBOX_GAP_SECONDS]
+        if not events and not expired:
+            return 0
+
+        last_event_id = checkpoint.last_event_id
+        for event in events:
+            if event.id in gaps:
+                del gaps[event.id]
+            elif event.id > last_event_id:
+                if event.id - last_event_id <= MAX_GAP:
+                    gaps.update(dict.fromkeys(range(last_event_id + 1, event.id), now))
+                last_event_id = event.id
+        for event_id in expired:
+            gaps.pop(event_id, None)
+
+        projection.apply(events)
+        checkpoint.last_event_id = last_event_id
+        checkpoint.gaps = sorted(gaps.items())
+        checkpoint.save(update_fields=['last_event_id', 'gaps', 'updated_at'])
+    return len(events)
+
+
+def rebuild(projection):
+    """Empty a projection and rewind its checkpoint so the whole log is replayed"""
+    with transaction.atomic():
+        projection.reset()
+        ProjectionCheckpoint.objects.update_or_create(
+            name=projection.name, defaults={'last_event_id': 0, 'gaps': []}
+        )
@@ -0,0 +1,267 @@
+"""Payment processing: pending payments, asynchronous gateway calls, callbacks, refunds and reconciliation"""
+import hashlib
+import hmac
+import json
+import random
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import outbox, pnr_status
+from .models import Payment, Ticket
+
+
+class FakeGateway:
+    """Local stand-in for a payment gateway.
+
+    Each charge takes PAYMENT_GATEWAY_LATENCY seconds and fails with
+    probability PAYMENT_GATEWAY_FAILURE_RATE. Outcomes are remembered in the
+    cache so status() can answer reconciliation queries from any process.
+    """
+
+    def __init__(self, latency=None, failure_rate=None, rng=None):
+        self.latency = settings.PAYMENT_GATEWAY_LATENCY if latency is None else latency
+        self.failure_rate = settings.PAYMENT_GATEWAY_FAILURE_RATE if failure_rate is None else failure_rate
+        self.rng = rng or random.Random()
+
+    def charge(self, transaction_id, amount, payment_method):
+        """Charge the customer; returns (status, gateway response)"""
+        time.sleep(self.latency)
+        status = 'FAILED' if self.rng.random() < self.failure_rate else 'SUCCESS'
+        response = json.dumps({
+            'gateway': 'fake',
+            'transaction_id': transaction_id,
+            'amount': str(amount),
+            'method': payment_method,
+            'status': status,
+        })
+        cache.set(f'fake_gateway:{transaction_id}', (status, response), timeout=60 * 60 * 24)
+        return status, response
+
+    def status(self, transaction_id):
+        """Look up a charge; returns (status, response) or None if the gateway never saw it"""
+        return cache.get(f'fake_gateway:{transaction_id}')
+
+    def refund(self, transaction_id, amount):
+        """Pay a charge back; returns (status, gateway response).
+
+        Refunding the same transaction again returns the first result
+        instead of paying twice, which real gateways guarantee as well.
+        """
+        key = f'fake_gateway_refund:{transaction_id}'
+        result = cache.get(key)
+        if result is None:
+            time.sleep(self.latency)
+            result = ('SUCCESS', json.dumps({
+                'gateway': 'fake',
+                'transaction_id': transaction_id,
+                'amount': str(amount),
+                'status': 'REFUNDED',
+            }))
+            if not cache.add(key, result, timeout=60 * 60 * 24):
+                result = cache.get(key, result)
+        return result
+
+
+def get_gateway():
+    return import_string(settings.PAYMENT_GATEWAY)()
+
+
+# Gateway calls run here so the request that started the payment returns at once
+_executor = ThreadPoolExecutor(max_workers=settings.PAYMENT_WORKERS, thread_name_prefix='payment')
+
+
+def new_transaction_id():
+    return 'TXN' + secrets.token_hex(8).upper()
+
+
+def start_payment(ticket, payment_method, gateway=None):
+    """Create (or reuse) the ticket's PENDING payment and charge it in the background.
+
+    Starting a payment twice is harmless: a pending or successful payment is
+    returned as is, and only a failed one is retried with a new transaction id.
+    The retry replaces the old id, so it waits until the gateway itself reports
+    the old attempt FAILED; a failure recorded only on our side (e.g. by
+    reconcile_pending) could still turn into a charge nobody would find.
+    Tickets that are no longer PENDING (e.g. whose hold expired) are not charged.
+    """
+    with transaction.atomic():
+        ticket = Ticket.objects.select_for_update().get(pk=ticket.pk)
+        payment = Payment.objects.filter(ticket=ticket).first()
+        if ticket.booking_status != 'PENDING' or (payment is not None and payment.status != 'FAILED'):
+            return payment
+        if payment is not None and not failed_at_gateway(payment.transaction_id, gateway):
+            return payment
+
+        if payment is None:
+            payment = Payment(ticket=ticket)
+        payment.transaction_id = new_transaction_id()
+        payment.amount = ticket.total_fare
+        payment.payment_method = payment_method
+        payment.status = 'PENDING'
+        payment.gateway_response = ''
+        # auto_now_add only fills it in on create; a retry starts a new attempt
+        payment.payment_date = timezone.now()
+        payment.save()
+
+        transaction_id = payment.transaction_id
+        amount = payment.amount
+        transaction.on_commit(lambda: _executor.submit(_charge, transaction_id, amount, payment_method))
+    return payment
+
+
+def failed_at_gateway(transaction_id, gateway=None):
+    """Whether the gateway confirms a charge failed, so it can never succeed later"""
+    result = (gateway or get_gateway()).status(transaction_id)
+    return result is not None and result[0] == 'FAILED'
+
+
+def _charge(transaction_id, amount, payment_method):
+    """Worker thread: call the gateway and record the outcome"""
+    try:
+        status, response = get_gateway().charge(transaction_id, amount, payment_method)
+        handle_callback(transaction_id, status, response)
+    finally:
+        close_old_connections()
+
+
+def handle_callback(transaction_id, status, gateway_response=''):
+    """Record a gateway result. Idempotent: only a PENDING payment changes.
+
+    Returns the payment, or None if the transaction id is unknown.
+    """
+    if status not in ('SUCCESS', 'FAILED'):
+        raise ValueError(f'Unknown payment status: {status}')
+    with transaction.atomic():
+        payment = Payment.objects.select_for_update().select_related('ticket').filter(
+            transaction_id=transaction_id
+        ).first()
+        if payment is None or payment.status != 'PENDING':
+            return payment
+
+        payment.status = status
+        payment.gateway_response = gateway_response
+        payment.save(update_fields=['status', 'gateway_response'])
+        outbox.record(
+            'PAYMENT_SUCCEEDED' if status == 'SUCCESS' else 'PAYMENT_FAILED', payment.ticket,
+            transaction_id=transaction_id, amount=str(payment.amount),
+            passengers=outbox.passenger_fares(payment.ticket.passengers.all()),
+        )
+        if status == 'SUCCESS' and payment.ticket.booking_status == 'CANCELLED':
+            # The run was cancelled while the charge was in flight; pay it back
+            payment.status = 'REFUND_PENDING'
+            payment.save(update_fields=['status'])
+            queue_refunds([(transaction_id, payment.amount)])
+        elif status == 'SUCCESS' and payment.ticket.booking_status == 'PENDING':
+            payment.ticket.booking_status = 'CONFIRMED'
+            payment.ticket.save(update_fields=['booking_status'])
+            pnr_status.refresh_on_commit(payment.ticket.pnr)
+    return payment
+
+
+def queue_refunds(refunds):
+    """Refund [(transaction id, amount)] of payments just set to REFUND_PENDING once the transaction commits.
+
+    Refunds that fail or are lost with the process stay REFUND_PENDING until
+    process_refunds retries them.
+    """
+    transaction.on_commit(lambda: [_executor.submit(_refund, *refund) for refund in refunds])
+
+
+def _refund(transaction_id, amount):
+    """Worker thread: ask the gateway for the refund and record the outcome"""
+    try:
+        refund(transaction_id, amount)
+    finally:
+        close_old_connections()
+
+
+def refund(transaction_id, amount, gateway=None):
+    """Call the gateway for a REFUND_PENDING payment; returns the payment's status afterwards.
+
+    A successful refund marks the payment REFUNDED and records PAYMENT_REFUNDED;
+    a failed one is left REFUND_PENDING to be retried.
+    """
+    status, response = (gateway or get_gateway()).refund(transaction_id, amount)
+    with transaction.atomic():
+        payment = Payment.objects.select_for_update().select_related('ticket').get(transaction_id=transaction_id)
+        if payment.status != 'REFUND_PENDING':
+            return payment.status  # Settled by another worker meanwhile
+        payment.gateway_response = response
+        if status == 'SUCCESS':
+            payment.status = 'REFUNDED'
+            outbox.record(
+                'PAYMENT_REFUNDED', payment.ticket, transaction_id=transaction_id, amount=str(payment.amount),
+                passengers=outbox.passenger_fares(payment.ticket.passengers.all()),
+            )
+        payment.save(update_fields=['status', 'gateway_response'])
+    return payment.status
+
+
+def refund_pending(batch_size=100):
+    """Retry every REFUND_PENDING payment, in batches; yields (refunded, still pending) per batch"""
+    gateway = get_gateway()
+    last_id = 0
+    while True:
+        batch = list(
+            Payment.objects.filter(status='REFUND_PENDING', id__gt=last_id)
+            .order_by('id').values_list('id', 'transaction_id', 'amount')[:batch_size]
+        )
+        if not batch:
+            return
+        refunded = pending = 0
+        for _, transaction_id, amount in batch:
+            if refund(transaction_id, amount, gateway) == 'REFUNDED':
+                refunded += 1
+            else:
+                pending += 1
+        last_id = batch[-1][0]
+        yield refunded, pending
+
+
+def sign_callback(body):
+    """Signature a gateway sends with its callback body"""
+    return hmac.new(settings.PAYMENT_CALLBACK_SECRET.encode(), body, hashlib.sha256).hexdigest()
+
+
+def verify_callback(body, signature):
+    """Without a PAYMENT_CALLBACK_SECRET configured every callback is refused"""
+    if not settings.PAYMENT_CALLBACK_SECRET:
+        return False
+    return hmac.compare_digest(sign_callback(body), signature or '')
+
+
+def reconcile_pending(batch_size=100):
+    """Settle payments stuck in PENDING past PAYMENT_PENDING_TIMEOUT, in batches.
+
+    Asks the gateway for each one; payments the gateway never saw are failed,
+    and cancellation.expire_unpaid() then releases their tickets' seats. Yields (settled, failed_unknown) per batch.
+    """
+    gateway = get_gateway()
+    cutoff = timezone.now() - timedelta(seconds=settings.PAYMENT_PENDING_TIMEOUT)
+    last_id = 0
+    while True:
+        batch = list(
+            Payment.objects.filter(status='PENDING', payment_date__lt=cutoff, id__gt=last_id)
+            .order_by('id').values_list('id', 'transaction_id')[:batch_size]
+        )
+        if not batch:
+            return
+        settled = unknown = 0
+        for payment_id, transaction_id in batch:
+            result = gateway.status(transaction_id)
+            if result is None:
+                handle_callback(transaction_id, 'FAILED', json.dumps({'error': 'expired without a gateway result'}))
+                unknown += 1
+            else:
+                handle_callback(transaction_id, *result)
+                settled += 1
+        last_id = batch[-1][0]
+        yield settled, unknown
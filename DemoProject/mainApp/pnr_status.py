@@ -0,0 +1,105 @@
+"""Write-through cache of what the ticket page shows for a PNR.
+
+Every change to a ticket (booking, added passenger, cancellation, payment,
+chart preparation, archiving) rewrites its entry once the transaction
+commits, so PNR checks and ticket pages are served from the cache alone.
+Entries are plain dicts of strings, numbers and dates; an unknown PNR is
+cached as NOT_FOUND for PNR_NOT_FOUND_CACHE_SECONDS, until a ticket with
+that PNR is written.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import Http404
+
+from .models import ArchivedTicket, Ticket
+
+
+NOT_FOUND = 'not-found'
+
+
+def _key(pnr):
+    return f'pnr_status:{pnr}'
+
+
+def build(ticket, is_archived=False):
+    """Compact view of a ticket and its passengers"""
+    passengers = [
+        {
+            'name': passenger.name,
+            'age': passenger.age,
+            'gender': passenger.get_gender_display(),
+            'seat_class': passenger.seat_class,
+            'coach': passenger.coach.coach_number if passenger.coach else None,
+            'seat_number': passenger.seat_number,
+            'berth': passenger.get_berth_type_display() if passenger.berth_type else None,
+            'fare': passenger.fare,
+            'current_status': passenger.current_status,
+        }
+        for passenger in ticket.passengers.select_related('coach').order_by('id')
+    ]
+    train = ticket.schedule.train
+    return {
+        'pnr': ticket.pnr,
+        'booking_status': ticket.booking_status,
+        'booking_date': ticket.booking_date,
+        'total_fare': ticket.total_fare,
+        'fare_total': sum(passenger['fare'] for passenger in passengers),
+        'seat_classes': ticket.get_seat_classes(),
+        'train_name': train.name,
+        'train_number': train.train_number,
+        'train_type': train.get_train_type_display(),
+        'journey_date': ticket.schedule.journey_date,
+        'schedule_id': ticket.schedule_id,
+        'source_name': ticket.source_station.name if ticket.source_station else None,
+        'source_code': ticket.source_station.code if ticket.source_station else None,
+        'destination_name': ticket.destination_station.name if ticket.destination_station else None,
+        'destination_code': ticket.destination_station.code if ticket.destination_station else None,
+        'passengers': passengers,
+        'is_archived': is_archived,
+    }
+
+
+def load(pnr):
+    """Build the status of a live or archived ticket from the database; None if unknown"""
+    for model, is_archived in ((Ticket, False), (ArchivedTicket, True)):
+        ticket = model.objects.filter(pnr=pnr).select_related(
+            'schedule__train', 'source_station', 'destination_station'
+        ).first()
+        if ticket is not None:
+            return build(ticket, is_archived)
+    return None
+
+
+def get(pnr):
+    """Status for a PNR from the cache, loading it on a miss; raises Http404 for unknown PNRs"""
+    status = cache.get(_key(pnr))
+    if status is None:
+        status = load(pnr)
+        if status is None:
+            cache.set(_key(pnr), NOT_FOUND, timeout=settings.PNR_NOT_FOUND_CACHE_SECONDS)
+        else:
+            cache.set(_key(pnr), status, timeout=settings.PNR_STATUS_CACHE_SECONDS)
+    if status is None or status == NOT_FOUND:
+        raise Http404(f'No ticket found with PNR: {pnr}')
+    return status
+
+
+def refresh(*pnrs):
+    """Rewrite the entries of these PNRs from the database"""
+    for pnr in pnrs:
+        status = load(pnr)
+        if status is None:
+            cache.delete(_key(pnr))
+        else:
+            cache.set(_key(pnr), status, timeout=settings.PNR_STATUS_CACHE_SECONDS)
+
+
+def forget(*pnrs):
+    """Drop entries so the next read reloads them"""
+    cache.delete_many([_key(pnr) for pnr in pnrs])
+
+
+def refresh_on_commit(*pnrs):
+    """Rewrite the entries once the current transaction commits"""
+    transaction.on_commit(lambda: refresh(*pnrs))
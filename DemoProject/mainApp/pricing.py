@@ -0,0 +1,127 @@
+"""Flexi fares: class fares that rise with the occupancy of the class.
+
+Every (base fare, class) gets a price table with one fare per occupancy
+band in PRICING_BANDS, built once per process (and again if the setting
+changes, e.g. under override_settings). A quote then only needs the
+class's ScheduleInventory counters, which are read from shared memory when
+the schedule is there and otherwise cost one query per schedule. Quotes shown on the booking
+page are locked in the session for PRICE_LOCK_SECONDS, per schedule,
+journey and class, so the fare charged is the fare the user saw for that
+journey.
+"""
+import time
+from bisect import bisect_left
+from decimal import Decimal
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.signals import setting_changed
+
+from . import shared_inventory, topology
+from .models import ScheduleInventory
+
+CLASS_MULTIPLIERS = {
+    'GENERAL': Decimal('1.0'),
+    'SLEEPER': Decimal('1.5'),
+    'AC_3_TIER': Decimal('2.0'),
+    'AC_2_TIER': Decimal('3.0'),
+    'AC_1_TIER': Decimal('5.0'),
+    'FIRST_CLASS': Decimal('6.0'),
+}
+
+# Per-process copy of PRICING_BANDS, reloaded by load_bands()
+BAND_LIMITS = []
+BAND_MULTIPLIERS = []
+
+SESSION_KEY = 'price_locks'
+
+
+def route_fare(schedule, from_station, to_station):
+    """(base fare, tatkal charge) of a journey; the schedule's base fare if the route has no Fare"""
+    fare = topology.get().fare(schedule.train_id, from_station.id, to_station.id)
+    if fare is None:
+        return schedule.base_fare, Decimal('0')
+    return fare.base_fare, fare.tatkal_charge
+
+
+def class_fare(base_fare, seat_class):
+    """Fixed fare of a class, before any occupancy surcharge"""
+    return base_fare * CLASS_MULTIPLIERS.get(seat_class, Decimal('1.0'))
+
+
+@lru_cache(maxsize=4096)
+def price_table(base_fare, seat_class):
+    """Fare of a class in each occupancy band"""
+    fare = class_fare(base_fare, seat_class)
+    return tuple((fare * multiplier).quantize(Decimal('0.01')) for multiplier in BAND_MULTIPLIERS)
+
+
+def load_bands():
+    """Read PRICING_BANDS again and drop the price tables built from the old bands"""
+    BAND_LIMITS[:] = [limit for limit, _ in settings.PRICING_BANDS]
+    BAND_MULTIPLIERS[:] = [Decimal(multiplier) for _, multiplier in settings.PRICING_BANDS]
+    price_table.cache_clear()
+
+
+load_bands()
+
+
+def band(booked_seats, total_seats):
+    """Index of the occupancy band; a class without seats counts as full"""
+    occupancy = booked_seats / total_seats if total_seats else 1
+    return min(bisect_left(BAND_LIMITS, occupancy), len(BAND_LIMITS) - 1)
+
+
+def quote(base_fare, seat_class, total_seats, booked_seats):
+    return price_table(base_fare, seat_class)[band(booked_seats, total_seats)]
+
+
+def quote_schedule(schedule, base_fare):
+    """Current fare of every class of a schedule, {seat_class: fare}"""
+    return {
+        seat_class: quote(base_fare, seat_class, total, booked)
+        for seat_class, total, booked in schedule.seat_counters()
+    }
+
+
+def quote_class(schedule, seat_class, base_fare):
+    counters = shared_inventory.read_schedule(schedule.id)
+    if counters is not None and seat_class in counters:
+        return quote(base_fare, seat_class, *counters[seat_class])
+    row = ScheduleInventory.objects.filter(schedule=schedule, seat_class=seat_class).first()
+    if row is None:
+        return price_table(base_fare, seat_class)[0]
+    return quote(base_fare, seat_class, row.total_seats, row.booked_seats)
+
+
+def _lock_key(schedule, from_station, to_station, seat_class):
+    # Fares depend on the stations: a quote for one journey must not price another on the same run
+    return f'{schedule.id}:{from_station.id}:{to_station.id}:{seat_class}'
+
+
+def lock_quotes(request, schedule, from_station, to_station, quotes):
+    """Remember quoted fares of a journey in the session until PRICE_LOCK_SECONDS from now"""
+    now = time.time()
+    expires = now + settings.PRICE_LOCK_SECONDS
+    locks = {key: lock for key, lock in request.session.get(SESSION_KEY, {}).items() if lock[1] > now}
+    for seat_class, fare in quotes.items():
+        locks[_lock_key(schedule, from_station, to_station, seat_class)] = [str(fare), expires]
+    request.session[SESSION_KEY] = locks
+
+
+def locked_fare(request, schedule, from_station, to_station, seat_class):
+    """Fare locked for this journey and class, or None if it was never quoted or the lock ran out"""
+    lock = request.session.get(SESSION_KEY, {}).get(_lock_key(schedule, from_station, to_station, seat_class))
+    if lock is None or lock[1] <= time.time():
+        return None
+    return Decimal(lock[0])
+
+
+def _setting_changed(setting, **kwargs):
+    if setting == 'PRICING_BANDS':
+        load_bands()
+
+
+def connect_signals():
+    """Follow PRICING_BANDS when it changes, e.g. under override_settings"""
+    setting_changed.connect(_setting_changed, dispatch_uid='pricing_bands_changed')
@@ -0,0 +1,104 @@
+"""Opt-in sampling profiler for requests.
+
+A small fraction of requests (PROFILING_SAMPLE_RATE), or requests from
+staff carrying the PROFILING_HEADER header, are sampled: a background
+thread reads the request thread's stack every PROFILING_INTERVAL seconds.
+Samples are written as collapsed stacks ("frame;frame;frame count" lines,
+the input format of flamegraph.pl and speedscope) to one file per request
+under PROFILING_DIR/<url name>/. aggregate_profiles merges them per view.
+"""
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+
+
+def frame_label(frame):
+    code = frame.f_code
+    return f"{frame.f_globals.get('__name__', '?')}:{code.co_name}:{code.co_firstlineno}"
+
+
+class StackSampler:
+    """Counts the stacks a thread is in, sampled at a fixed interval"""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.counts
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(frame_label(frame))
+                frame = frame.f_back
+            if stack:
+                self.counts[';'.join(reversed(stack))] += 1
+
+
+def write_collapsed(path, counts):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w') as output:
+        for stack, count in counts.most_common():
+            output.write(f'{stack} {count}\n')
+
+
+def read_collapsed(path):
+    counts = Counter()
+    with open(path) as source:
+        for line in source:
+            stack, _, count = line.rstrip('\n').rpartition(' ')
+            if stack:
+                counts[stack] += int(count)
+    return counts
+
+
+class ProfilingMiddleware:
+    """Profile sampled requests and save their stacks per URL name"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.header = 'HTTP_' + settings.PROFILING_HEADER.upper().replace('-', '_')
+
+    def should_profile(self, request):
+        if not settings.PROFILING_ENABLED:
+            return False
+        if self.header in request.META:
+            # Anyone could send the header, so it only works for staff
+            return request.user.is_authenticated and request.user.is_staff
+        return random.random() < settings.PROFILING_SAMPLE_RATE
+
+    def __call__(self, request):
+        if not self.should_profile(request):
+            return self.get_response(request)
+
+        sampler = StackSampler(threading.get_ident(), settings.PROFILING_INTERVAL)
+        sampler.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            counts = sampler.stop()
+
+        match = request.resolver_match
+        url_name = (match.url_name if match else None) or 'unresolved'
+        if counts:
+            write_collapsed(
+                Path(settings.PROFILING_DIR) / url_name / f'{time.time_ns()}-{os.getpid()}.collapsed', counts
+            )
+        return response
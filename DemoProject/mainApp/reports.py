@@ -0,0 +1,38 @@
+"""Occupancy and revenue reports read from RevenueRollup only"""
+from django.db.models import Sum
+
+from .models import RevenueRollup
+
+REPORT_GROUPINGS = {
+    'train': ['train__train_number', 'train__name'],
+    'date': ['journey_date'],
+    'class': ['seat_class'],
+    'train-date': ['journey_date', 'train__train_number', 'train__name'],
+}
+
+
+def revenue_report(group_by='train', start=None, end=None, train_number=None):
+    """Totals per group, one row per group; cost depends on rollup rows, not tickets"""
+    rows = RevenueRollup.objects.all()
+    if start:
+        rows = rows.filter(journey_date__gte=start)
+    if end:
+        rows = rows.filter(journey_date__lte=end)
+    if train_number:
+        rows = rows.filter(train__train_number=train_number)
+
+    fields = REPORT_GROUPINGS[group_by]
+    report = []
+    for row in rows.values(*fields).annotate(
+        total_seats=Sum('seats'),
+        total_passengers=Sum('passengers'),
+        total_cancelled=Sum('cancelled_passengers'),
+        total_revenue=Sum('revenue'),
+        total_refunded=Sum('cancelled_revenue'),
+    ).order_by(*fields):
+        travelling = row['total_passengers'] - row['total_cancelled']
+        row['travelling'] = travelling
+        row['net_revenue'] = row['total_revenue'] - row['total_refunded']
+        row['occupancy'] = travelling / row['total_seats'] if row['total_seats'] else None
+        report.append(row)
+    return report
@@ -0,0 +1,98 @@
+"""Database routing between the primary and read replicas"""
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+# Set for the duration of a request (or block) whose reads must see the primary
+_use_primary = ContextVar('use_primary', default=False)
+# {'wrote': bool} of the current request; a dict so writes made in another
+# context (e.g. a sync view run from async code) still reach the middleware
+_request_writes = ContextVar('request_writes', default=None)
+
+PRIMARY = 'default'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+@contextmanager
+def use_primary():
+    """Send every read inside the block to the primary database"""
+    token = _use_primary.set(True)
+    try:
+        yield
+    finally:
+        _use_primary.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """Route writes to the primary and reads to a random replica.
+
+    Reads stay on the primary while a request is pinned (see
+    ReplicaPinningMiddleware) and inside transactions, so a booking never
+    checks availability against a lagging copy.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas or _use_primary.get() or connections[PRIMARY].in_atomic_block:
+            return PRIMARY
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        writes = _request_writes.get()
+        if writes is not None:
+            writes['wrote'] = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {PRIMARY, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive the schema through replication
+        return db not in settings.DATABASE_REPLICAS
+
+
+class ReplicaPinningMiddleware:
+    """Pin state-changing requests, and a client's reads shortly after them, to the primary.
+
+    The client is only pinned (with a cookie) when the request actually wrote
+    something. Keep this first in MIDDLEWARE so the session and auth
+    middleware's own reads and writes are covered as well.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        is_write = request.method not in SAFE_METHODS
+        pinned_until = request.COOKIES.get(settings.REPLICA_PIN_COOKIE)
+        try:
+            recently_wrote = pinned_until is not None and float(pinned_until) > time.time()
+        except ValueError:
+            recently_wrote = False
+
+        writes = {'wrote': False}
+        token = _use_primary.set(is_write or recently_wrote)
+        writes_token = _request_writes.set(writes)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_writes.reset(writes_token)
+            _use_primary.reset(token)
+
+        if writes['wrote']:
+            # Give the replicas time to catch up before this client reads from them again
+            response.set_cookie(
+                settings.REPLICA_PIN_COOKIE,
+                str(time.time() + settings.REPLICA_PIN_SECONDS),
+                max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
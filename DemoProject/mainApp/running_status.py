@@ -0,0 +1,239 @@
+"""Ingestion of running status (position and delay) updates for train runs.
+
+Updates arrive as JSON lines from a file, a TCP socket or a stand-in feed:
+
+    {"schedule_id": 12, "status": "RUNNING", "delay_minutes": 7, "station": "NDLS", "at": "2025-01-01T10:00:00"}
+
+A run may also be named by "train" (number) and "date" instead of
+"schedule_id". The Coalescer keeps only the newest update per schedule and
+writes a batch in one transaction, one conditional UPDATE per run that
+skips cancelled runs and newer stored statuses; each written change is
+then published to the schedule's live channel (see mainApp.live).
+"""
+import json
+import queue
+import random
+import socketserver
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import live, topology
+from .models import Station, TrainSchedule
+
+STATUSES = ['SCHEDULED', 'DELAYED', 'RUNNING', 'COMPLETED']  # Cancelling a run is done with cancel_train_run
+
+
+def channel(schedule_id):
+    return f'schedule:{schedule_id}'
+
+
+def parse(line):
+    """Update dict from a JSON line, or None if the line is not a usable update"""
+    try:
+        update = json.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(update, dict):
+        return None
+    if update.get('status') is not None and update['status'] not in STATUSES:
+        return None
+    if update.get('delay_minutes') is not None:
+        try:
+            update['delay_minutes'] = max(int(update['delay_minutes']), 0)
+        except (TypeError, ValueError):
+            return None
+    at = parse_datetime(update['at']) if isinstance(update.get('at'), str) else None
+    update['at'] = at or timezone.now()
+    if timezone.is_naive(update['at']):
+        update['at'] = timezone.make_aware(update['at'])
+    if 'schedule_id' in update:
+        try:
+            update['schedule_id'] = int(update['schedule_id'])
+        except (TypeError, ValueError):
+            return None
+    elif not ('train' in update and 'date' in update):
+        return None
+    return update
+
+
+def file_source(path, follow=False):
+    """Lines of a file; with follow, keep reading lines appended to it like tail -f.
+
+    Yields None while waiting so the caller can flush on time.
+    """
+    with open(path) as source:
+        while True:
+            line = source.readline()
+            if line:
+                yield line
+            elif follow:
+                time.sleep(0.1)
+                yield None
+            else:
+                return
+
+
+def socket_source(host, port):
+    """Lines sent by any number of TCP clients; yields None while waiting"""
+    lines = queue.Queue()
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                lines.put(line.decode('utf-8', 'replace'))
+
+    server = socketserver.ThreadingTCPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='running-status-listener', daemon=True).start()
+    try:
+        while True:
+            try:
+                yield lines.get(timeout=0.1)
+            except queue.Empty:
+                yield None
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def fake_source(rate=50, days=1):
+    """Stand-in feed: random delay and position updates for runs departing within `days` days"""
+    today = timezone.now().date()
+    runs = list(TrainSchedule.objects.filter(
+        journey_date__gte=today, journey_date__lte=today + timedelta(days=days)
+    ).exclude(status='CANCELLED').values_list('id', 'train_id'))
+    if not runs:
+        return
+    snapshot = topology.get()
+    delays = {}
+    while True:
+        schedule_id, train_id = random.choice(runs)
+        delays[schedule_id] = max(delays.get(schedule_id, 0) + random.randint(-3, 5), 0)
+        stops = snapshot.route(train_id)
+        station = snapshot.stations.get(random.choice(stops).station_id).code if stops else None
+        yield json.dumps({
+            'schedule_id': schedule_id,
+            'status': 'DELAYED' if delays[schedule_id] > 15 else 'RUNNING',
+            'delay_minutes': delays[schedule_id],
+            'station': station,
+            'at': timezone.now().isoformat(),
+        })
+        time.sleep(1 / rate)
+
+
+class Coalescer:
+    """Keeps the newest update per run and writes them in batches"""
+
+    def __init__(self, batch_size=None, flush_seconds=None):
+        self.batch_size = batch_size or settings.RUNNING_STATUS_BATCH_SIZE
+        self.flush_seconds = flush_seconds or settings.RUNNING_STATUS_FLUSH_SECONDS
+        self.pending = {}
+        self.received = 0
+        self.last_flush = time.monotonic()
+
+    def _key(self, update):
+        if 'schedule_id' in update:
+            return int(update['schedule_id'])
+        return (str(update['train']), str(update['date']))
+
+    def add(self, update):
+        self.received += 1
+        key = self._key(update)
+        current = self.pending.get(key)
+        if current is None or update['at'] >= current['at']:
+            # Fields a newer update leaves out keep their earlier value
+            self.pending[key] = {**(current or {}), **{k: v for k, v in update.items() if v is not None}}
+
+    def due(self):
+        return len(self.pending) >= self.batch_size or (
+            self.pending and time.monotonic() - self.last_flush >= self.flush_seconds
+        )
+
+    def _resolve(self, keys):
+        """{pending key: schedule} for the runs this batch talks about"""
+        ids = [key for key in keys if isinstance(key, int)]
+        schedules = TrainSchedule.objects.all()
+        resolved = {schedule.id: schedule for schedule in schedules.filter(id__in=ids)}
+        for key in keys:
+            if isinstance(key, tuple):
+                schedule = schedules.filter(
+                    train__train_number=key[0], journey_date=key[1]
+                ).first()
+                if schedule is not None:
+                    # The same run may also be pending under its id
+                    resolved[key] = resolved.setdefault(schedule.id, schedule)
+        return resolved
+
+    def flush(self):
+        """Write pending updates; returns the number of runs changed"""
+        batch, self.pending = self.pending, {}
+        self.last_flush = time.monotonic()
+        if not batch:
+            return 0
+
+        schedules = self._resolve(list(batch))
+        codes = {update['station'] for update in batch.values() if update.get('station')}
+        stations = {station.code: station for station in Station.objects.filter(code__in=codes)}
+        written = set()
+        with transaction.atomic():
+            for key, update in sorted(batch.items(), key=lambda item: item[1]['at']):
+                schedule = schedules.get(key)
+                if schedule is None:
+                    continue
+                # Only the fields the update carried
+                fields = {'status_updated_at': update['at']}
+                if update.get('status') is not None:
+                    fields['status'] = update['status']
+                if update.get('delay_minutes') is not None:
+                    fields['delay_minutes'] = update['delay_minutes']
+                if update.get('station') in stations:
+                    fields['last_station'] = stations[update['station']]
+                # Checked by the UPDATE itself: the run may have been cancelled or
+                # updated since it was read
+                if TrainSchedule.objects.filter(
+                    Q(status_updated_at__isnull=True) | Q(status_updated_at__lt=update['at']), id=schedule.id
+                ).exclude(status='CANCELLED').update(**fields):
+                    written.add(schedule.id)
+
+            changed = list(TrainSchedule.objects.select_related('last_station').filter(id__in=written))
+            transaction.on_commit(lambda: [publish(schedule) for schedule in changed])
+        return len(changed)
+
+
+def state(schedule):
+    """What live pages show about a run"""
+    station = schedule.last_station
+    return {
+        'schedule_id': schedule.id,
+        'status': schedule.status,
+        'status_display': schedule.get_status_display(),
+        'delay_minutes': schedule.delay_minutes,
+        'station': station.code if station else None,
+        'station_name': station.name if station else None,
+        'updated_at': schedule.status_updated_at.isoformat() if schedule.status_updated_at else None,
+    }
+
+
+def publish(schedule):
+    live.publish(channel(schedule.id), state(schedule))
+
+
+def ingest(lines, coalescer):
+    """Feed lines (None = idle tick) through the coalescer; yields (received, written) after each flush"""
+    for line in lines:
+        if line is not None:
+            update = parse(line)
+            if update is not None:
+                coalescer.add(update)
+        if coalescer.due():
+            written = coalescer.flush()
+            yield coalescer.received, written
+    if coalescer.pending:
+        yield coalescer.received, coalescer.flush()
@@ -0,0 +1,122 @@
+"""Per-coach seat availability pushed to open booking pages.
+
+Every committed change to a schedule's seat counters calls changed(). The
+first change of a schedule within SEAT_UPDATES_TICK_SECONDS (across
+processes, through an atomic cache add()) queues it for this process's
+flusher thread, which publishes once at the end of the tick, so a rush of
+bookings becomes a single query and a single message. The message is a
+delta: the coaches whose availability differs from the last published
+state, with their new absolute counts, so a message that is replayed twice
+does no harm. With SEAT_UPDATES_BACKGROUND off (tests) there is no thread
+and changed() publishes at once.
+
+Per-coach counts are cached under the schedule's inventory version, which
+every counter change bumps, so booking pages only count passengers again
+after something changed.
+"""
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.db.models import Count
+
+from . import cache_tier, inventory, live, topology
+from .cache_backends import coordination
+from .fragments import get_inventory_versions
+from .models import Passenger, TrainSchedule
+
+logger = logging.getLogger(__name__)
+
+def channel(schedule_id):
+    return f'seats:{schedule_id}'
+
+
+def _pending_key(schedule_id):
+    return f'seat_updates:pending:{schedule_id}'
+
+
+def _published_key(schedule_id):
+    return f'seat_updates:published:{schedule_id}'
+
+
+def _count_coach_availability(schedule_id, train_id):
+    booked = dict(
+        Passenger.objects.filter(ticket__schedule_id=schedule_id, current_status__in=inventory.BOOKED_STATUSES)
+        .values_list('coach_id').annotate(n=Count('id'))
+    )
+    return {
+        coach.id: max(coach.total_seats - booked.get(coach.id, 0), 0)
+        for coach in topology.get().train_coaches(train_id)
+    }
+
+
+def coach_availability(schedule_id, train_id):
+    """{coach id: seats left on this schedule} for every coach of the train"""
+    version = get_inventory_versions([schedule_id])[schedule_id]
+    return cache_tier.get_or_compute(
+        f'coach_availability:{schedule_id}:{version}',
+        lambda: _count_coach_availability(schedule_id, train_id),
+        timeout=settings.SCHEDULE_CARD_CACHE_SECONDS,
+    )
+
+
+def publish_changes(schedule_id):
+    """Publish the coaches whose availability changed since the last message; returns them"""
+    train_id = TrainSchedule.objects.filter(id=schedule_id).values_list('train_id', flat=True).first()
+    if train_id is None:
+        return {}
+    current = coach_availability(schedule_id, train_id)
+    published = cache.get(_published_key(schedule_id), {})
+    delta = {coach_id: available for coach_id, available in current.items() if published.get(coach_id) != available}
+    cache.set(_published_key(schedule_id), current, timeout=settings.LIVE_EVENT_TTL)
+    if delta:
+        live.publish(channel(schedule_id), {'schedule_id': schedule_id, 'coaches': delta})
+    return delta
+
+
+_pending = set()
+_pending_lock = threading.Lock()
+_flusher = None
+
+
+def flush():
+    """Publish every schedule queued in this process since the last tick"""
+    global _pending
+    with _pending_lock:
+        schedule_ids, _pending = _pending, set()
+    for schedule_id in schedule_ids:
+        coordination.delete(_pending_key(schedule_id))
+        try:
+            publish_changes(schedule_id)
+        except Exception:
+            logger.exception('Publishing seat availability of schedule %s failed', schedule_id)
+
+
+def _flush_every_tick():
+    while True:
+        time.sleep(settings.SEAT_UPDATES_TICK_SECONDS)
+        try:
+            flush()
+        finally:
+            close_old_connections()
+
+
+def changed(schedule_id):
+    """Note a committed change; the first one per tick (across processes) queues a publish"""
+    global _flusher
+    if not coordination.add(_pending_key(schedule_id), 1, timeout=settings.SEAT_UPDATES_TICK_SECONDS * 10):
+        return
+    with _pending_lock:
+        _pending.add(schedule_id)
+        background = settings.SEAT_UPDATES_BACKGROUND
+        if background and _flusher is None:
+            # A daemon does not hold up exit; commands still publish what is queued when they end
+            _flusher = threading.Thread(target=_flush_every_tick, name='seat-updates', daemon=True)
+            _flusher.start()
+            atexit.register(flush)
+    if not background:
+        flush()
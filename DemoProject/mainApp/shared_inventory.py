@@ -0,0 +1,263 @@
+"""Seat counters of upcoming schedules in a memory-mapped file shared by all workers on a host.
+
+ScheduleInventory in the database stays the source of truth. After every
+committed counter change the schedule's rows are copied here (see
+mainApp.inventory), and sync_shared_inventory rebuilds the whole table, so
+availability on schedule_list and book_ticket is read from memory by every
+worker process instead of being queried.
+
+Layout: a 64-byte header (magic, layout version, slot count, generation)
+followed by an open-addressing hash table of fixed-size slots keyed by
+(schedule id, class). Writers take an fcntl lock on the byte range of the
+slot they change (and a thread lock, as fcntl locks belong to the process);
+a rebuild locks the whole file. Readers take no locks: each slot carries a
+sequence number that is odd while it is being written and the header
+generation is odd during a rebuild, so a reader that sees either change
+retries and finally falls back to the database.
+
+Each slot also keeps the version of the ScheduleInventory row it was copied
+from, and a write only replaces a slot holding an older version, so a slow
+sync cannot put back counts that a faster one already replaced. Slots of
+schedules whose journey date has passed are reused for new ones.
+"""
+import contextlib
+import mmap
+import os
+import struct
+import threading
+from datetime import date
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; everything falls back to the database
+    fcntl = None
+
+MAGIC = b'SINV'
+LAYOUT_VERSION = 2
+HEADER = struct.Struct('<4sIIQ')  # magic, layout version, slot count, generation
+HEADER_SIZE = 64
+# sequence, schedule id, class code, classes in the schedule, total seats, booked seats,
+# ScheduleInventory version, journey date (ordinal)
+SLOT = struct.Struct('<IqBB2xiiqi4x')
+
+SEAT_CLASSES = ['GENERAL', 'SLEEPER', 'AC_3_TIER', 'AC_2_TIER', 'AC_1_TIER', 'FIRST_CLASS']
+CLASS_CODES = {seat_class: code for code, seat_class in enumerate(SEAT_CLASSES, start=1)}
+
+READ_ATTEMPTS = 3
+# Give up on a key after this many occupied slots; the database answers instead
+MAX_PROBES = 64
+
+
+class SharedInventory:
+    """The mapped table; one instance per process"""
+
+    def __init__(self, path, slot_count):
+        self.slot_count = slot_count
+        self.size = HEADER_SIZE + slot_count * SLOT.size
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        self.thread_lock = threading.Lock()
+        fcntl.lockf(self.fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self.fd).st_size != self.size:
+                os.ftruncate(self.fd, self.size)
+            self.map = mmap.mmap(self.fd, self.size)
+            magic, version, slots, _ = HEADER.unpack_from(self.map, 0)
+            if (magic, version, slots) != (MAGIC, LAYOUT_VERSION, slot_count):
+                self.map[:] = bytes(self.size)
+                HEADER.pack_into(self.map, 0, MAGIC, LAYOUT_VERSION, slot_count, 0)
+        finally:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN)
+
+    def _generation(self):
+        return HEADER.unpack_from(self.map, 0)[3]
+
+    def _set_generation(self, generation):
+        HEADER.pack_into(self.map, 0, MAGIC, LAYOUT_VERSION, self.slot_count, generation)
+
+    def _offset(self, index):
+        return HEADER_SIZE + index * SLOT.size
+
+    def _probe(self, schedule_id, code):
+        start = ((schedule_id * 8 + code) * 2654435761) % self.slot_count
+        for step in range(min(MAX_PROBES, self.slot_count)):
+            yield (start + step) % self.slot_count
+
+    def _read_slot(self, offset):
+        """Consistent (schedule id, code, class count, total, booked, version, day), or None if it kept changing"""
+        for _ in range(READ_ATTEMPTS):
+            sequence, *slot = SLOT.unpack_from(self.map, offset)
+            if sequence % 2 == 0 and SLOT.unpack_from(self.map, offset)[0] == sequence:
+                return slot
+        return None
+
+    def read(self, schedule_id):
+        """{seat_class: (total, booked)} of a schedule, or None if it is not (fully) in the table"""
+        generation = self._generation()
+        if generation % 2:
+            return None
+        counters = {}
+        classes = None
+        for seat_class, code in CLASS_CODES.items():
+            if classes is not None and len(counters) == classes:
+                break
+            for index in self._probe(schedule_id, code):
+                slot = self._read_slot(self._offset(index))
+                if slot is None:
+                    return None
+                if slot[0] == schedule_id and slot[1] == code:
+                    classes = slot[2]
+                    counters[seat_class] = (slot[3], slot[4])
+                    break
+                if slot[1] == 0:
+                    break
+        if classes is None or len(counters) != classes or self._generation() != generation:
+            return None
+        return counters
+
+    def _write_slot(self, offset, schedule_id, code, classes, total, booked, version, day):
+        sequence = SLOT.unpack_from(self.map, offset)[0]
+        SLOT.pack_into(self.map, offset, sequence + 1, schedule_id, code, classes, total, booked, version, day)
+        struct.pack_into('<I', self.map, offset, sequence + 2)
+
+    def _write_class(self, schedule_id, code, classes, total, booked, version, day, today, locked):
+        """Store one class; a slot already holding it is only replaced by a newer version"""
+        # Usually the class has its slot already: lock just that slot
+        for index in self._probe(schedule_id, code):
+            offset = self._offset(index)
+            if not locked:
+                fcntl.lockf(self.fd, fcntl.LOCK_EX, SLOT.size, offset)
+            try:
+                _, slot_schedule, slot_code, _, _, _, slot_version, _ = SLOT.unpack_from(self.map, offset)
+                if (slot_schedule, slot_code) == (schedule_id, code):
+                    if slot_version < version:
+                        self._write_slot(offset, schedule_id, code, classes, total, booked, version, day)
+                    return True
+                if slot_code == 0:
+                    break
+            finally:
+                if not locked:
+                    fcntl.lockf(self.fd, fcntl.LOCK_UN, SLOT.size, offset)
+
+        # First write of the class: insert under the file lock, so no other writer inserts it as well.
+        # Slots of past journeys count as free; they stay occupied until then, so later probes still work.
+        if not locked:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX)
+        try:
+            free = None
+            for index in self._probe(schedule_id, code):
+                offset = self._offset(index)
+                _, slot_schedule, slot_code, _, _, _, slot_version, slot_day = SLOT.unpack_from(self.map, offset)
+                if (slot_schedule, slot_code) == (schedule_id, code):
+                    if slot_version >= version:
+                        return True  # Inserted meanwhile, with counts at least as new
+                    free = offset
+                    break
+                if free is None and (slot_code == 0 or slot_day < today):
+                    free = offset
+                if slot_code == 0:
+                    break
+            if free is None:
+                return False
+            self._write_slot(free, schedule_id, code, classes, total, booked, version, day)
+            return True
+        finally:
+            if not locked:
+                fcntl.lockf(self.fd, fcntl.LOCK_UN)
+
+    def write(self, schedule_id, journey_date, counters, locked=False):
+        """Store {seat_class: (total, booked, version)} for a schedule; False if a class found no slot"""
+        counters = {seat_class: value for seat_class, value in counters.items() if seat_class in CLASS_CODES}
+        day, today = journey_date.toordinal(), date.today().toordinal()
+        stored = True
+        with self.thread_lock if not locked else _NO_LOCK:
+            for seat_class, (total, booked, version) in counters.items():
+                stored &= self._write_class(
+                    schedule_id, CLASS_CODES[seat_class], len(counters), total, booked, version, day, today, locked
+                )
+        return stored
+
+    def rebuild(self, rows):
+        """Replace the whole table with rows of (schedule id, journey date, {seat_class: (total, booked, version)})"""
+        with self.thread_lock:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX)
+            try:
+                # Counts synced after the rows were read are newer than them: keep those
+                current = {}
+                for index in range(self.slot_count):
+                    _, schedule_id, code, _, total, booked, version, _ = SLOT.unpack_from(self.map, self._offset(index))
+                    if code:
+                        current[schedule_id, code] = (total, booked, version)
+                generation = self._generation()
+                self._set_generation(generation + 1)
+                self.map[HEADER_SIZE:] = bytes(self.size - HEADER_SIZE)
+                stored = 0
+                for schedule_id, journey_date, counters in rows:
+                    counters = {
+                        seat_class: max(value, current.get((schedule_id, CLASS_CODES.get(seat_class)), value),
+                                        key=lambda counts: counts[2])
+                        for seat_class, value in counters.items()
+                    }
+                    stored += self.write(schedule_id, journey_date, counters, locked=True)
+                self._set_generation(generation + 2)
+            finally:
+                fcntl.lockf(self.fd, fcntl.LOCK_UN)
+        return stored
+
+
+_NO_LOCK = contextlib.nullcontext()
+_table = None
+
+
+def get_table():
+    """This process's mapping of the table, or None when sharing is off or unsupported"""
+    global _table
+    if _table is None and fcntl is not None and settings.SHARED_INVENTORY_ENABLED:
+        _table = SharedInventory(settings.SHARED_INVENTORY_PATH, settings.SHARED_INVENTORY_SLOTS)
+    return _table
+
+
+def read_schedule(schedule_id):
+    table = get_table()
+    return table.read(schedule_id) if table is not None else None
+
+
+def _counters_by_schedule(queryset):
+    """{schedule id: (journey date, {seat_class: (total, booked, version)})}"""
+    counters = {}
+    for schedule_id, journey_date, seat_class, total, booked, version in queryset.values_list(
+        'schedule_id', 'schedule__journey_date', 'seat_class', 'total_seats', 'booked_seats', 'version'
+    ):
+        counters.setdefault(schedule_id, (journey_date, {}))[1][seat_class] = (total, booked, version)
+    return counters
+
+
+def sync_schedule(schedule_id):
+    """Copy one schedule's counters from the database into the table"""
+    table = get_table()
+    if table is None:
+        return
+    from .models import ScheduleInventory
+    counters = _counters_by_schedule(ScheduleInventory.objects.filter(schedule_id=schedule_id))
+    if schedule_id in counters:
+        table.write(schedule_id, *counters[schedule_id])
+
+
+def sync_upcoming(days):
+    """Rebuild the table from the counters of every schedule departing in the next `days` days"""
+    table = get_table()
+    if table is None:
+        return None
+    from datetime import timedelta
+
+    from django.utils import timezone
+
+    from .models import ScheduleInventory
+    today = timezone.now().date()
+    counters = _counters_by_schedule(ScheduleInventory.objects.filter(
+        schedule__journey_date__gte=today,
+        schedule__journey_date__lte=today + timedelta(days=days),
+    ))
+    return table.rebuild((schedule_id, *row) for schedule_id, row in counters.items())
@@ -0,0 +1,112 @@
+"""Tatkal booking window and the admission queue (virtual waiting room) in front of it"""
+import time
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .cache_backends import coordination
+
+
+def tatkal_window(schedule):
+    """Return (opens_at, closes_at) for a schedule's tatkal window.
+
+    Tatkal opens at TATKAL_OPEN_TIME on the day before the journey and
+    stays open until the journey day starts.
+    """
+    open_time = datetime.strptime(settings.TATKAL_OPEN_TIME, '%H:%M').time()
+    opens_at = timezone.make_aware(
+        datetime.combine(schedule.journey_date - timedelta(days=1), open_time)
+    )
+    closes_at = timezone.make_aware(datetime.combine(schedule.journey_date, datetime.min.time()))
+    return opens_at, closes_at
+
+
+def is_tatkal_open(schedule, now=None):
+    """Check whether the tatkal window of a schedule is currently open"""
+    now = now or timezone.now()
+    opens_at, closes_at = tatkal_window(schedule)
+    return opens_at <= now < closes_at
+
+
+class TatkalQueue:
+    """FIFO admission queue for one schedule's tatkal window.
+
+    Every arrival is handed the next admission slot from a shared virtual
+    clock (GCRA): slots are spaced 1/rate seconds apart, with up to `burst`
+    users let straight in when the queue is idle. Slots are assigned under a
+    short cache lock in arrival order, so admission order is arrival order
+    and nobody is admitted faster than the seat allocator can sustain.
+
+    The lock is a cache add(), so the store must make add() atomic across
+    every worker (see CACHES in settings); with a per-process cache each
+    worker would run its own queue. Both live in the coordination cache,
+    where a cull cannot reset the queue to a fresh burst.
+    """
+
+    def __init__(self, schedule_id, rate=None, burst=None, store=None, clock=time.time):
+        self.schedule_id = schedule_id
+        self.rate = rate or settings.TATKAL_ADMIT_RATE
+        self.burst = settings.TATKAL_ADMIT_BURST if burst is None else burst
+        self.store = store or coordination
+        self.clock = clock
+        self.key = f'tatkal:{schedule_id}'
+
+    def _acquire(self):
+        while not self.store.add(f'{self.key}:lock', 1, timeout=5):
+            time.sleep(0.001)
+
+    def _release(self):
+        self.store.delete(f'{self.key}:lock')
+
+    def join(self):
+        """Take a queue token; returns (token, admit_at) where admit_at is a unix timestamp"""
+        interval = 1.0 / self.rate
+        tolerance = self.burst * interval
+        self._acquire()
+        try:
+            now = self.clock()
+            state = self.store.get(f'{self.key}:state') or {'next_token': 1, 'tat': now}
+            token = state['next_token']
+            admit_at = max(now, state['tat'] - tolerance)
+            state['next_token'] = token + 1
+            state['tat'] = max(now, state['tat']) + interval
+            self.store.set(f'{self.key}:state', state, timeout=settings.TATKAL_QUEUE_TTL)
+        finally:
+            self._release()
+        return token, admit_at
+
+    def wait_seconds(self, admit_at):
+        """Seconds until a token with the given admission time may book"""
+        return max(0.0, admit_at - self.clock())
+
+    def position(self, admit_at):
+        """Approximate number of users still ahead of a token"""
+        return int(self.wait_seconds(admit_at) * self.rate)
+
+
+def get_admission(request, schedule):
+    """Return the tatkal admission stored in the session for a schedule, if any"""
+    admission = request.session.get('tatkal_admissions', {}).get(str(schedule.id))
+    if admission and admission['admit_at'] + settings.TATKAL_ADMISSION_TTL < time.time():
+        # Admission expired without a completed booking; the user must queue again
+        return None
+    return admission
+
+
+def join_queue(request, schedule):
+    """Queue the current user for a schedule's tatkal window and remember the token in the session"""
+    admission = get_admission(request, schedule)
+    if admission is None:
+        token, admit_at = TatkalQueue(schedule.id).join()
+        admission = {'token': token, 'admit_at': admit_at}
+        admissions = request.session.get('tatkal_admissions', {})
+        admissions[str(schedule.id)] = admission
+        request.session['tatkal_admissions'] = admissions
+    return admission
+
+
+def is_admitted(request, schedule):
+    """Check whether the current user has been let through the waiting room"""
+    admission = get_admission(request, schedule)
+    return admission is not None and admission['admit_at'] <= time.time()
@@ -1,3 +1,1284 @@
-from django.test import TestCase
+import json
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from unittest import mock, skipIf
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import AnonymousUser, Permission, User
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.http import Http404, HttpResponse
+from django.db import close_old_connections, transaction
+from django.urls import reverse
+from django.utils import timezone
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+
+from . import (
+    archive, autocomplete, cache_tier, cancellation, chart_preparation, charts, forecasting, inventory, live, outbox,
+    payments, pnr_status, pricing, profiling, reports, routers, running_status, seat_updates, shared_inventory,
+    throttling, timetable_import, topology, warmup,
+)
+from . import fragments
+from .fragments import bump_inventory_version
+from .idempotency import idempotent, retryable
+from .models import (
+    ArchivedPassenger, ArchivedPayment, ArchivedTicket, Coach, DemandForecast, Fare, OutboxEvent, Passenger, Payment,
+    ProjectionCheckpoint, RevenueRollup, ScheduleInventory, Station, Ticket, Train, TrainRoute, TrainSchedule,
+)
+from .tatkal import TatkalQueue
+
+TEST_DIR = tempfile.mkdtemp(prefix='mainapp-tests-')
+
+TEST_CACHES = {
+    'default': {
+        'BACKEND': 'mainApp.cache_backends.LockingFileBasedCache',
+        'LOCATION': os.path.join(TEST_DIR, 'cache'),
+    },
+    'coordination': {
+        'BACKEND': 'mainApp.cache_backends.LockingFileBasedCache',
+        'LOCATION': os.path.join(TEST_DIR, 'cache', 'coordination'),
+        'OPTIONS': {'MAX_ENTRIES': 0},
+    },
+    'throttle': {
+        'BACKEND': 'mainApp.cache_backends.LockingFileBasedCache',
+        'LOCATION': os.path.join(TEST_DIR, 'cache', 'throttle'),
+    },
+    'local': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'mainapp-tests-local',
+    },
+}
+
+
+def run_threads(count, target, *args):
+    """Start count threads on target at once and wait for them; returns their results"""
+    results = [None] * count
+    barrier = threading.Barrier(count)
+
+    def run(index):
+        barrier.wait()
+        results[index] = target(*args)
+
+    threads = [threading.Thread(target=run, args=[index]) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def make_train(number='12001', sleeper_coaches=2, seats_per_coach=10, days_ahead=10):
+    """Train A -> B -> C with sleeper coaches, an AC 3 tier coach, fares and one schedule"""
+    stations = [
+        Station.objects.create(code=f'{code}{number}', name=f'Station {code}', city=code, state='S')
+        for code in 'ABC'
+    ]
+    train = Train.objects.create(train_number=number, name=f'Train {number}', total_seats=1)
+    for index in range(sleeper_coaches):
+        Coach.objects.create(
+            train=train, coach_number=f'S{index + 1}', coach_type='SLEEPER',
+            total_seats=seats_per_coach, total_lower=seats_per_coach,
+        )
+    Coach.objects.create(train=train, coach_number='B1', coach_type='AC_3_TIER', total_seats=8, total_lower=8)
+    for sequence, station in enumerate(stations, start=1):
+        TrainRoute.objects.create(
+            train=train, station=station, sequence_number=sequence, distance_from_source=(sequence - 1) * 100
+        )
+    for source, destination, distance in [(0, 1, 100), (1, 2, 100), (0, 2, 200)]:
+        Fare.objects.create(
+            train=train, source_station=stations[source], destination_station=stations[destination],
+            distance=distance, base_fare=distance * 2,
+        )
+    schedule = TrainSchedule.objects.create(train=train, journey_date=date.today() + timedelta(days=days_ahead))
+    return train, stations, schedule
+
+
+def book(schedule, stations, seat_class='SLEEPER', passengers=1, reserve=True, **ticket_fields):
+    """Ticket with passengers on a schedule, taking seats from the counters like book_ticket does"""
+    ticket = Ticket.objects.create(
+        schedule=schedule, passenger_name='Test', seat_class=seat_class,
+        source_station=stations[0], destination_station=stations[-1], **ticket_fields,
+    )
+    coach = Coach.objects.filter(train=schedule.train, coach_type=seat_class).first()
+    for index in range(passengers):
+        if reserve:
+            inventory.reserve_seats(schedule, seat_class)
+        Passenger.objects.create(
+            ticket=ticket, name=f'P{index}', age=30, gender='M', seat_class=seat_class, fare=100, coach=coach
+        )
+    return ticket
+
+
+def counters(schedule):
+    return {row.seat_class: (row.total_seats, row.booked_seats) for row in schedule.inventory.all()}
+
+
+TEST_SETTINGS = dict(
+    CACHES=TEST_CACHES,
+    SHARED_INVENTORY_PATH=os.path.join(TEST_DIR, 'seat-inventory.bin'),
+    SHARED_INVENTORY_SLOTS=1024,
+    SEAT_UPDATES_BACKGROUND=False,  # No flusher thread left writing after the test database is gone
+)
+
+
+@override_settings(**TEST_SETTINGS)
+class MainAppTestCase(TestCase):
+    databases = {'default'}
+
+    def setUp(self):
+        for alias in TEST_CACHES:
+            caches[alias].clear()
+        if shared_inventory.get_table() is not None:
+            shared_inventory.get_table().rebuild([])
+
+
+class LockingFileBasedCacheTests(MainAppTestCase):
+    def test_only_one_concurrent_add_wins(self):
+        results = run_threads(16, caches['default'].add, 'lock', 1, 30)
+        self.assertEqual(results.count(True), 1)
+
+    def test_concurrent_incr_loses_no_update(self):
+        cache = caches['default']
+        cache.set('counter', 0, timeout=None)
+        run_threads(8, lambda: [cache.incr('counter') for _ in range(25)])
+        self.assertEqual(cache.get('counter'), 200)
+
+    def test_incr_keeps_the_expiry(self):
+        cache = caches['default']
+        cache.set('counter', 1, timeout=None)
+        cache.incr('counter')
+        with open(cache._key_to_file('counter'), 'rb') as f:
+            self.assertIsNone(pickle.load(f))  # Still never expires
+
+    def test_incr_of_missing_or_expired_key_raises(self):
+        cache = caches['default']
+        with self.assertRaises(ValueError):
+            cache.incr('missing')
+        cache.set('short', 1, timeout=0.01)
+        time.sleep(0.05)
+        with self.assertRaises(ValueError):
+            cache.incr('short')
+
+
+    def test_coordination_cache_is_never_culled(self):
+        with override_settings(CACHES={
+            'default': dict(TEST_CACHES['default'], OPTIONS={'MAX_ENTRIES': 10, 'CULL_FREQUENCY': 2}),
+            'coordination': TEST_CACHES['coordination'],
+        }):
+            for index in range(30):
+                caches['default'].set(f'page:{index}', index)
+                caches['coordination'].set(f'lock:{index}', index)
+            self.assertLess(sum(caches['default'].has_key(f'page:{index}') for index in range(30)), 30)
+            self.assertEqual(caches['coordination'].get_many([f'lock:{index}' for index in range(30)]),
+                             {f'lock:{index}': index for index in range(30)})
+
+class CacheTierTests(MainAppTestCase):
+    def test_concurrent_misses_compute_once(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'value'
+
+        results = run_threads(8, cache_tier.get_or_compute, 'key', compute, 60)
+        self.assertEqual(results, ['value'] * 8)
+        self.assertEqual(len(calls), 1)
+
+    def test_delete_forces_a_recompute(self):
+        self.assertEqual(cache_tier.get_or_compute('key', lambda: 1, 60), 1)
+        self.assertEqual(cache_tier.get_or_compute('key', lambda: 2, 60), 1)
+        cache_tier.delete('key')
+        self.assertEqual(cache_tier.get_or_compute('key', lambda: 2, 60), 2)
+
+
+class TatkalQueueTests(MainAppTestCase):
+    def test_concurrent_arrivals_get_distinct_tokens_in_admission_order(self):
+        queue = TatkalQueue(1, rate=10, burst=0, clock=lambda: 1000.0)
+        tickets = sorted(run_threads(20, queue.join))
+        self.assertEqual([token for token, _ in tickets], list(range(1, 21)))
+        admit_times = [admit_at for _, admit_at in tickets]
+        self.assertEqual(admit_times, sorted(admit_times))
+        self.assertAlmostEqual(admit_times[-1] - admit_times[0], 1.9)
+
+    def test_burst_is_let_straight_in(self):
+        queue = TatkalQueue(1, rate=10, burst=5, clock=lambda: 1000.0)
+        admit_times = [queue.join()[1] for _ in range(8)]
+        self.assertEqual([round(admit_at, 6) for admit_at in admit_times], [1000.0] * 6 + [1000.1, 1000.2])
+
+
+class IdempotencyTests(MainAppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.calls = []
+
+        @idempotent
+        def view(request):
+            self.calls.append(1)
+            time.sleep(0.1)
+            return HttpResponse(f'done {len(self.calls)}')
+
+        self.view = view
+
+    def post(self, key='k1'):
+        request = RequestFactory().post('/book/', {'idempotency_key': key})
+        request.user = AnonymousUser()
+        return self.view(request)
+
+    def test_repeat_is_replayed(self):
+        first = self.post()
+        second = self.post()
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(len(self.calls), 1)
+
+    def test_concurrent_repeats_run_the_view_once(self):
+        responses = run_threads(6, self.post)
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual({response.content for response in responses}, {b'done 1'})
+
+    def test_failure_marked_retryable_is_not_replayed(self):
+        @idempotent
+        def view(request):
+            self.calls.append(1)
+            return retryable(HttpResponse(status=302)) if len(self.calls) == 1 else HttpResponse('booked')
+
+        self.view = view
+        self.assertEqual(self.post().status_code, 302)
+        self.assertEqual(self.post().content, b'booked')
+        self.assertEqual(self.post()['Idempotent-Replayed'], 'true')
+
+    def test_other_keys_run_the_view(self):
+        self.post('k1')
+        self.post('k2')
+        self.assertEqual(len(self.calls), 2)
+
+
+class SharedInventoryTests(MainAppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.table = shared_inventory.SharedInventory(os.path.join(TEST_DIR, 'small.bin'), 8)
+        self.table.rebuild([])
+        self.day = date.today() + timedelta(days=3)
+
+    def test_older_version_does_not_replace_newer(self):
+        self.table.write(1, self.day, {'SLEEPER': (20, 5, 2)})
+        self.table.write(1, self.day, {'SLEEPER': (20, 4, 1)})
+        self.assertEqual(self.table.read(1), {'SLEEPER': (20, 5)})
+        self.table.write(1, self.day, {'SLEEPER': (20, 6, 3)})
+        self.assertEqual(self.table.read(1), {'SLEEPER': (20, 6)})
+
+    def test_concurrent_writers_leave_the_newest_version(self):
+        versions = iter(range(1, 101))
+        lock = threading.Lock()
+
+        def write():
+            for _ in range(25):
+                with lock:
+                    version = next(versions)
+                self.table.write(1, self.day, {'SLEEPER': (100, version, version)})
+
+        run_threads(4, write)
+        self.assertEqual(self.table.read(1), {'SLEEPER': (100, 100)})
+
+    def test_slots_of_past_journeys_are_reused(self):
+        past = date.today() - timedelta(days=1)
+        for schedule_id in range(1, 9):
+            self.assertTrue(self.table.write(schedule_id, past, {'SLEEPER': (10, 1, 1)}))
+        self.assertTrue(self.table.write(100, self.day, {'SLEEPER': (10, 2, 1)}))
+        self.assertEqual(self.table.read(100), {'SLEEPER': (10, 2)})
+
+    def test_full_table_of_upcoming_journeys_refuses_new_schedules(self):
+        for schedule_id in range(1, 9):
+            self.table.write(schedule_id, self.day, {'SLEEPER': (10, 1, 1)})
+        self.assertFalse(self.table.write(100, self.day, {'SLEEPER': (10, 2, 1)}))
+        self.assertIsNone(self.table.read(100))
+
+    def test_rebuild_keeps_counts_synced_after_its_rows_were_read(self):
+        self.table.write(1, self.day, {'SLEEPER': (20, 7, 5)})
+        self.table.rebuild([(1, self.day, {'SLEEPER': (20, 6, 4)}), (2, self.day, {'SLEEPER': (10, 0, 0)})])
+        self.assertEqual(self.table.read(1), {'SLEEPER': (20, 7)})
+        self.assertEqual(self.table.read(2), {'SLEEPER': (10, 0)})
+
+    def test_sync_copies_database_counters(self):
+        _, _, schedule = make_train()
+        self.assertTrue(inventory.reserve_seats(schedule, 'SLEEPER', 3))
+        shared_inventory.sync_schedule(schedule.id)
+        self.assertEqual(shared_inventory.read_schedule(schedule.id), {'SLEEPER': (20, 3), 'AC_3_TIER': (8, 0)})
+
+
+class ScheduleInventoryTests(MainAppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.train, self.stations, self.schedule = make_train()
+
+    def test_counters_are_created_per_class(self):
+        self.assertEqual(counters(self.schedule), {'SLEEPER': (20, 0), 'AC_3_TIER': (8, 0)})
+
+    def test_reserve_stops_at_capacity(self):
+        self.assertTrue(inventory.reserve_seats(self.schedule, 'AC_3_TIER', 8))
+        self.assertFalse(inventory.reserve_seats(self.schedule, 'AC_3_TIER'))
+        inventory.release_seats(self.schedule, {'AC_3_TIER': 1})
+        self.assertTrue(inventory.reserve_seats(self.schedule, 'AC_3_TIER'))
+
+    def test_coach_changes_resize_upcoming_schedules(self):
+        past = TrainSchedule.objects.create(train=self.train, journey_date=date.today() - timedelta(days=1))
+        coach = Coach.objects.create(train=self.train, coach_number='S3', coach_type='SLEEPER', total_seats=10)
+        Coach.objects.create(train=self.train, coach_number='A1', coach_type='AC_2_TIER', total_seats=4)
+        self.assertEqual(counters(self.schedule), {'SLEEPER': (30, 0), 'AC_3_TIER': (8, 0), 'AC_2_TIER': (4, 0)})
+        self.assertEqual(counters(past), {'SLEEPER': (20, 0), 'AC_3_TIER': (8, 0)})
+
+        coach.delete()
+        Coach.objects.filter(train=self.train, coach_type='AC_2_TIER').delete()
+        self.assertEqual(counters(self.schedule), {'SLEEPER': (20, 0), 'AC_3_TIER': (8, 0), 'AC_2_TIER': (0, 0)})
+
+    def test_reconcile_recounts_drifted_counters(self):
+        book(self.schedule, self.stations, passengers=3)
+        ScheduleInventory.objects.filter(schedule=self.schedule, seat_class='SLEEPER').update(booked_seats=7)
+        drifted = inventory.reconcile(TrainSchedule.objects.filter(id=self.schedule.id))
+        self.assertEqual([(row.seat_class, total, booked) for row, total, booked in drifted], [('SLEEPER', 20, 3)])
+        self.assertEqual(counters(self.schedule)['SLEEPER'], (20, 3))
+
+
+@override_settings(**TEST_SETTINGS)
+class ConcurrentReservationTests(TransactionTestCase):
+    databases = '__all__'
+
+    def test_concurrent_reservations_never_oversell(self):
+        _, _, schedule = make_train(seats_per_coach=5, sleeper_coaches=2)
+
+        def reserve():
+            try:
+                with transaction.atomic():
+                    return inventory.reserve_seats(schedule, 'SLEEPER')
+            finally:
+                close_old_connections()
+
+        results = run_threads(16, reserve)
+        self.assertEqual(results.count(True), 10)
+        self.assertEqual(counters(schedule)['SLEEPER'], (10, 10))
+
+
+class SeatUpdatesTests(MainAppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.train, self.stations, self.schedule = make_train()
+        self.sleeper = Coach.objects.get(train=self.train, coach_number='S1')
+
+    def test_coach_availability_is_counted_once_per_inventory_version(self):
+        book(self.schedule, self.stations, passengers=2)
+        self.assertEqual(seat_updates.coach_availability(self.schedule.id, self.train.id)[self.sleeper.id], 8)
+        book(self.schedule, self.stations, passengers=1)
+        with self.assertNumQueries(0):
+            self.assertEqual(seat_updates.coach_availability(self.schedule.id, self.train.id)[self.sleeper.id], 8)
+        bump_inventory_version(self.schedule.id)
+        self.assertEqual(seat_updates.coach_availability(self.schedule.id, self.train.id)[self.sleeper.id], 7)
+
+    def test_a_burst_of_changes_is_published_once_per_tick(self):
+        seat_updates.coach_availability(self.schedule.id, self.train.id)  # What pages already show
+        caches['default'].set(seat_updates._published_key(self.schedule.id), {
+            coach.id: coach.total_seats for coach in self.train.coaches.all()
+        })
+        since = live.current_sequence()
+        book(self.schedule, self.stations, passengers=3)
+        bump_inventory_version(self.schedule.id)
+        # As if this process's flusher were running, without starting one
+        with override_settings(SEAT_UPDATES_BACKGROUND=True), mock.patch.object(seat_updates, '_flusher', object()):
+            for _ in range(5):
+                seat_updates.changed(self.schedule.id)
+            self.assertEqual(live.Cursor(since).poll(), [])
+        seat_updates.flush()
+
+        events = live.Cursor(since).poll()
+        self.assertEqual(len(events), 1)
+        _, channel, data = events[0]
+        self.assertEqual(channel, seat_updates.channel(self.schedule.id))
+        self.assertEqual(data['coaches'], {self.sleeper.id: 7})
+
+
+    def test_without_the_background_thread_changes_are_published_at_once(self):
+        since = live.current_sequence()
+        book(self.schedule, self.stations)
+        bump_inventory_version(self.schedule.id)
+        seat_updates.changed(self.schedule.id)
+        self.assertEqual(len(live.Cursor(since).poll()), 1)
+        self.assertIsNone(seat_updates._flusher)
+
+def pay(ticket, status='SUCCESS'):
+    return Payment.objects.create(
+        ticket=ticket, transaction_id=payments.new_transaction_id(), amount=100,
+        payment_method='UPI', status=status,
+    )
+
+
+class DecliningGateway(payments.FakeGateway):
+    def refund(self, transaction_id, amount):
+        return 'FAILED', '{"error": "declined"}'
+
+
+class RunCancellationTests(MainAppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.train, self.stations, self.schedule = make_train()
+
+    def test_cancel_run_totals_and_counters(self):
+        paid = book(self.schedule, self.stations, passengers=2, booking_status='CONFIRMED')
+        pay(paid)
+        book(self.schedule, self.stations, booking_status='PENDING')
+        book(self.schedule, self.stations, seat_class='AC_3_TIER', booking_status='CONFIRMED')
+        book(self.schedule, self.stations, reserve=False, booking_status='CANCELLED').passengers.update(
+            current_status='CANCELLED'
+        )
+
+        totals = cancellation.cancel_run(self.schedule, batch_size=2)
+
+        self.assertEqual(totals, {'tickets': 3, 'passengers': 4, 'refunds': 1})
+        self.assertEqual(counters(self.schedule), {'SLEEPER': (20, 0), 'AC_3_TIER': (8, 0)})
+        self.assertFalse(Passenger.objects.exclude(current_status='CANCELLED').exists())
+        self.assertEqual(Payment.objects.get(ticket=paid).status, 'REFUND_PENDING')
+        self.assertEqual(OutboxEvent.objects.filter(event_type='TICKET_CANCELLED').count(), 3)
+        self.assertFalse(OutboxEvent.objects.filter(event_type='PAYMENT_REFUNDED').exists())
+        self.assertEqual(cancellation.cancel_run(self.schedule), {'tickets': 0, 'passengers': 0, 'refunds': 0})
+
+    def test_booking_committed_between_sweeps_gets_its_seats_back(self):
+        book(self.schedule, self.stations, passengers=2)
+        recount = inventory.recount
+
+        def late_booking_then_recount(schedule):
+            book(self.schedule, self.stations, passengers=3)
+            recount(schedule)
+
+        with mock.patch.object(inventory, 'recount', late_booking_then_recount):
+            totals = cancellation.cancel_run(self.schedule)
+
+        self.assertEqual(totals['passengers'], 5)
+        self.assertEqual(counters(self.schedule)['SLEEPER'], (20, 0))
+
+    def test_cancel_runs_action_needs_change_permission(self):
+        model_admin = admin.site._registry[TrainSchedule]
+        request = RequestFactory().get('/')
+        request.user = User.objects.create_user('viewer', is_staff=True)
+        request.user.user_permissions.add(Permission.objects.get(codename='view_trainschedule'))
+        self.assertNotIn('cancel_runs', model_admin.get_actions(request))
+
+        request.user = User.objects.get(pk=request.user.pk)  # Drop the cached permissions
+        request.user.user_permissions.add(Permission.objects.get(codename='change_trainschedule'))
+        request.user = User.objects.get(pk=request.user.pk)
+        self.assertIn('cancel_runs', model_admin.get_actions(request))
+
+
+class RefundTests(MainAppTestCase):
+    def setUp(self):
+        super().setUp()
+        _, stations, schedule = make_train()
+        self.payment = pay(book(schedule, stations, booking_status='CANCELLED'), status='REFUND_PENDING')
+
+    def test_gateway_refund_settles_the_payment_once(self):
+        gateway = payments.FakeGateway(latency=0)
+        self.assertEqual(payments.refund(self.payment.transaction_id, self.payment.amount, gateway), 'REFUNDED')
+        self.assertEqual(payments.refund(self.payment.transaction_id, self.payment.amount, gateway), 'REFUNDED')
+        self.assertEqual(OutboxEvent.objects.filter(event_type='PAYMENT_REFUNDED').count(), 1)
+
+    @override_settings(PAYMENT_GATEWAY='mainApp.tests.DecliningGateway')
+    def test_declined_refund_stays_pending_for_a_retry(self):
+        self.assertEqual(list(payments.refund_pending()), [(0, 1)])
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'REFUND_PENDING')
+
+        with override_settings(PAYMENT_GATEWAY='mainApp.payments.FakeGateway', PAYMENT_GATEWAY_LATENCY=0):
+            self.assertEqual(list(payments.refund_pending()), [(1, 0)])
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'REFUNDED')
+
+
+class PaymentTests(MainAppTestCase):
+    def setUp(self):
+        super().setUp()
+        _, self.stations, self.schedule = make_train()
+        self.ticket = book(self.schedule, self.stations, passengers=2, booking_status='PENDING')
+
+    def test_repeated_callbacks_are_applied_once(self):
+        payment = payments.start_payment(self.ticket, 'UPI')
+        for status in ['SUCCESS', 'SUCCESS', 'FAILED']:
+            self.assertEqual(payments.handle_callback(payment.transaction_id, status).status, 'SUCCESS')
+        self.ticket.refresh_from_db()
+        self.assertEqual(self.ticket.booking_status, 'CONFIRMED')
+        self.assertEqual(OutboxEvent.objects.filter(event_type__startswith='PAYMENT_').count(), 1)
+
+    def test_charge_succeeding_after_cancellation_is_refunded(self):
+        payment = payments.start_payment(self.ticket, 'UPI')
+        cancellation.cancel_ticket(self.ticket)
+        self.assertEqual(payments.handle_callback(payment.transaction_id, 'SUCCESS').status, 'REFUND_PENDING')
+
+    @override_settings(PAYMENT_CALLBACK_SECRET='gateway-secret')
+    def test_callback_view_checks_the_signature(self):
+        payment = payments.start_payment(self.ticket, 'UPI')
+        body = json.dumps({'transaction_id': payment.transaction_id, 'status': 'SUCCESS'}).encode()
+        client = Client()
+
+        def post(signature):
+            return client.post(
+                reverse('payment_callback'), body, content_type='application/json', headers={'X-Signature': signature}
+            )
+
+        self.assertEqual(post('forged').status_code, 403)
+        self.assertEqual(post(payments.sign_callback(body)).json()['status'], 'SUCCESS')
+        self.assertEqual(post(payments.sign_callback(body)).json()['status'], 'SUCCESS')
+
+        with override_settings(PAYMENT_CALLBACK_SECRET=''):
+            self.assertEqual(post(payments.sign_callback(body)).status_code, 403)
+
+    def test_retry_after_failure_starts_a_new_attempt(self):
+        failed = payments.start_payment(self.ticket, 'UPI')
+        declined = payments.FakeGateway(latency=0, failure_rate=1).charge(failed.transaction_id, failed.amount, 'UPI')
+        payments.handle_callback(failed.transaction_id, *declined)
+        Payment.objects.filter(pk=failed.pk).update(payment_date=timezone.now() - timedelta(hours=1))
+
+        retry = payments.start_payment(self.ticket, 'CREDIT_CARD')
+        self.assertEqual(retry.status, 'PENDING')
+        self.assertNotEqual(retry.transaction_id, failed.transaction_id)
+        self.assertGreater(retry.payment_date, timezone.now() - timedelta(minutes=1))
+        self.assertEqual(cancellation.expire_unpaid(), 0)
+
+    def test_failure_the_gateway_has_not_confirmed_is_not_retried(self):
+        failed = payments.start_payment(self.ticket, 'UPI')
+        payments.handle_callback(failed.transaction_id, 'FAILED')  # As reconcile_pending does for unknown charges
+
+        retry = payments.start_payment(self.ticket, 'UPI')
+        self.assertEqual((retry.transaction_id, retry.status), (failed.transaction_id, 'FAILED'))
+
+    def test_unpaid_tickets_release_their_seats_after_the_timeout(self):
+        failed = book(self.schedule, self.stations, booking_status='PENDING')
+        payments.handle_callback(payments.start_payment(failed, 'UPI').transaction_id, 'FAILED')
+        charging = book(self.schedule, self.stations, booking_status='PENDING')
+        payments.start_payment(charging, 'UPI')
+        recent = book(self.schedule, self.stations, booking_status='PENDING')
+        an_hour_ago = timezone.now() - timedelta(hours=1)
+        Ticket.objects.exclude(pk=recent.pk).update(booking_date=an_hour_ago)
+        Payment.objects.update(payment_date=an_hour_ago)
+
+        self.assertEqual(cancellation.expire_unpaid(batch_size=1), 2)
+        self.assertEqual(
+            set(Ticket.objects.filter(booking_status='CANCELLED').values_list('pk', flat=True)),
+            {self.ticket.pk, failed.pk},
+        )
+        self.assertEqual(counters(self.schedule)['SLEEPER'], (20, 2))
+        self.assertIsNone(payments.start_payment(self.ticket, 'UPI'))
+
+    def test_cancelling_a_paid_ticket_queues_its_refund(self):
+        payment = payments.start_payment(self.ticket, 'UPI')
+        payments.handle_callback(payment.transaction_id, 'SUCCESS')
+        self.assertTrue(cancellation.cancel_ticket(self.ticket))
+        self.assertFalse(cancellation.cancel_ticket(self.ticket))
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, 'REFUND_PENDING')
+        self.assertEqual(counters(self.schedule)['SLEEPER'], (20, 0))
+
+
+    def add_passenger(self, name):
+        url = reverse('book_ticket', args=[self.schedule.id, self.stations[0].id, self.stations[2].id])
+        return self.client.post(url, {'name': name, 'age': 30, 'gender': 'F', 'seat_class': 'SLEEPER'})
+
+    def test_passengers_join_the_ticket_only_until_payment_starts(self):
+        self.client.force_login(User.objects.create_user('traveller'))
+        session = self.client.session
+        session['current_ticket_id'] = self.ticket.id
+        session.save()
+
+        self.add_passenger('Asha')
+        self.ticket.refresh_from_db()
+        self.assertEqual(self.ticket.passengers.count(), 3)
+        self.assertEqual(self.ticket.total_fare, self.ticket.passengers.get(name='Asha').fare)
+
+        self.client.post(reverse('pay_ticket', args=[self.ticket.pnr]), {'payment_method': 'UPI'})
+        self.assertNotIn('current_ticket_id', self.client.session)
+
+        session = self.client.session
+        session['current_ticket_id'] = self.ticket.id
+        session.save()
+        response = self.add_passenger('Ravi')
+        self.assertRedirects(response, reverse('ticket_detail', args=[self.ticket.pnr]), fetch_redirect_response=False)
+        self.assertFalse(self.ticket.passengers.filter(name='Ravi').exists())
+        self.assertNotIn('current_ticket_id', self.client.session)
+
+
+class OutboxTests(MainAppTestCase):
+    def setUp(self):
+        super().setUp()
+        _, self.stations, self.schedule = make_train()
+        self.projection = outbox.RevenueProjection()
+
+    def event(self, event_id):
+        return OutboxEvent.objects.create(id=event_id, event_type='TICKET_BOOKED', pnr='X', schedule_id=self.schedule.id)
+
+    def checkpoint(self):
+        checkpoint = ProjectionCheckpoint.objects.get(name=self.projection.name)
+        return checkpoint.last_event_id, [event_id for event_id, _ in checkpoint.gaps]
+
+    def test_event_committed_late_with_a_lower_id_is_not_skipped(self):
+        self.event(1)
+        self.event(4)
+        self.assertEqual(outbox.consume(self.projection), 2)
+        self.assertEqual(self.checkpoint(), (4, [2, 3]))
+
+        self.event(3)
+        self.assertEqual(outbox.consume(self.projection), 1)
+        self.assertEqual(self.checkpoint(), (4, [2]))
+        self.assertEqual(outbox.consume(self.projection), 0)
+
+    def test_missing_ids_are_given_up_after_the_gap_timeout(self):
+        self.event(1)
+        self.event(3)
+        outbox.consume(self.projection)
+        with override_settings(OUTBOX_GAP_SECONDS=-1):
+            self.assertEqual(outbox.consume(self.projection), 0)
+        self.assertEqual(self.checkpoint(), (3, []))
+
+    def test_large_jumps_are_not_tracked(self):
+        self.event(1)
+        self.event(2 + outbox.MAX_GAP)
+        outbox.consume(self.projection)
+        self.assertEqual(self.checkpoint(), (2 + outbox.MAX_GAP, []))
+
+    def test_revenue_counts_payments_and_refunds_only(self):
+        paid = book(self.schedule, self.stations, passengers=2, booking_status='PENDING')
+        payments.handle_callback(payments.start_payment(paid, 'UPI').transaction_id, 'SUCCESS')
+        declined = book(self.schedule, self.stations, booking_status='PENDING')
+        payments.handle_callback(payments.start_payment(declined, 'UPI').transaction_id, 'FAILED')
+        book(self.schedule, self.stations, booking_status='PENDING')
+        refunded = book(self.schedule, self.stations, seat_class='AC_3_TIER', booking_status='PENDING')
+        payment = payments.start_payment(refunded, 'UPI')
+        payments.handle_callback(payment.transaction_id, 'SUCCESS')
+        cancellation.cancel_ticket(refunded)
+        payments.refund(payment.transaction_id, payment.amount, payments.FakeGateway(latency=0))
+
+        outbox.consume(self.projection)
+        rollups = {
+            row.seat_class: (row.passengers, row.revenue, row.cancelled_passengers, row.cancelled_revenue)
+            for row in RevenueRollup.objects.all()
+        }
+        self.assertEqual(rollups, {'SLEEPER': (2, 200, 0, 0), 'AC_3_TIER': (1, 100, 1, 100)})
+
+
+class RunningStatusTests(MainAppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.train, self.stations, self.schedule = make_train()
+        self.coalescer = running_status.Coalescer(batch_size=10, flush_seconds=60)
+
+    def update(self, minutes_ago=0, **fields):
+        at = (timezone.now() - timedelta(minutes=minutes_ago)).isoformat()
+        self.coalescer.add(running_status.parse(json.dumps({'schedule_id': self.schedule.id, 'at': at, **fields})))
+
+    def test_update_without_status_keeps_the_stored_status(self):
+        self.update(minutes_ago=5, status='DELAYED', delay_minutes=20)
+        self.coalescer.flush()
+        self.update(delay_minutes=25, station=self.stations[1].code)
+        self.assertEqual(self.coalescer.flush(), 1)
+        self.schedule.refresh_from_db()
+        self.assertEqual(
+            (self.schedule.status, self.schedule.delay_minutes, self.schedule.last_station),
+            ('DELAYED', 25, self.stations[1]),
+        )
+
+    def test_cancelled_run_is_not_brought_back(self):
+        self.update(status='RUNNING', delay_minutes=5)
+        # Cancelled after the coalescer could have read the run
+        resolve = self.coalescer._resolve
+
+        def resolve_then_cancel(keys):
+            resolved = resolve(keys)
+            TrainSchedule.objects.filter(id=self.schedule.id).update(status='CANCELLED')
+            return resolved
+
+        with mock.patch.object(self.coalescer, '_resolve', resolve_then_cancel):
+            self.assertEqual(self.coalescer.flush(), 0)
+        self.schedule.refresh_from_db()
+        self.assertEqual((self.schedule.status, self.schedule.delay_minutes), ('CANCELLED', 0))
+
+    def test_older_update_does_not_replace_a_newer_one(self):
+        self.update(status='RUNNING', delay_minutes=5)
+        self.coalescer.flush()
+        self.update(minutes_ago=10, status='DELAYED', delay_minutes=30)
+        self.assertEqual(self.coalescer.flush(), 0)
+        self.schedule.refresh_from_db()
+        self.assertEqual(self.schedule.delay_minutes, 5)
+
+    def test_pages_only_open_event_streams_under_asgi(self):
+        self.assertFalse(live.enabled(RequestFactory().get('/')))
+
+
+class TimetableImportTests(MainAppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.train, self.stations, self.schedule = make_train()
+
+    def import_csv(self, kind, lines):
+        path = os.path.join(TEST_DIR, f'{kind}.csv')
+        with open(path, 'w') as csv_file:
+            csv_file.write('\n'.join(lines) + '\n')
+        results = list(timetable_import.import_file(kind, path, chunk_size=100))
+        return sum(created for _, created, _, _ in results), [error for *_, errors in results for error in errors]
+
+    def test_bad_numbers_are_row_errors(self):
+        a, b = (station.code for station in self.stations[:2])
+        created, errors = self.import_csv('fares', [
+            'train_number,from_station,to_station,distance,base_fare,tatkal_charge',
+            f'12001,{b},{a},10,NaN,0',
+            f'12001,{b},{a},10,Infinity,0',
+            f'12001,{b},{a},10,1e30,0',
+            f'12001,{b},{a},10,-5,0',
+            f'12001,{b},{a},10,50,10000',
+            f'12001,{b},{a},inf,50,0',
+            f'12001,{b},{a},1e999,50,0',
+            f'12001,{b},{a},nan,50,0',
+            f'12001,{b},{a},1e12,50,0',
+            f'12001,{b},{a},10,50.005,5',
+        ])
+        self.assertEqual(created, 1)
+        self.assertEqual([line for line, _ in errors], list(range(2, 11)))
+        self.assertEqual(Fare.objects.get(source_station=self.stations[1], destination_station=self.stations[0]).base_fare, Decimal('50.00'))
+
+    def test_coach_import_resizes_upcoming_runs(self):
+        created, errors = self.import_csv('coaches', [
+            'train_number,coach_number,coach_type,total_seats',
+            '12001,S3,SLEEPER,10',
+            '12001,A1,AC_2_TIER,6',
+            '12001,B1,AC_3_TIER,inf',
+        ])
+        self.assertEqual((created, len(errors)), (2, 1))
+        self.assertEqual(counters(self.schedule), {'SLEEPER': (30, 0), 'AC_3_TIER': (8, 0), 'AC_2_TIER': (6, 0)})
+        self.train.refresh_from_db()
+        self.assertEqual(self.train.total_seats, 44)
+
+
+    def test_reimport_without_optional_columns_keeps_stored_values(self):
+        station, other = self.stations[0], self.stations[1]
+        Train.objects.filter(pk=self.train.pk).update(train_type='RAJDHANI')
+        Fare.objects.filter(train=self.train).update(reservation_charge=20, tatkal_charge=75)
+        TrainRoute.objects.filter(train=self.train, sequence_number=2).update(platform_number='4')
+
+        self.import_csv('stations', ['stop_id,stop_name', f'{station.code},Renamed', 'NEW1,New stop'])
+        self.import_csv('trains', ['train_number,name', '12001,Renamed train', '12002,New train'])
+        self.import_csv('fares', ['train_number,from_station,to_station,distance,base_fare',
+                                  f'12001,{station.code},{other.code},100,250'])
+        self.import_csv('routes', ['train_number,sequence,station_code', f'12001,2,{other.code}'])
+
+        station.refresh_from_db()
+        self.assertEqual((station.name, station.city, station.state), ('Renamed', 'A', 'S'))
+        self.assertEqual(Station.objects.get(code='NEW1').city, '')
+        self.assertEqual(Train.objects.get(pk=self.train.pk).train_type, 'RAJDHANI')
+        self.assertEqual(Train.objects.get(train_number='12002').train_type, 'EXPRESS')
+        fare = Fare.objects.get(train=self.train, source_station=station, destination_station=other)
+        self.assertEqual((fare.base_fare, fare.reservation_charge, fare.tatkal_charge), (250, 20, 75))
+        stop = TrainRoute.objects.get(train=self.train, sequence_number=2)
+        self.assertEqual((stop.platform_number, stop.distance_from_source), ('4', 100))
+
+class PriceLockTests(MainAppTestCase):
+    def setUp(self):
+        super().setUp()
+        _, self.stations, self.schedule = make_train()
+        self.request = RequestFactory().get('/')
+        self.request.session = {}
+
+    def test_quote_is_locked_per_journey(self):
+        a, b, c = self.stations
+        pricing.lock_quotes(self.request, self.schedule, a, b, {'SLEEPER': Decimal('150.00')})
+        pricing.lock_quotes(self.request, self.schedule, a, c, {'SLEEPER': Decimal('300.00')})
+        self.assertEqual(pricing.locked_fare(self.request, self.schedule, a, b, 'SLEEPER'), Decimal('150.00'))
+        self.assertEqual(pricing.locked_fare(self.request, self.schedule, a, c, 'SLEEPER'), Decimal('300.00'))
+        self.assertIsNone(pricing.locked_fare(self.request, self.schedule, b, c, 'SLEEPER'))
+
+    @override_settings(PRICE_LOCK_SECONDS=-1)
+    def test_lock_runs_out(self):
+        a, b, _ = self.stations
+        pricing.lock_quotes(self.request, self.schedule, a, b, {'SLEEPER': Decimal('150.00')})
+        self.assertIsNone(pricing.locked_fare(self.request, self.schedule, a, b, 'SLEEPER'))
+
+
+    def test_bands_follow_the_setting(self):
+        self.assertEqual(pricing.quote(Decimal('100'), 'GENERAL', 10, 9), Decimal('140.00'))
+        with override_settings(PRICING_BANDS=[(0.5, '1.00'), (1.0, '2.00')]):
+            self.assertEqual(pricing.quote(Decimal('100'), 'GENERAL', 10, 9), Decimal('200.00'))
+        self.assertEqual(pricing.quote(Decimal('100'), 'GENERAL', 10, 9), Decimal('140.00'))
+
+class PnrTests(MainAppTestCase):
+    def setUp(self):
+        super().setUp()
+        _, self.stations, self.schedule = make_train()
+
+    def test_new_pnr_skips_archived_ones(self):
+        ArchivedTicket.objects.create(
+            id=999, pnr='ARCHIVED01', schedule=self.schedule, passenger_name='Old', seat_class='SLEEPER',
+            booking_status='CONFIRMED', booking_date=timezone.now(),
+        )
+        with mock.patch('random.choices', side_effect=[list('ARCHIVED01'), list('FRESHPNR01')]):
+            ticket = book(self.schedule, self.stations, passengers=0)
+        self.assertEqual(ticket.pnr, 'FRESHPNR01')
+
+    def test_unknown_pnr_is_remembered_until_a_ticket_gets_it(self):
+        with self.assertRaises(Http404):
+            pnr_status.get('NOSUCHPNR1')
+        with self.assertNumQueries(0), self.assertRaises(Http404):
+            pnr_status.get('NOSUCHPNR1')
+
+        book(self.schedule, self.stations, pnr='NOSUCHPNR1')
+        pnr_status.refresh('NOSUCHPNR1')  # What the booking does on commit
+        self.assertEqual(pnr_status.get('NOSUCHPNR1')['pnr'], 'NOSUCHPNR1')
+
+
+class ChartPreparationTests(MainAppTestCase):
+    def passengers(self, count, status='CONFIRMED'):
+        return [
+            Passenger(id=index, ticket_id=index, age=30, seat_class='SLEEPER', current_status=status)
+            for index in range(1, count + 1)
+        ]
+
+    def test_passengers_without_a_berth_go_to_rac_then_the_waiting_list(self):
+        coach = Coach(id=1, coach_number='S1', coach_type='SLEEPER', total_seats=3, total_lower=1,
+                      total_middle=0, total_upper=1, total_side_lower=1, total_side_upper=0)
+        passengers = self.passengers(6)
+        passengers[0].current_status = 'RAC'
+
+        changed = chart_preparation.optimize_class(passengers, [coach])
+
+        self.assertEqual(len(changed), 6)
+        self.assertEqual(
+            [passenger.current_status for passenger in passengers],
+            ['CONFIRMED', 'CONFIRMED', 'CONFIRMED', 'RAC', 'WAITING', 'WAITING'],
+        )
+        self.assertEqual({passenger.coach for passenger in passengers[3:]}, {None})
+        self.assertEqual(len({passenger.seat_number for passenger in passengers[:3]}), 3)
+
+    def test_place_groups_returns_what_did_not_fit(self):
+        coach = Coach(id=1, coach_number='S1', coach_type='SLEEPER', total_seats=2, total_lower=1,
+                      total_middle=0, total_upper=1, total_side_lower=0, total_side_upper=0)
+        group = self.passengers(3)
+        placed, unplaced = chart_preparation.place_groups([group], [coach])
+        self.assertEqual((placed[coach], unplaced), (group[:2], group[2:]))
+
+
+    def test_only_paid_tickets_are_charted_and_booking_pages_hear_of_it(self):
+        _, stations, schedule = make_train()
+        paid = book(schedule, stations, passengers=2, booking_status='CONFIRMED')
+        unpaid = book(schedule, stations, passengers=2, booking_status='PENDING')
+        Passenger.objects.update(seat_number=None)
+        version = fragments.get_inventory_versions([schedule.id])[schedule.id]
+
+        with mock.patch.object(seat_updates, 'changed') as changed, \
+                self.captureOnCommitCallbacks(execute=True):
+            _, _, moved = chart_preparation.prepare_chart(schedule)
+
+        self.assertEqual(moved, 2)
+        self.assertTrue(all(paid.passengers.values_list('seat_number', flat=True)))
+        self.assertEqual(set(unpaid.passengers.values_list('seat_number', flat=True)), {None})
+        self.assertGreater(fragments.get_inventory_versions([schedule.id])[schedule.id], version)
+        changed.assert_called_once_with(schedule.id)
+
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_PIN_SECONDS=5)
+class ReplicaRoutingTests(MainAppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.router = routers.PrimaryReplicaRouter()
+
+    def test_reads_go_to_the_replica_unless_pinned(self):
+        # Every test runs inside a transaction, which pins reads by itself
+        with mock.patch.object(routers.connections[routers.PRIMARY], 'in_atomic_block', False):
+            self.assertEqual(self.router.db_for_read(Station), 'replica')
+            with routers.use_primary():
+                self.assertEqual(self.router.db_for_read(Station), routers.PRIMARY)
+        self.assertEqual(self.router.db_for_read(Station), routers.PRIMARY)
+        self.assertEqual(self.router.db_for_write(Station), routers.PRIMARY)
+
+    def request(self, method, view, cookie=None):
+        request = getattr(RequestFactory(), method)('/')
+        if cookie is not None:
+            request.COOKIES[settings.REPLICA_PIN_COOKIE] = cookie
+        return routers.ReplicaPinningMiddleware(view)(request)
+
+    def test_client_is_pinned_only_after_a_write(self):
+        def writes(request):
+            Station.objects.create(code='NEW', name='New')
+            return HttpResponse()
+
+        def reads(request):
+            Station.objects.count()
+            return HttpResponse()
+
+        self.assertIn(settings.REPLICA_PIN_COOKIE, self.request('post', writes).cookies)
+        self.assertNotIn(settings.REPLICA_PIN_COOKIE, self.request('post', reads).cookies)
+        self.assertNotIn(settings.REPLICA_PIN_COOKIE, self.request('get', reads).cookies)
+
+    def test_pinned_client_reads_from_the_primary(self):
+        seen = []
+
+        def view(request):
+            seen.append(routers._use_primary.get())
+            return HttpResponse()
+
+        self.request('get', view, cookie=str(time.time() + 5))
+        self.request('get', view, cookie=str(time.time() - 1))
+        self.request('get', view, cookie='garbage')
+        self.assertEqual(seen, [True, False, False])
+
+
+class ArchiveTests(MainAppTestCase):
+    def test_settled_tickets_of_past_journeys_are_moved(self):
+        _, stations, past = make_train(days_ahead=-3)
+        paid = book(past, stations, passengers=2, reserve=False, booking_status='CONFIRMED')
+        pay(paid)
+        refunding = book(past, stations, reserve=False, booking_status='CANCELLED')
+        pay(refunding, status='REFUND_PENDING')
+        upcoming = TrainSchedule.objects.create(train=past.train, journey_date=date.today() + timedelta(days=3))
+        travelling = book(upcoming, stations, reserve=False)
+        pnr_status.get(paid.pnr)  # Cached while live
+
+        self.assertEqual(list(archive.archive_journeys(batch_size=1)), [1])
+
+        self.assertEqual(set(Ticket.objects.values_list('pk', flat=True)), {refunding.pk, travelling.pk})
+        self.assertEqual(ArchivedPassenger.objects.filter(ticket_id=paid.pk).count(), 2)
+        self.assertTrue(ArchivedPayment.objects.filter(ticket_id=paid.pk).exists())
+        pnr_status.forget(paid.pnr)  # What the archiving does on commit
+        self.assertTrue(pnr_status.get(paid.pnr)['is_archived'])
+
+
+class ScheduleListCachingTests(MainAppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.train, self.stations, self.schedule = make_train()
+        self.client.force_login(User.objects.create_user('traveller'))
+        self.url = reverse('schedule_list', args=[self.train.id, self.stations[0].id, self.stations[2].id])
+        self.url += f'?date={self.schedule.journey_date.isoformat()}'
+
+    def available(self, seats):
+        return f'<p class="font-bold text-green-600">{seats}</p>'
+
+    def test_cards_are_rendered_again_only_when_the_inventory_version_changes(self):
+        self.assertContains(self.client.get(self.url), self.available(28))
+        self.schedule.inventory_version = fragments.get_inventory_versions([self.schedule.id])[self.schedule.id]
+        self.assertEqual(fragments.uncached_cards([self.schedule], self.stations[0], self.stations[2]), [])
+
+        book(self.schedule, self.stations)  # Its on_commit bump does not run inside the test
+        self.assertContains(self.client.get(self.url), self.available(28))
+        bump_inventory_version(self.schedule.id)
+        self.assertContains(self.client.get(self.url), self.available(27))
+
+    def test_search_is_cached_until_the_run_is_cancelled(self):
+        self.client.get(self.url)
+        key = fragments.schedule_search_key(self.train.id, self.schedule.journey_date.isoformat())
+        self.assertEqual(cache_tier.get_or_compute(key, lambda: 'recomputed', timeout=60), [self.schedule])
+        cancellation.cancel_run(self.schedule)
+        self.assertEqual(cache_tier.get_or_compute(key, lambda: 'recomputed', timeout=60), 'recomputed')
+
+
+class ChartExportTests(MainAppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.train, self.stations, self.schedule = make_train()
+        self.ticket = book(self.schedule, self.stations, passengers=2)
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+
+    def export(self, url, **params):
+        response = self.client.get(url, params)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_chart_is_streamed_as_csv(self):
+        response, body = self.export(reverse('chart_export', args=[self.schedule.id]))
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = body.splitlines()
+        self.assertEqual(lines[0], ','.join(charts.CHART_COLUMNS))
+        self.assertEqual(len(lines), 3)
+        self.assertIn(self.ticket.pnr, lines[1])
+
+    def test_charts_of_a_date_are_streamed_as_json_lines(self):
+        _, stations, other = make_train('12002')
+        book(other, stations)
+        response, body = self.export(
+            reverse('chart_export_date'), date=self.schedule.journey_date.isoformat(), format='jsonl'
+        )
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([row['train_number'] for row in rows], ['12001', '12001', '12002'])
+        self.assertEqual(rows[0]['pnr'], self.ticket.pnr)
+
+    def test_bad_requests_are_refused(self):
+        url = reverse('chart_export', args=[self.schedule.id])
+        self.assertEqual(self.client.get(url, {'format': 'xml'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('chart_export_date'), {'date': 'soon'}).status_code, 400)
+        self.client.force_login(User.objects.create_user('traveller'))
+        self.assertRedirects(self.client.get(url), reverse('main_page'), fetch_redirect_response=False)
+
+
+class AvailabilityCalendarTests(MainAppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.train, self.stations, self.schedule = make_train(days_ahead=2)
+        self.later = TrainSchedule.objects.create(train=self.train, journey_date=date.today() + timedelta(days=5))
+        TrainSchedule.objects.create(
+            train=self.train, journey_date=date.today() + timedelta(days=3), status='CANCELLED'
+        )
+        TrainSchedule.objects.create(train=self.train, journey_date=date.today() + timedelta(days=40))
+
+    def test_grid_covers_running_schedules_within_the_window(self):
+        book(self.schedule, self.stations, passengers=3)
+        book(self.later, self.stations, seat_class='AC_3_TIER')
+
+        calendar = inventory.availability_calendar(self.train.id, 30)
+
+        self.assertEqual(calendar['classes'], ['AC_3_TIER', 'SLEEPER'])
+        self.assertEqual(
+            [(row['schedule_id'], row['available']) for row in calendar['rows']],
+            [(self.schedule.id, [8, 17]), (self.later.id, [7, 20])],
+        )
+        with self.assertNumQueries(0):
+            self.assertEqual(inventory.availability_calendar(self.train.id, 30), calendar)
+
+    def test_view_answers_json(self):
+        self.client.force_login(User.objects.create_user('traveller'))
+        url = reverse('availability_calendar', args=[self.train.id, self.stations[0].id, self.stations[2].id])
+        response = self.client.get(url, {'format': 'json', 'days': 4})
+        self.assertEqual(response.json()['dates'], [{
+            'date': self.schedule.journey_date.isoformat(),
+            'schedule_id': self.schedule.id,
+            'available': {'AC_3_TIER': 8, 'SLEEPER': 20},
+        }])
+
+
+@override_settings(AUTOCOMPLETE_VERSION_CHECK_SECONDS=0)
+class AutocompleteTests(MainAppTestCase):
+    def setUp(self):
+        super().setUp()
+        autocomplete._indexes.clear()
+
+    def test_prefix_matches_codes_names_and_words(self):
+        index = autocomplete.PrefixIndex([
+            (1, 'MMCT - Mumbai Central', ['MMCT', 'Mumbai Central', 'Mumbai']),
+            (2, 'NDLS - New Delhi', ['NDLS', 'New Delhi', 'Delhi']),
+        ])
+        self.assertEqual(index.search('cen'), [(1, 'MMCT - Mumbai Central')])
+        self.assertEqual(index.search(' Del '), [(2, 'NDLS - New Delhi')])
+        self.assertEqual(index.search('m', limit=5), [(1, 'MMCT - Mumbai Central')])
+        self.assertEqual(index.search(''), [])
+
+    def test_index_is_rebuilt_after_a_station_is_saved(self):
+        url = reverse('autocomplete', args=['stations'])
+        Station.objects.create(code='PUNE', name='Pune Junction', city='Pune', state='MH')
+        self.assertEqual([row['label'] for row in self.client.get(url, {'q': 'pun'}).json()['results']],
+                         ['PUNE - Pune Junction'])
+
+        Station.objects.create(code='PNVL', name='Panvel', city='Panvel', state='MH')
+        with self.assertNumQueries(1):
+            results = self.client.get(url, {'q': 'p'}).json()['results']
+        self.assertEqual(len(results), 2)
+        with self.assertNumQueries(0):
+            self.client.get(url, {'q': 'p'})
+
+    def test_index_built_before_the_version_was_lost_is_rebuilt(self):
+        stale = autocomplete.PrefixIndex([(1, 'OLD - Deleted', ['OLD'])])
+        autocomplete.invalidate('stations')  # The version key was lost, e.g. with the cache directory
+        autocomplete._indexes['stations'] = (stale, 1)  # What another process built before that
+        self.assertIsNot(autocomplete.get_index('stations'), stale)
+
+    def test_unknown_index_is_not_found(self):
+        self.assertEqual(self.client.get(reverse('autocomplete', args=['coaches'])).status_code, 404)
+
+
+class RevenueReportTests(MainAppTestCase):
+    def setUp(self):
+        super().setUp()
+        train, _, self.schedule = make_train()
+        self.later = TrainSchedule.objects.create(train=train, journey_date=self.schedule.journey_date + timedelta(days=1))
+        for schedule, seat_class, seats, passengers, cancelled in [
+            (self.schedule, 'SLEEPER', 20, 10, 2),
+            (self.schedule, 'AC_3_TIER', 8, 4, 0),
+            (self.later, 'SLEEPER', 20, 5, 0),
+        ]:
+            RevenueRollup.objects.create(
+                schedule=schedule, train=train, journey_date=schedule.journey_date, seat_class=seat_class,
+                seats=seats, passengers=passengers, revenue=passengers * 100,
+                cancelled_passengers=cancelled, cancelled_revenue=cancelled * 100,
+            )
+
+    def test_rows_are_summed_per_group(self):
+        by_class = {row['seat_class']: row for row in reports.revenue_report(group_by='class')}
+        self.assertEqual(by_class['SLEEPER']['travelling'], 13)
+        self.assertEqual(by_class['SLEEPER']['net_revenue'], 1300)
+        self.assertAlmostEqual(by_class['SLEEPER']['occupancy'], 13 / 40)
+        self.assertEqual(by_class['AC_3_TIER']['occupancy'], 0.5)
+
+        by_date = reports.revenue_report(group_by='date', start=self.later.journey_date)
+        self.assertEqual([(row['journey_date'], row['travelling']) for row in by_date], [(self.later.journey_date, 5)])
+        self.assertEqual(reports.revenue_report(train_number='99999'), [])
+
+    def test_command_prints_one_line_per_group(self):
+        out = StringIO()
+        call_command('revenue_report', '--by', 'train-date', stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertIn('1200.00', lines[1])
+        self.assertIn('2 rows', lines[-1])
+        with self.assertRaises(CommandError):
+            call_command('revenue_report', '--from', 'tomorrow')
+
+
+@skipIf(forecasting.np is None, 'NumPy is not installed')
+class ForecastingTests(MainAppTestCase):
+    def arrays(self, rows, fields, types):
+        columns = list(zip(*rows))
+        np = forecasting.np
+        return {field: np.array(column, dtype=kind) for field, column, kind in zip(fields, columns, types)}
+
+    def test_forecast_adds_the_average_pickup_still_to_come(self):
+        series = self.arrays([
+            # schedule, class, seats, train, journey date
+            (1, 'SLEEPER', 20, 1, '2025-01-01'),
+            (2, 'SLEEPER', 20, 1, '2025-01-02'),
+            (3, 'SLEEPER', 20, 1, '2025-01-15'),
+            (4, 'SLEEPER', 20, 2, '2025-01-15'),
+        ], ['schedule_id', 'seat_class', 'seats', 'train_id', 'journey_date'],
+            ['int64', str, 'int64', 'int64', 'datetime64[D]'])
+        bookings = self.arrays([
+            (1, 'SLEEPER', '2024-12-22', 10),
+            (1, 'SLEEPER', '2024-12-30', 4),
+            (2, 'SLEEPER', '2024-12-23', 6),
+            (2, 'SLEEPER', '2025-01-01', 2),
+            (3, 'SLEEPER', '2025-01-05', 7),
+        ], ['schedule_id', 'seat_class', 'day', 'n'], ['int64', str, 'datetime64[D]', 'float64'])
+
+        upcoming, booked_now, days_out, predicted = forecasting.forecast(series, bookings, date(2025, 1, 10), horizon=30)
+
+        self.assertEqual(series['schedule_id'][upcoming].tolist(), [3, 4])
+        self.assertEqual(booked_now.tolist(), [7, 0])
+        self.assertEqual(days_out.tolist(), [5, 5])
+        # Train 2 has no history of its own and falls back to the class average
+        self.assertEqual(predicted.tolist(), [10, 3])
+
+    def test_command_saves_forecasts(self):
+        _, stations, schedule = make_train()
+        book(schedule, stations, passengers=3)
+        call_command('forecast_demand', stdout=StringIO())
+        forecast = DemandForecast.objects.get(schedule=schedule, seat_class='SLEEPER')
+        self.assertEqual((forecast.seats, forecast.booked, forecast.predicted_booked), (20, 3, 3))
+        self.assertEqual(forecast.predicted_occupancy, 0.15)
+
+
+class ThrottleTests(MainAppTestCase):
+    def test_previous_window_counts_for_its_overlap(self):
+        store = caches['local']
+        self.assertEqual([throttling.sliding_count(store, 'k', 60, 30) for _ in range(4)], [1, 2, 3, 4])
+        # A quarter into the next window, three quarters of the previous one still count
+        self.assertEqual(throttling.sliding_count(store, 'k', 60, 75), 1 + 4 * 0.75)
+        self.assertEqual(throttling.sliding_count(store, 'k', 60, 200), 1)
+
+    @override_settings(THROTTLE_RULES={'login_user': [
+        {'scope': 'ip', 'limit': 3, 'window': 60},
+        {'scope': 'username', 'limit': 2, 'window': 60},
+    ]})
+    def test_guesses_are_limited_per_account_and_per_address(self):
+        url = reverse('login_user')
+
+        def attempt(username, address='10.0.0.1'):
+            return self.client.post(url, {'username': username, 'password': 'x'}, REMOTE_ADDR=address).status_code
+
+        self.assertEqual([attempt('alice'), attempt('Alice'), attempt('alice')], [302, 302, 429])
+        self.assertEqual(attempt('alice', address='10.0.0.2'), 429)
+        self.assertEqual(attempt('bob'), 429)  # Fourth request from 10.0.0.1
+        # Turned away by the address limit before an account counter was made
+        window = int(time.time() // 60)
+        self.assertFalse(any(
+            caches['throttle'].has_key(f'throttle:login_user:username:bob:{index}') for index in (window - 1, window)
+        ))
+        self.assertEqual(attempt('bob', address='10.0.0.2'), 302)
+        self.assertEqual(self.client.get(url, REMOTE_ADDR='10.0.0.1').status_code, 302)
+
+        response = self.client.post(url, {'username': 'alice'}, REMOTE_ADDR='10.0.0.3')
+        self.assertLessEqual(int(response['Retry-After']), 61)
+
+
+@override_settings(PROFILING_ENABLED=True, PROFILING_SAMPLE_RATE=0, PROFILING_INTERVAL=0.001)
+class ProfilingTests(MainAppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.profile_dir = tempfile.mkdtemp(dir=TEST_DIR)
+
+    def profile(self, user, **headers):
+        def view(request):
+            time.sleep(0.05)
+            return HttpResponse()
+
+        request = RequestFactory().get('/', headers=headers)
+        request.user = user
+        request.resolver_match = mock.Mock(url_name='slow_view')
+        with override_settings(PROFILING_DIR=self.profile_dir):
+            profiling.ProfilingMiddleware(view)(request)
+        return sorted(Path(self.profile_dir, 'slow_view').glob('*.collapsed'))
+
+    def test_only_staff_can_ask_for_a_profile(self):
+        self.assertEqual(self.profile(User.objects.create_user('traveller'), x_profile='1'), [])
+        self.assertEqual(self.profile(User.objects.create_user('staff', is_staff=True)), [])
+
+        files = self.profile(User.objects.get(username='staff'), x_profile='1')
+        self.assertEqual(len(files), 1)
+        counts = profiling.read_collapsed(files[0])
+        self.assertTrue(any('mainApp.tests:view' in stack.rpartition(';')[2] for stack in counts))
+
+    def test_aggregate_merges_files_per_view(self):
+        view_dir = Path(self.profile_dir, 'slow_view')
+        profiling.write_collapsed(view_dir / '1.collapsed', Counter({'a;b': 2, 'a;c': 1}))
+        profiling.write_collapsed(view_dir / '2.collapsed', Counter({'a;b': 3}))
+
+        with override_settings(PROFILING_DIR=self.profile_dir):
+            call_command('aggregate_profiles', '--clear', stdout=StringIO())
+            self.assertEqual(list(view_dir.iterdir()), [])
+            profiling.write_collapsed(view_dir / '3.collapsed', Counter({'a;c': 1}))
+            call_command('aggregate_profiles', '--clear', stdout=StringIO())
+
+        self.assertEqual(
+            profiling.read_collapsed(Path(self.profile_dir, 'slow_view.collapsed')), Counter({'a;b': 5, 'a;c': 2})
+        )
+
+
+class WarmupTests(MainAppTestCase):
+    databases = {'default', 'replica'}  # Every connection is opened
+
+    def test_process_caches_are_filled(self):
+        make_train()
+        autocomplete._indexes.clear()
+        topology.invalidate()
+        pricing.price_table.cache_clear()
+
+        out = StringIO()
+        call_command('warmup', stdout=out)
+
+        for name, _ in warmup.STEPS:
+            self.assertIn(f'  {name}: ', out.getvalue())
+        self.assertIn('Warm-up complete!', out.getvalue())
+        self.assertEqual(set(autocomplete._indexes), set(autocomplete.BUILDERS))
+        base_fares = set(Fare.objects.values_list('base_fare', flat=True))
+        self.assertEqual(pricing.price_table.cache_info().currsize, len(base_fares) * len(pricing.CLASS_MULTIPLIERS))
+        with self.assertNumQueries(0):
+            topology.get()
+
+    @override_settings(TOPOLOGY_VERSION_CHECK_SECONDS=0)
+    def test_snapshot_built_before_the_version_was_lost_is_rebuilt(self):
+        topology.invalidate()  # The version key was lost, e.g. with the cache directory
+        stale = topology.get()
+        topology._built = (stale, 1)  # What another process built before that
+        self.assertIsNot(topology.get(), stale)
+
+    def test_module_hook_leaves_no_connection_open(self):
+        with self.assertLogs('mainApp.warmup', 'WARNING') as logs, \
+                mock.patch.object(settings, 'WARMUP_TEMPLATES', ['mainApp/ticket_detail.html']), \
+                mock.patch.object(warmup.connections, 'close_all') as close_all:
+            warmup.warm_up(close_connections=True)
+        close_all.assert_called_once_with()
+        self.assertIn('mainApp/ticket_detail.html', logs.output[0])
@@ -0,0 +1,79 @@
+"""Sliding-window request throttling per client IP, user or account.
+
+Rules in THROTTLE_RULES are keyed by URL name. Each rule limits one scope:
+'ip' (REMOTE_ADDR), 'user' (the logged-in user) or the name of a POST
+field such as 'username', which throttles guesses against one account from
+any number of addresses.
+
+Counts live in the THROTTLE_CACHE cache in two fixed windows; the sliding
+count is the current window plus the overlapping share of the previous one.
+A checked request costs a get and an add or incr and is turned away in
+process_view, before the view hashes a password or queries the database.
+
+Rules are checked in order and stop at the first one exceeded, so an address
+over its 'ip' limit creates no more per-account counters. THROTTLE_CACHE is
+a cache of its own: every account name tried adds entries, and culling them
+must not evict anything else.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+
+
+def sliding_count(store, key, window, now):
+    """Record one hit and return the sliding-window count including it"""
+    index = int(now // window)
+    current_key = f'{key}:{index}'
+    previous_key = f'{key}:{index - 1}'
+    previous = store.get(previous_key, 0)
+    # Two windows must survive for the previous one to be read back
+    if store.add(current_key, 1, timeout=window * 2):
+        current = 1
+    else:
+        try:
+            current = store.incr(current_key)
+        except ValueError:  # Expired between add() and incr()
+            store.set(current_key, 1, timeout=window * 2)
+            current = 1
+    overlap = 1 - (now % window) / window
+    return current + previous * overlap
+
+
+class ThrottleMiddleware:
+    """Reject requests over the THROTTLE_RULES limits of their URL with 429"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.store = caches[settings.THROTTLE_CACHE]
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        rules = settings.THROTTLE_RULES.get(request.resolver_match.url_name)
+        if not rules:
+            return None
+
+        now = time.time()
+        for rule in rules:
+            if request.method not in rule.get('methods', ('POST',)):
+                continue
+            identity = self.identify(request, rule['scope'])
+            if identity is None:
+                continue
+            key = f'throttle:{request.resolver_match.url_name}:{rule["scope"]}:{identity}'
+            if sliding_count(self.store, key, rule['window'], now) > rule['limit']:
+                response = HttpResponse('Too many requests. Please wait a little and try again.', status=429)
+                response['Retry-After'] = str(int(rule['window'] - now % rule['window']) + 1)
+                return response
+        return None
+
+    def identify(self, request, scope):
+        if scope == 'ip':
+            return request.META.get('REMOTE_ADDR')
+        if scope == 'user':
+            return request.user.pk if request.user.is_authenticated else None
+        value = request.POST.get(scope, '').strip().lower()
+        return value[:150] or None
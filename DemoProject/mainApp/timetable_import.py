@@ -0,0 +1,400 @@
+"""Streaming import of stations, trains, coaches, routes and fares from CSV files.
+
+Files are read row by row and written in chunks: each chunk looks up the
+stations and trains it refers to and the rows it would overwrite by their
+natural keys (station code, train number, plus coach number, stop sequence
+or station pair), then upserts them with one bulk_create and one
+bulk_update in its own transaction. Memory use depends on the chunk size,
+not the file size, and an interrupted import can simply be run again.
+
+Columns are matched by name; GTFS-style names are accepted too (stops.txt
+for stations, trips.txt for trains, stop_times.txt for routes). Invalid
+rows are skipped and reported with their line number.
+"""
+import csv
+from datetime import time
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import OuterRef, Subquery, Sum
+
+from . import autocomplete, inventory, topology
+from .models import Coach, Fare, Station, Train, TrainRoute
+
+TRAIN_TYPES = {value for value, _ in Train._meta.get_field('train_type').choices}
+COACH_TYPES = {value for value, _ in Coach._meta.get_field('coach_type').choices}
+UPDATE_BATCH_SIZE = 500  # bulk_update builds one CASE per field; much larger statements get slow
+MAX_INT = 2 ** 31 - 1  # Largest value of an IntegerField on every database
+
+
+class RowError(ValueError):
+    pass
+
+
+def read_rows(path):
+    """(line number, {column: value}) for every row of a CSV file, with lower-case column names"""
+    with open(path, newline='', encoding='utf-8-sig') as source:
+        reader = csv.reader(source)
+        header = [column.strip().lower() for column in next(reader, [])]
+        for row in reader:
+            if any(value.strip() for value in row):
+                yield reader.line_num, dict(zip(header, (value.strip() for value in row)))
+
+
+def chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _value(row, names, required=True):
+    """First non-empty value among the accepted column names"""
+    for name in names:
+        if row.get(name):
+            return row[name]
+    if required:
+        raise RowError(f'missing {names[0]}')
+    return None
+
+
+def _text(row, names, max_length, required=True):
+    value = _value(row, names, required)
+    if value is not None and len(value) > max_length:
+        raise RowError(f'{names[0]} longer than {max_length} characters')
+    return value
+
+
+def _int(row, names, required=True, minimum=0):
+    value = _value(row, names, required)
+    if value is None:
+        return None
+    try:
+        number = int(float(value))
+    except (ValueError, OverflowError):  # Also nan and inf
+        raise RowError(f'{names[0]} is not a number: {value!r}')
+    if number < minimum:
+        raise RowError(f'{names[0]} must be at least {minimum}')
+    if number > MAX_INT:
+        raise RowError(f'{names[0]} must be at most {MAX_INT}')
+    return number
+
+
+def _decimal(row, names, required=True, max_digits=8):
+    """Amount with two decimal places that fits a DecimalField of max_digits"""
+    value = _value(row, names, required)
+    if value is None:
+        return None
+    try:
+        amount = Decimal(value)
+    except InvalidOperation:
+        raise RowError(f'{names[0]} is not an amount: {value!r}')
+    if not amount.is_finite():  # NaN and Infinity cannot be compared or rounded
+        raise RowError(f'{names[0]} is not an amount: {value!r}')
+    if amount < 0:
+        raise RowError(f'{names[0]} must not be negative')
+    if amount >= 10 ** (max_digits - 2):
+        raise RowError(f'{names[0]} must be less than {10 ** (max_digits - 2)}')
+    return amount.quantize(Decimal('0.01'))
+
+
+def _time(row, names):
+    """HH:MM[:SS]; GTFS hours past midnight (25:10) wrap to the next day"""
+    value = _value(row, names, required=False)
+    if value is None:
+        return None
+    try:
+        parts = [int(part) for part in value.split(':')]
+        return time(parts[0] % 24, parts[1], parts[2] if len(parts) > 2 else 0)
+    except (ValueError, IndexError):
+        raise RowError(f'{names[0]} is not a time: {value!r}')
+
+
+def _choice(row, names, choices, required=True):
+    value = _value(row, names, required)
+    if value is None:
+        return None
+    value = value.upper().replace(' ', '_')
+    if value not in choices:
+        raise RowError(f'unknown {names[0]} {value!r}')
+    return value
+
+
+def _ids(model, field, values):
+    """{natural key: id} for the given codes or train numbers"""
+    return dict(model.objects.filter(**{f'{field}__in': set(values)}).values_list(field, 'id'))
+
+
+class Importer:
+    """One kind of row: how to parse it, find its references and match it to an existing row"""
+    model = None
+    update_fields = []
+    defaults = {}  # For new rows, in place of values the file leaves out
+    nullable = ()  # Fields where an empty value is stored as null instead of keeping the old value
+
+    def parse(self, row):
+        """Field values of a row; foreign keys still as natural keys. Raises RowError
+
+        Optional columns the row leaves empty or the file lacks are None, so
+        they keep the stored value; put what new rows get in defaults.
+        """
+        raise NotImplementedError
+
+    def resolve(self, rows):
+        """Replace natural-key references by ids; returns (rows, errors)"""
+        return rows, []
+
+    def key(self, values):
+        raise NotImplementedError
+
+    def existing(self, keys):
+        """{key: instance} of rows that are already stored"""
+        raise NotImplementedError
+
+    def after_write(self, written):
+        """Hook run in the chunk's transaction with the values written"""
+
+    def write(self, rows):
+        """Upsert a chunk of (line, values); returns (created, changed, errors)"""
+        rows, errors = self.resolve(rows)
+        by_key = {self.key(values): values for _, values in rows}  # A later row wins
+        stored = self.existing(list(by_key))
+        created, updated = [], []
+        for key, values in by_key.items():
+            instance = stored.get(key)
+            if instance is None:
+                created.append(self.model(**{
+                    **self.defaults, **{field: value for field, value in values.items() if value is not None}
+                }))
+            else:
+                changes = {
+                    field: value for field, value in values.items()
+                    if (value is not None or field in self.nullable) and getattr(instance, field) != value
+                }
+                if changes:  # Re-importing an unchanged file writes nothing
+                    for field, value in changes.items():
+                        setattr(instance, field, value)
+                    updated.append(instance)
+        with transaction.atomic():
+            self.model.objects.bulk_create(created, batch_size=UPDATE_BATCH_SIZE)
+            if updated:
+                self.model.objects.bulk_update(updated, self.update_fields, batch_size=UPDATE_BATCH_SIZE)
+            self.after_write(list(by_key.values()))
+        return len(created), len(updated), errors
+
+
+class StationImporter(Importer):
+    model = Station
+    update_fields = ['name', 'city', 'state']
+    defaults = {'city': '', 'state': ''}  # GTFS stops.txt has neither
+
+    def parse(self, row):
+        return {
+            'code': _text(row, ['code', 'stop_code', 'stop_id'], 10).upper(),
+            'name': _text(row, ['name', 'stop_name'], 100),
+            'city': _text(row, ['city'], 50, required=False),
+            'state': _text(row, ['state'], 50, required=False),
+        }
+
+    def key(self, values):
+        return values['code']
+
+    def existing(self, keys):
+        return Station.objects.in_bulk(keys, field_name='code')
+
+
+class TrainImporter(Importer):
+    model = Train
+    update_fields = ['name', 'train_type', 'total_seats']
+    defaults = {'train_type': 'EXPRESS', 'total_seats': 1}  # Seats are set from the coaches once they are imported
+
+    def parse(self, row):
+        return {
+            'train_number': _text(row, ['train_number', 'trip_id'], 10),
+            'name': _text(row, ['name', 'trip_short_name', 'trip_headsign'], 100),
+            'train_type': _choice(row, ['train_type'], TRAIN_TYPES, required=False),
+            'total_seats': _int(row, ['total_seats'], required=False, minimum=1),
+        }
+
+    def key(self, values):
+        return values['train_number']
+
+    def existing(self, keys):
+        return Train.objects.in_bulk(keys, field_name='train_number')
+
+
+class TrainReferenceImporter(Importer):
+    """Rows that belong to a train and may name stations"""
+    station_fields = []
+
+    def resolve(self, rows):
+        trains = _ids(Train, 'train_number', (values['train'] for _, values in rows))
+        stations = _ids(Station, 'code', (values[field] for _, values in rows for field in self.station_fields))
+        resolved, errors = [], []
+        for line, values in rows:
+            if values['train'] not in trains:
+                errors.append((line, f"unknown train {values['train']!r}"))
+                continue
+            missing = [values[field] for field in self.station_fields if values[field] not in stations]
+            if missing:
+                errors.append((line, f'unknown station {missing[0]!r}'))
+                continue
+            values = dict(values, train_id=trains[values.pop('train')])
+            for field in self.station_fields:
+                values[f'{field}_id'] = stations[values.pop(field)]
+            resolved.append((line, values))
+        return resolved, errors
+
+
+class CoachImporter(TrainReferenceImporter):
+    model = Coach
+    update_fields = [
+        'coach_type', 'total_seats', 'total_lower', 'total_middle', 'total_upper',
+        'total_side_lower', 'total_side_upper',
+    ]
+
+    def parse(self, row):
+        return {
+            'train': _text(row, ['train_number'], 10),
+            'coach_number': _text(row, ['coach_number', 'coach'], 10),
+            'coach_type': _choice(row, ['coach_type', 'class'], COACH_TYPES),
+            'total_seats': _int(row, ['total_seats', 'seats'], minimum=1),
+            'total_lower': _int(row, ['lower', 'total_lower'], required=False),
+            'total_middle': _int(row, ['middle', 'total_middle'], required=False),
+            'total_upper': _int(row, ['upper', 'total_upper'], required=False),
+            'total_side_lower': _int(row, ['side_lower', 'total_side_lower'], required=False),
+            'total_side_upper': _int(row, ['side_upper', 'total_side_upper'], required=False),
+        }
+
+    def key(self, values):
+        return values['train_id'], values['coach_number']
+
+    def after_write(self, written):
+        # A train's seat count is the sum of its coaches
+        train_ids = {values['train_id'] for values in written}
+        Train.objects.filter(id__in=train_ids).update(total_seats=Subquery(
+            Coach.objects.filter(train=OuterRef('pk')).values('train').annotate(total=Sum('total_seats')).values('total')
+        ))
+        # Bulk writes send no signals, so resize the seat counters of upcoming runs here
+        for train_id in train_ids:
+            inventory.sync_totals(train_id)
+
+    def existing(self, keys):
+        coaches = Coach.objects.filter(
+            train_id__in={train_id for train_id, _ in keys}, coach_number__in={number for _, number in keys}
+        )
+        return {(coach.train_id, coach.coach_number): coach for coach in coaches}
+
+
+class RouteImporter(TrainReferenceImporter):
+    model = TrainRoute
+    station_fields = ['station']
+    nullable = ('arrival_time', 'departure_time')  # Empty at the first and last stop
+    update_fields = ['station', 'arrival_time', 'departure_time', 'distance_from_source', 'platform_number']
+    defaults = {'distance_from_source': 0, 'platform_number': ''}
+
+    def parse(self, row):
+        return {
+            'train': _text(row, ['train_number', 'trip_id'], 10),
+            'sequence_number': _int(row, ['sequence', 'sequence_number', 'stop_sequence']),
+            'station': _text(row, ['station_code', 'stop_code', 'stop_id'], 10).upper(),
+            'arrival_time': _time(row, ['arrival_time', 'arrival']),
+            'departure_time': _time(row, ['departure_time', 'departure']),
+            'distance_from_source': _int(
+                row, ['distance', 'distance_from_source', 'shape_dist_traveled'], required=False
+            ),
+            'platform_number': _text(row, ['platform', 'platform_number', 'platform_code'], 5, required=False),
+        }
+
+    def key(self, values):
+        return values['train_id'], values['sequence_number']
+
+    def existing(self, keys):
+        stops = TrainRoute.objects.filter(
+            train_id__in={train_id for train_id, _ in keys}, sequence_number__in={number for _, number in keys}
+        )
+        return {(stop.train_id, stop.sequence_number): stop for stop in stops}
+
+
+class FareImporter(TrainReferenceImporter):
+    model = Fare
+    station_fields = ['source_station', 'destination_station']
+    update_fields = ['distance', 'base_fare', 'reservation_charge', 'tatkal_charge']
+    defaults = {'reservation_charge': Decimal('0'), 'tatkal_charge': Decimal('0')}
+
+    def parse(self, row):
+        values = {
+            'train': _text(row, ['train_number'], 10),
+            'source_station': _text(row, ['from_station', 'source_station'], 10).upper(),
+            'destination_station': _text(row, ['to_station', 'destination_station'], 10).upper(),
+            'distance': _int(row, ['distance'], minimum=1),
+            'base_fare': _decimal(row, ['base_fare', 'fare']),
+            'reservation_charge': _decimal(row, ['reservation_charge'], required=False, max_digits=6),
+            'tatkal_charge': _decimal(row, ['tatkal_charge'], required=False, max_digits=6),
+        }
+        if values['source_station'] == values['destination_station']:
+            raise RowError('from_station and to_station are the same')
+        return values
+
+    def key(self, values):
+        return values['train_id'], values['source_station_id'], values['destination_station_id']
+
+    def existing(self, keys):
+        wanted = set(keys)
+        fares = Fare.objects.filter(
+            train_id__in={key[0] for key in keys}, source_station_id__in={key[1] for key in keys}
+        )
+        return {
+            key: fare for fare in fares
+            if (key := (fare.train_id, fare.source_station_id, fare.destination_station_id)) in wanted
+        }
+
+
+# In dependency order, with the file names looked for when importing a directory
+IMPORTERS = {
+    'stations': (StationImporter, ['stations.csv', 'stops.txt']),
+    'trains': (TrainImporter, ['trains.csv', 'trips.txt']),
+    'coaches': (CoachImporter, ['coaches.csv']),
+    'routes': (RouteImporter, ['routes.csv', 'stop_times.txt']),
+    'fares': (FareImporter, ['fares.csv']),
+}
+
+
+def find_files(directory):
+    """[(kind, path)] of the timetable files present in a directory"""
+    found = []
+    for kind, (_, names) in IMPORTERS.items():
+        for name in names:
+            path = Path(directory) / name
+            if path.exists():
+                found.append((kind, path))
+                break
+    return found
+
+
+def import_file(kind, path, chunk_size=None):
+    """Import one file; yields (rows read, created, updated, errors) after each chunk"""
+    importer = IMPORTERS[kind][0]()
+    for chunk in chunks(read_rows(path), chunk_size or settings.TIMETABLE_IMPORT_CHUNK_SIZE):
+        rows, errors = [], []
+        for line, row in chunk:
+            try:
+                rows.append((line, importer.parse(row)))
+            except RowError as error:
+                errors.append((line, str(error)))
+        created, updated, unresolved = importer.write(rows)
+        yield len(chunk), created, updated, errors + unresolved
+
+
+def finish_import(kinds):
+    """Bulk writes send no signals: tell every process that network data changed"""
+    topology.invalidate()
+    for kind in ('stations', 'trains'):
+        if kind in kinds:
+            autocomplete.invalidate(kind)
@@ -0,0 +1,89 @@
+"""Per-process snapshot of the rail network: stations, trains, coaches, routes and fares.
+
+This data changes a few times a year but is read on every booking page, so
+each process keeps it in memory. Like the autocomplete indexes, a version
+number in the shared cache announces changes and is checked at most every
+TOPOLOGY_VERSION_CHECK_SECONDS.
+"""
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+
+from .cache_backends import coordination
+from .fragments import _fresh_version
+from .models import Coach, Fare, Station, Train, TrainRoute
+
+VERSION_KEY = 'topology_version'
+
+
+class Topology:
+    """Everything loaded in five queries"""
+
+    def __init__(self):
+        self.stations = {station.id: station for station in Station.objects.all()}
+        self.trains = {train.id: train for train in Train.objects.all()}
+        self.coaches = defaultdict(list)
+        for coach in Coach.objects.order_by('train_id', 'coach_number'):
+            self.coaches[coach.train_id].append(coach)
+        self.routes = defaultdict(list)
+        for stop in TrainRoute.objects.order_by('train_id', 'sequence_number'):
+            self.routes[stop.train_id].append(stop)
+        self.fares = {
+            (fare.train_id, fare.source_station_id, fare.destination_station_id): fare
+            for fare in Fare.objects.all()
+        }
+
+    def fare(self, train_id, source_station_id, destination_station_id):
+        return self.fares.get((train_id, source_station_id, destination_station_id))
+
+    def train_coaches(self, train_id):
+        return self.coaches.get(train_id, [])
+
+    def route(self, train_id):
+        return self.routes.get(train_id, [])
+
+
+# Per-process state: (snapshot, version it was built from)
+_built = None
+_last_version_check = 0
+
+
+def get():
+    """Current snapshot, rebuilt when another process announced a change"""
+    global _built, _last_version_check
+    now = time.monotonic()
+    if _built is not None and now - _last_version_check < settings.TOPOLOGY_VERSION_CHECK_SECONDS:
+        return _built[0]
+
+    _last_version_check = now
+    version = coordination.get(VERSION_KEY, 0)
+    if _built is None or _built[1] != version:
+        _built = (Topology(), version)
+    return _built[0]
+
+
+def invalidate():
+    """Mark the snapshot stale in this process and every other one"""
+    global _built
+    try:
+        coordination.incr(VERSION_KEY)
+    except ValueError:
+        # Not 1: a snapshot built before the key was lost may carry that version
+        coordination.set(VERSION_KEY, _fresh_version(), timeout=None)
+    _built = None
+
+
+def _changed(sender, **kwargs):
+    invalidate()
+
+
+def connect_signals():
+    """Rebuild the snapshot whenever network data is saved or deleted.
+
+    Bulk operations do not send signals; call invalidate() after them.
+    """
+    for model in (Station, Train, Coach, TrainRoute, Fare):
+        post_save.connect(_changed, sender=model, dispatch_uid=f'topology_{model.__name__}_saved')
+        post_delete.connect(_changed, sender=model, dispatch_uid=f'topology_{model.__name__}_deleted')
@@ -14,15 +14,28 @@ urlpatterns = [
     # Booking flow - ALL require parameters
     path('book/search/', views.select_destinations, name='select_destinations'),
     path('book/schedules/<int:train_id>/<int:from_station_id>/<int:to_station_id>/', views.schedule_list, name='schedule_list'),
+    path('book/calendar/<int:train_id>/<int:from_station_id>/<int:to_station_id>/', views.availability_calendar, name='availability_calendar'),
     path('book/select-schedule/<int:schedule_id>/<int:from_station_id>/<int:to_station_id>/', views.select_schedule, name='select_schedule'),
+    path('book/tatkal/<int:schedule_id>/<int:from_station_id>/<int:to_station_id>/', views.tatkal_waiting_room, name='tatkal_waiting_room'),
     path('book/ticket/<int:schedule_id>/<int:from_station_id>/<int:to_station_id>/', views.book_ticket, name='book_ticket'),
     
     # Ticket management
     path('ticket/<str:pnr>/', views.ticket_detail, name='ticket_detail'),
     path('ticket/<str:pnr>/add-passengers/', views.add_passengers, name='add_passengers'),
     path('ticket/<str:pnr>/cancel/', views.cancel_ticket, name='cancel_ticket'),
+    path('ticket/<str:pnr>/pay/', views.pay_ticket, name='pay_ticket'),
+    path('payments/callback/', views.payment_callback, name='payment_callback'),
     path('check-pnr/', views.check_pnr_status, name='check_pnr_status'),
     
+    # Live updates (Server-Sent Events)
+    path('live/schedules/', views.live_schedules, name='live_schedules'),
+    path('live/seats/<int:schedule_id>/', views.live_seats, name='live_seats'),
+    
+    # Operations
+    path('charts/export/', views.chart_export_date, name='chart_export_date'),
+    path('charts/<int:schedule_id>/export/', views.chart_export, name='chart_export'),
+    
     # Utility
+    path('autocomplete/<str:kind>/', views.autocomplete, name='autocomplete'),
     path('clear-session/', views.clear_ticket_session, name='clear_ticket_session'),
 ]
@@ -1,10 +1,17 @@
+from django.conf import settings
+from django.http import (
+    Http404, HttpResponseBadRequest, HttpResponseForbidden, HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse
+)
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import authenticate, login, logout
+from django.core.handlers.asgi import ASGIRequest
 from django.contrib import messages
 from django.utils.http import urlencode
 from django.urls import reverse
+from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.models import User
-from django.db.models import Q, Sum
+from django.db import transaction
+from django.db.models import F, Q, Sum, prefetch_related_objects
 from datetime import datetime, timedelta
 import json
 from collections import defaultdict
@@ -26,6 +33,13 @@ from .forms import (
     SearchForm
 )
 
+from . import autocomplete as autocomplete_index
+from . import (
+    cache_tier, cancellation, charts, fragments, inventory, live, outbox, payments, pnr_status, pricing, running_status,
+    seat_updates, shared_inventory, tatkal, topology,
+)
+from .idempotency import idempotent, new_key, retryable
+
 # Create your views here.
 def check_login(view_func):
     """Decorator to check if user is logged in"""
@@ -37,6 +51,19 @@ def check_login(view_func):
     return wrapper
 
 
+def check_staff(view_func):
+    """Decorator to restrict operations views to staff users"""
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            messages.warning(request, 'Please login to continue')
+            return redirect('login_page')
+        if not request.user.is_staff:
+            messages.error(request, 'You do not have access to that page')
+            return redirect('main_page')
+        return view_func(request, *args, **kwargs)
+    return wrapper
+
+
 def main_page(request):
     """Main landing page"""
     return render(request, 'mainApp/home.html')
@@ -169,6 +196,45 @@ def select_destinations(request):
     return render(request, 'mainApp/select_destinations.html', {'form': form})
 
 
+def autocomplete(request, kind):
+    """Return stations or trains whose code, number, name or city starts with ?q="""
+    if kind not in autocomplete_index.BUILDERS:
+        return JsonResponse({'error': 'Unknown index'}, status=404)
+    results = autocomplete_index.get_index(kind).search(
+        request.GET.get('q', ''), limit=settings.AUTOCOMPLETE_MAX_RESULTS
+    )
+    return JsonResponse({'results': [{'id': entity_id, 'label': label} for entity_id, label in results]})
+
+
+def _search_schedules(train, journey_date):
+    """Scheduled runs of a train on a date, or over the next 7 days if no date is given"""
+    from datetime import date, timedelta
+    
+    def search():
+        if journey_date:
+            schedules = TrainSchedule.objects.filter(
+                train=train,
+                journey_date=journey_date,
+                status='SCHEDULED'
+            ).select_related('train')
+        else:
+            today = date.today()
+            next_week = today + timedelta(days=7)
+            schedules = TrainSchedule.objects.filter(
+                train=train,
+                journey_date__gte=today,
+                journey_date__lte=next_week,
+                status='SCHEDULED'
+            ).select_related('train').order_by('journey_date')
+        return list(schedules)
+    
+    # Many users search the same train and date, so results go through the
+    # cache tier; seat counts are read separately and are always current
+    return cache_tier.get_or_compute(
+        fragments.schedule_search_key(train.id, journey_date), search, timeout=settings.SCHEDULE_SEARCH_CACHE_SECONDS
+    )
+
+
 @check_login
 def schedule_list(request, train_id, from_station_id, to_station_id):
     """Display available schedules for selected train and route"""
@@ -179,24 +245,18 @@ def schedule_list(request, train_id, from_station_id, to_station_id):
     # Get journey date from query params or session
     journey_date = request.GET.get('date') or request.session.get('journey_date')
     
-    # Filter schedules
-    if journey_date:
-        schedules = TrainSchedule.objects.filter(
-            train=train,
-            journey_date=journey_date,
-            status='SCHEDULED'
-        ).select_related('train')
-    else:
-        # Show next 7 days if no date specified
-        from datetime import date, timedelta
-        today = date.today()
-        next_week = today + timedelta(days=7)
-        schedules = TrainSchedule.objects.filter(
-            train=train,
-            journey_date__gte=today,
-            journey_date__lte=next_week,
-            status='SCHEDULED'
-        ).select_related('train').order_by('journey_date')
+    schedules = _search_schedules(train, journey_date)
+    
+    # Cards are cached per inventory version; only schedules whose card is
+    # missing from the cache need their seat counters, and those are read
+    # from shared memory unless the schedule is not there yet
+    versions = fragments.get_inventory_versions([schedule.id for schedule in schedules])
+    for schedule in schedules:
+        schedule.inventory_version = versions[schedule.id]
+    prefetch_related_objects([
+        schedule for schedule in fragments.uncached_cards(schedules, from_station, to_station)
+        if shared_inventory.read_schedule(schedule.id) is None
+    ], 'inventory')
     
     context = {
         'train': train,
@@ -204,11 +264,62 @@ def schedule_list(request, train_id, from_station_id, to_station_id):
         'to_station': to_station,
         'schedules': schedules,
         'journey_date': journey_date,
+        'card_timeout': settings.SCHEDULE_CARD_CACHE_SECONDS,
+        'live_updates': live.enabled(request),
     }
     
     return render(request, 'mainApp/schedule_list.html', context)
 
 
+@check_login
+def availability_calendar(request, train_id, from_station_id, to_station_id):
+    """Show seat availability per class for the next N days (flexible dates)"""
+    train = get_object_or_404(Train, id=train_id)
+    from_station = get_object_or_404(Station, id=from_station_id)
+    to_station = get_object_or_404(Station, id=to_station_id)
+    
+    try:
+        days = int(request.GET.get('days', 30))
+    except ValueError:
+        days = 30
+    days = max(1, min(days, settings.AVAILABILITY_CALENDAR_MAX_DAYS))
+    
+    calendar = inventory.availability_calendar(train.id, days)
+    
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'train': train.train_number,
+            'classes': calendar['classes'],
+            'dates': [
+                {
+                    'date': row['date'].isoformat(),
+                    'schedule_id': row['schedule_id'],
+                    'available': dict(zip(calendar['classes'], row['available'])),
+                }
+                for row in calendar['rows']
+            ],
+        })
+    
+    CLASS_DISPLAY = {
+        'GENERAL': 'General',
+        'SLEEPER': 'Sleeper',
+        'AC_3_TIER': 'AC 3 Tier',
+        'AC_2_TIER': 'AC 2 Tier',
+        'AC_1_TIER': 'AC 1 Tier',
+        'FIRST_CLASS': 'First Class',
+    }
+    
+    context = {
+        'train': train,
+        'from_station': from_station,
+        'to_station': to_station,
+        'days': days,
+        'classes': [CLASS_DISPLAY.get(cls, cls) for cls in calendar['classes']],
+        'rows': calendar['rows'],
+    }
+    return render(request, 'mainApp/availability_calendar.html', context)
+
+
 @check_login
 def select_schedule(request, schedule_id, from_station_id, to_station_id):
     """Store selected schedule in session and redirect to booking"""
@@ -224,12 +335,22 @@ def select_schedule(request, schedule_id, from_station_id, to_station_id):
 
 
 @check_login
+@idempotent
 def book_ticket(request, schedule_id, from_station_id, to_station_id):
     """Handle ticket booking with passenger details"""
     schedule = get_object_or_404(TrainSchedule, id=schedule_id)
     from_station = get_object_or_404(Station, id=from_station_id)
     to_station = get_object_or_404(Station, id=to_station_id)
     
+    if schedule.status == 'CANCELLED':
+        messages.error(request, 'This train run has been cancelled')
+        return redirect('select_destinations')
+    
+    # During the tatkal rush only users admitted through the waiting room may book
+    is_tatkal = tatkal.is_tatkal_open(schedule)
+    if is_tatkal and not tatkal.is_admitted(request, schedule):
+        return redirect('tatkal_waiting_room', schedule_id, from_station_id, to_station_id)
+    
     if request.method == 'POST':
         # Get form data
         name = request.POST.get('name', '').strip()
@@ -271,90 +392,102 @@ def book_ticket(request, schedule_id, from_station_id, to_station_id):
                 messages.error(request, f'No coach available for {seat_class} class')
                 return redirect('book_ticket', schedule_id, from_station_id, to_station_id)
             
-            # Check if coach has available seats
-            if coach.available_seats <= 0:
+            # Check if coach has available seats on this schedule
+            if seat_updates.coach_availability(schedule.id, schedule.train_id).get(coach.id, 0) <= 0:
                 messages.error(request, f'Coach {coach.coach_number} is fully booked. Please select another coach.')
                 return redirect('book_ticket', schedule_id, from_station_id, to_station_id)
             
-            # Calculate fare
-            try:
-                fare_obj = Fare.objects.get(
-                    train=schedule.train,
-                    source_station=from_station,
-                    destination_station=to_station
-                )
-                base_fare = fare_obj.base_fare
-            except Fare.DoesNotExist:
-                base_fare = schedule.base_fare
-            
-            # Class-based fare multipliers
-            class_multipliers = {
-                'GENERAL': Decimal('1.0'),
-                'SLEEPER': Decimal('1.5'),
-                'AC_3_TIER': Decimal('2.0'),
-                'AC_2_TIER': Decimal('3.0'),
-                'AC_1_TIER': Decimal('5.0'),
-                'FIRST_CLASS': Decimal('6.0'),
-            }
-            
-            passenger_fare = base_fare * class_multipliers.get(seat_class, Decimal('1.0'))
-            
-            # Check if adding to existing ticket or creating new
-            current_ticket_id = request.session.get('current_ticket_id')
+            # Charge the fare quoted on the booking page while its lock lasts,
+            # otherwise the current fare for the class's occupancy
+            base_fare, tatkal_charge = pricing.route_fare(schedule, from_station, to_station)
+            passenger_fare = pricing.locked_fare(request, schedule, from_station, to_station, seat_class)
+            if passenger_fare is None:
+                passenger_fare = pricing.quote_class(schedule, seat_class, base_fare)
+            if is_tatkal:
+                passenger_fare += tatkal_charge
             
-            if current_ticket_id:
-                # Adding passenger to existing ticket
-                ticket = get_object_or_404(Ticket, id=current_ticket_id, booking_status='CONFIRMED')
-                # Update total fare
-                ticket.total_fare += passenger_fare
-                ticket.save()
-            else:
-                # Create new ticket
-                ticket = Ticket.objects.create(
-                    schedule=schedule,
-                    passenger_name=name,
-                    email=email,
+            with transaction.atomic():
+                # Check if adding to existing ticket or creating new
+                current_ticket_id = request.session.get('current_ticket_id')
+                ticket = None
+                if current_ticket_id:
+                    # Passengers can only join a ticket that has not been paid for yet;
+                    # the row lock keeps start_payment from reading the fare meanwhile
+                    ticket = get_object_or_404(
+                        Ticket.objects.select_for_update(), id=current_ticket_id, booking_status='PENDING'
+                    )
+                    if Payment.objects.filter(ticket=ticket, status__in=['PENDING', 'SUCCESS']).exists():
+                        request.session.pop('current_ticket_id', None)
+                        messages.error(request, 'Passengers cannot be added once payment has started')
+                        return redirect('ticket_detail', pnr=ticket.pnr)
+                
+                # Take the seat from the class counter before writing anything else;
+                # this fails without side effects when the class is full
+                if not inventory.reserve_seats(ticket.schedule if ticket else schedule, seat_class):
+                    messages.error(request, f'No {seat_class} seats left on this train. Please select another class.')
+                    return redirect('book_ticket', schedule_id, from_station_id, to_station_id)
+                
+                is_new_ticket = ticket is None
+                if ticket:
+                    # Adding passenger to existing ticket
+                    # Update total fare
+                    Ticket.objects.filter(pk=ticket.pk).update(total_fare=F('total_fare') + passenger_fare)
+                else:
+                    # Create new ticket
+                    ticket = Ticket.objects.create(
+                        schedule=schedule,
+                        passenger_name=name,
+                        email=email,
+                        seat_class=seat_class,
+                        source_station=from_station,
+                        destination_station=to_station,
+                        booking_status='PENDING',  # Confirmed once the payment succeeds
+                        total_fare=passenger_fare
+                    )
+                    request.session['current_ticket_id'] = ticket.id
+                
+                # Create passenger with calculated fare
+                passenger = Passenger(
+                    ticket=ticket,
+                    name=name,
+                    age=age,
+                    gender=gender,
                     seat_class=seat_class,
-                    source_station=from_station,
-                    destination_station=to_station,
-                    booking_status='CONFIRMED',
-                    total_fare=passenger_fare
+                    fare=passenger_fare,  # Save the fare
+                    coach=coach,
+                    current_status='CONFIRMED'
                 )
-                request.session['current_ticket_id'] = ticket.id
-            
-            # Create passenger with calculated fare
-            passenger = Passenger.objects.create(
-                ticket=ticket,
-                name=name,
-                age=age,
-                gender=gender,
-                seat_class=seat_class,
-                fare=passenger_fare,  # Save the fare
-                coach=coach,
-                current_status='CONFIRMED'
-            )
-            
-            # Assign seat based on berth preference
-            passenger.save(berth_preference=berth_preference)
+                
+                # Assign seat based on berth preference
+                passenger.save(berth_preference=berth_preference or None)
+                
+                if is_new_ticket:
+                    outbox.record('TICKET_BOOKED', ticket, ticket_id=ticket.id, is_tatkal=is_tatkal)
+                outbox.record_passenger_added(ticket, passenger)
+                pnr_status.refresh_on_commit(ticket.pnr)
             
             messages.success(request, f'Passenger {name} added successfully! Seat: {coach.coach_number}-{passenger.seat_number}')
             return redirect('ticket_detail', pnr=ticket.pnr)
             
         except Exception as e:
             messages.error(request, f'Error booking ticket: {str(e)}')
-            return redirect('book_ticket', schedule_id, from_station_id, to_station_id)
+            # Possibly transient (lock timeout, database error): a retry with the same key runs again
+            return retryable(redirect('book_ticket', schedule_id, from_station_id, to_station_id))
     
     # GET request - show booking form
     # Get available coaches grouped by class
     coaches_by_class = defaultdict(list)
     available_classes = set()
     
-    for coach in schedule.train.coaches.all():
+    # Read the live sequence first: the page then follows changes from this point on
+    live_since = live.current_sequence()
+    coach_available = seat_updates.coach_availability(schedule.id, schedule.train_id)
+    for coach in topology.get().train_coaches(schedule.train_id):
         available_classes.add(coach.coach_type)
         coaches_by_class[coach.coach_type].append({
             'id': coach.id,
             'number': coach.coach_number,
-            'available': coach.available_seats,
+            'available': coach_available[coach.id],
             'total': coach.total_seats,
             'type': coach.get_coach_type_display()
         })
@@ -369,8 +502,13 @@ def book_ticket(request, schedule_id, from_station_id, to_station_id):
         'FIRST_CLASS': 'First Class',
     }
     
+    # Quote every class from its live counters and hold those fares for the booking
+    base_fare, _ = pricing.route_fare(schedule, from_station, to_station)
+    quotes = pricing.quote_schedule(schedule, base_fare)
+    pricing.lock_quotes(request, schedule, from_station, to_station, quotes)
+    
     available_seat_classes = [
-        {'value': cls, 'display': CLASS_DISPLAY.get(cls, cls)}
+        {'value': cls, 'display': CLASS_DISPLAY.get(cls, cls), 'fare': quotes.get(cls)}
         for cls in available_classes
     ]
     
@@ -379,23 +517,63 @@ def book_ticket(request, schedule_id, from_station_id, to_station_id):
         'from_station': from_station,
         'to_station': to_station,
         'coaches_by_class': json.dumps(dict(coaches_by_class)),
+        'live_since': live_since,
+        'live_updates': live.enabled(request),
         'available_seat_classes': available_seat_classes,
+        'is_tatkal': is_tatkal,
+        'price_lock_minutes': settings.PRICE_LOCK_SECONDS // 60,
+        'idempotency_key': new_key(),
     }
     
     return render(request, 'mainApp/book_ticket.html', context)
 
 
+@check_login
+def tatkal_waiting_room(request, schedule_id, from_station_id, to_station_id):
+    """Hold users in a FIFO queue while the tatkal window is open"""
+    schedule = get_object_or_404(TrainSchedule, id=schedule_id)
+    from_station = get_object_or_404(Station, id=from_station_id)
+    to_station = get_object_or_404(Station, id=to_station_id)
+    
+    if not tatkal.is_tatkal_open(schedule):
+        return redirect('book_ticket', schedule_id, from_station_id, to_station_id)
+    
+    admission = tatkal.join_queue(request, schedule)
+    queue = tatkal.TatkalQueue(schedule.id)
+    wait_seconds = queue.wait_seconds(admission['admit_at'])
+    if wait_seconds <= 0:
+        return redirect('book_ticket', schedule_id, from_station_id, to_station_id)
+    
+    context = {
+        'schedule': schedule,
+        'from_station': from_station,
+        'to_station': to_station,
+        'token': admission['token'],
+        'position': queue.position(admission['admit_at']),
+        'wait_seconds': int(wait_seconds) + 1,
+        # Poll again soon, but never more than once a second
+        'refresh_seconds': max(1, min(int(wait_seconds) + 1, 10)),
+    }
+    return render(request, 'mainApp/tatkal_waiting_room.html', context)
+
+
 @check_login
 def ticket_detail(request, pnr):
-    """Display ticket details"""
-    ticket = get_object_or_404(Ticket, pnr=pnr)
-    return render(request, 'mainApp/ticket_detail.html', {'ticket': ticket})
+    """Display ticket details from the PNR status cache"""
+    status = pnr_status.get(pnr)
+    return render(request, 'mainApp/ticket_detail.html', {
+        'ticket': status, 'is_archived': status['is_archived'], 'live_updates': live.enabled(request),
+    })
 
 
 @check_login
 def add_passengers(request, pnr):
     """Add more passengers to an existing ticket"""
-    ticket = get_object_or_404(Ticket, pnr=pnr, booking_status='CONFIRMED')
+    ticket = get_object_or_404(Ticket, pnr=pnr, booking_status='PENDING')
+    
+    if Payment.objects.filter(ticket=ticket, status__in=['PENDING', 'SUCCESS']).exists():
+        messages.error(request, 'Passengers cannot be added once payment has started')
+        return redirect('ticket_detail', pnr=pnr)
     
     # Set session variables from the ticket
     schedule_id = ticket.schedule.id
@@ -412,6 +590,7 @@ def add_passengers(request, pnr):
 
 
 @check_login
+@idempotent
 def cancel_ticket(request, pnr):
     """Cancel a ticket"""
     ticket = get_object_or_404(Ticket, pnr=pnr)
@@ -421,16 +600,67 @@ def cancel_ticket(request, pnr):
         return redirect('ticket_detail', pnr=pnr)
     
     if request.method == 'POST':
-        ticket.booking_status = 'CANCELLED'
-        ticket.save()
-        
-        # Update all passengers to cancelled
-        ticket.passengers.all().update(current_status='CANCELLED')
+        if not cancellation.cancel_ticket(ticket):
+            messages.warning(request, 'This ticket is already cancelled')
+            return redirect('ticket_detail', pnr=pnr)
         
         messages.success(request, f'Ticket {pnr} has been cancelled successfully')
         return redirect('ticket_detail', pnr=pnr)
     
-    return render(request, 'mainApp/cancel_ticket.html', {'ticket': ticket})
+    return render(request, 'mainApp/cancel_ticket.html', {'ticket': ticket, 'idempotency_key': new_key()})
+
+
+@check_login
+def pay_ticket(request, pnr):
+    """Pay for a pending ticket; the gateway is charged in the background"""
+    ticket = get_object_or_404(Ticket, pnr=pnr)
+    payment = Payment.objects.filter(ticket=ticket).first()
+    
+    if ticket.booking_status != 'PENDING':
+        if payment and payment.status == 'SUCCESS':
+            messages.success(request, f'Payment {payment.transaction_id} received. Your ticket is confirmed.')
+        return redirect('ticket_detail', pnr=pnr)
+    
+    payment_methods = Payment._meta.get_field('payment_method').choices
+    if request.method == 'POST':
+        payment_method = request.POST.get('payment_method')
+        if payment_method not in dict(payment_methods):
+            messages.error(request, 'Please choose a payment method')
+            return redirect('pay_ticket', pnr=pnr)
+        payment = payments.start_payment(ticket, payment_method)
+        if payment is not None and payment.status == 'FAILED':
+            messages.error(request, 'Your last payment is still being checked with the bank. Please try again in a few minutes.')
+        # Later bookings start a new ticket instead of joining this one
+        request.session.pop('current_ticket_id', None)
+        return redirect('pay_ticket', pnr=pnr)
+    
+    context = {
+        'ticket': ticket,
+        'payment': payment,
+        'payment_methods': payment_methods,
+        # Poll while the gateway is working on the charge
+        'refresh_seconds': 2 if payment and payment.status == 'PENDING' else None,
+    }
+    return render(request, 'mainApp/pay_ticket.html', context)
+
+
+@csrf_exempt
+def payment_callback(request):
+    """Gateway callback; must be signed with PAYMENT_CALLBACK_SECRET and is safe to repeat"""
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    if not payments.verify_callback(request.body, request.headers.get('X-Signature')):
+        return HttpResponseForbidden('Bad signature')
+    
+    try:
+        data = json.loads(request.body)
+        payment = payments.handle_callback(data['transaction_id'], data['status'], request.body.decode())
+    except (ValueError, KeyError, TypeError):
+        return HttpResponseBadRequest('Expected JSON with transaction_id and status')
+    
+    if payment is None:
+        return JsonResponse({'error': 'Unknown transaction'}, status=404)
+    return JsonResponse({'transaction_id': payment.transaction_id, 'status': payment.status})
 
 
 @check_login
@@ -444,16 +674,61 @@ def check_pnr_status(request):
             return render(request, 'mainApp/check_pnr.html')
         
         try:
-            ticket = Ticket.objects.get(pnr=pnr)
-            # Redirect to ticket detail page instead of separate PNR status page
-            return redirect('ticket_detail', pnr=pnr)
-        except Ticket.DoesNotExist:
+            status = pnr_status.get(pnr)
+        except Http404:
             messages.error(request, f'No ticket found with PNR: {pnr}')
             return render(request, 'mainApp/check_pnr.html')
+        # Show the ticket right away instead of redirecting to ticket_detail
+        return render(request, 'mainApp/ticket_detail.html', {
+            'ticket': status, 'is_archived': status['is_archived'], 'live_updates': live.enabled(request),
+        })
     
     return render(request, 'mainApp/check_pnr.html')
 
 
+def _event_stream(request, channels):
+    """Server-Sent Events response for channels of mainApp.live.
+    
+    Replays from the Last-Event-ID header of a reconnecting browser, or from
+    ?since=<sequence> given by the page, else starts with each channel's last event.
+    """
+    try:
+        last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('since')
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return HttpResponseBadRequest('Last-Event-ID and ?since= must be numbers')
+    
+    # Async under ASGI so one process can hold thousands of streams
+    if isinstance(request, ASGIRequest):
+        body = live.stream(channels, last_event_id)
+    else:
+        body = live.stream_sync(channels, last_event_id)
+    response = StreamingHttpResponse(body, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Let nginx pass events through at once
+    return response
+
+
+@check_login
+def live_schedules(request):
+    """Running status of the runs given as ?schedule=<id> (repeatable), as Server-Sent Events"""
+    try:
+        schedule_ids = [int(value) for value in request.GET.getlist('schedule')]
+    except ValueError:
+        return HttpResponseBadRequest('Schedule ids must be numbers')
+    if not schedule_ids:
+        return HttpResponseBadRequest('Pass at least one ?schedule=<id>')
+    return _event_stream(
+        request, {running_status.channel(schedule_id) for schedule_id in schedule_ids[:settings.LIVE_MAX_SCHEDULES]}
+    )
+
+
+@check_login
+def live_seats(request, schedule_id):
+    """Changes in per-coach availability of a schedule, as Server-Sent Events"""
+    return _event_stream(request, {seat_updates.channel(schedule_id)})
+
+
 @check_login
 def clear_ticket_session(request):
     """Clear ticket session data"""
@@ -464,3 +739,39 @@ def clear_ticket_session(request):
     messages.success(request, 'Session cleared')
     return redirect('select_destinations')
 
+
+def _chart_response(schedules, chart_format, filename):
+    """Stream a passenger chart as CSV or JSON Lines"""
+    if chart_format not in charts.CHART_FORMATS:
+        return HttpResponseBadRequest('Unknown chart format')
+    response = StreamingHttpResponse(
+        charts.stream_chart(schedules, chart_format),
+        content_type=charts.CHART_FORMATS[chart_format]
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{chart_format}"'
+    return response
+
+
+@check_staff
+def chart_export(request, schedule_id):
+    """Export the passenger chart of one schedule"""
+    schedule = get_object_or_404(TrainSchedule.objects.select_related('train'), id=schedule_id)
+    return _chart_response(
+        TrainSchedule.objects.filter(id=schedule.id),
+        request.GET.get('format', 'csv'),
+        f'chart-{schedule.train.train_number}-{schedule.journey_date}'
+    )
+
+
+@check_staff
+def chart_export_date(request):
+    """Export the passenger charts of every schedule on a date in one file"""
+    try:
+        journey_date = datetime.strptime(request.GET.get('date', ''), '%Y-%m-%d').date()
+    except ValueError:
+        return HttpResponseBadRequest('Pass the journey date as ?date=YYYY-MM-DD')
+    return _chart_response(
+        charts.schedules_for_date(journey_date),
+        request.GET.get('format', 'csv'),
+        f'charts-{journey_date}'
+    )
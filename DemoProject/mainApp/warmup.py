@@ -0,0 +1,85 @@
+"""Warm a worker process up before it takes traffic.
+
+Run with `manage.py warmup`, or set DJANGO_WARMUP=1 to have wsgi.py/asgi.py
+call warm_up() when the worker starts.
+
+wsgi.py/asgi.py close the database connections again afterwards: under
+gunicorn --preload they would be inherited by every forked worker, and under
+ASGI they belong to the import thread rather than the one running sync views.
+There the connection step only checks that the databases answer.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.template.loader import get_template
+from django.test import RequestFactory
+from django.urls import get_resolver
+
+from . import autocomplete, pricing, shared_inventory, topology
+
+logger = logging.getLogger(__name__)
+
+
+def connect_databases():
+    for alias in connections:
+        connections[alias].ensure_connection()
+
+
+def load_urls():
+    get_resolver().url_patterns
+
+
+def render_templates():
+    """Compile every template in WARMUP_TEMPLATES and render it once with an empty context"""
+    request = RequestFactory().get('/')
+    for name in settings.WARMUP_TEMPLATES:
+        template = get_template(name)
+        try:
+            template.render({}, request)
+        except Exception as error:
+            # Some templates need context to render; compiling them is most of the win
+            logger.warning('Warm-up compiled %s but could not render it: %r', name, error)
+
+
+def load_topology():
+    topology.get()
+
+
+def load_autocomplete():
+    for kind in autocomplete.BUILDERS:
+        autocomplete.get_index(kind)
+
+
+def map_shared_inventory():
+    shared_inventory.get_table()
+
+
+def load_price_tables():
+    for fare in topology.get().fares.values():
+        for seat_class in pricing.CLASS_MULTIPLIERS:
+            pricing.price_table(fare.base_fare, seat_class)
+
+
+STEPS = [
+    ('database connections', connect_databases),
+    ('URL resolver', load_urls),
+    ('templates', render_templates),
+    ('stations, trains, coaches, routes and fares', load_topology),
+    ('autocomplete indexes', load_autocomplete),
+    ('price tables', load_price_tables),
+    ('shared seat inventory', map_shared_inventory),
+]
+
+
+def warm_up(close_connections=False):
+    """Run every step; returns [(step, seconds)]"""
+    timings = []
+    for name, step in STEPS:
+        started = time.perf_counter()
+        step()
+        timings.append((name, time.perf_counter() - started))
+    if close_connections:
+        connections.close_all()
+    return timings